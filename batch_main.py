@@ -0,0 +1,298 @@
+import os
+import io
+import glob
+import json
+import time
+import inspect
+import logging
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from main import video2Image, get_output_paths, get_region_paths
+from frame_dealing import VIDEO_FORMATS
+from frame_encoding import get_encoder
+from frame_instrumentation import Instrumentation, add_logging_arguments, capture_logs, setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Same settings as the example in main.py; any key can be overridden per batch or per video,
+# and any other keyword option of video2Image (e.g. workers, fused) can be set as well
+DEFAULT_CONFIG = {
+    'fps': 1,
+    'total_frame_num': 8,
+    'crop_info': ((3, 3), (2, 1)),
+    'rotation_angle': 0,
+    'scaling_factor': 0.95,
+    'scaling_direction': 'top-left',
+    'scaling_steps': None,
+    'in_memory': False,
+    'sparse': False,
+    'collage_options': None,
+    'cache_dir': None,
+    'profile': False,
+    'selection': 'uniform',
+    'dedup_threshold': None,
+    'store': False,
+    'regions': None,
+    # Encoder preset names or dicts of frame_encoding.EncoderConfig arguments
+    'encoder': None,
+    'output_encoder': None,
+    # 'pil' or 'numpy' (frame_batch) for the split and scaling stages
+    'engine': 'pil',
+    # Kernel of the crop-and-resize steps: 'nearest', 'bilinear', 'area' or 'lanczos'
+    'resampling': 'lanczos',
+    # Run the stages concurrently (see video2Image_pipelined)
+    'pipelined': False,
+    # Only extract this window of every video, in seconds (None: from the start / to the end)
+    'start_time': None,
+    'end_time': None,
+    # Cut the crop_info cell out of the frames while decoding
+    'roi': False,
+}
+
+# Config keys passed to video2Image as positional arguments, in order
+POSITIONAL_KEYS = ('fps', 'total_frame_num', 'crop_info', 'rotation_angle', 'scaling_direction', 'scaling_factor')
+# Keyword options of video2Image a config can set; the instrumentation and run report are per job
+VIDEO2IMAGE_OPTIONS = tuple(name for name, parameter in inspect.signature(video2Image).parameters.items()
+                            if parameter.default is not inspect.Parameter.empty
+                            and name not in ('instrumentation', 'report_path'))
+# Keys handled by the batch runner itself
+BATCH_KEYS = ('profile',)
+CONFIG_KEYS = frozenset(POSITIONAL_KEYS + VIDEO2IMAGE_OPTIONS + BATCH_KEYS)
+
+def _to_tuples(value):
+    """
+    Turn nested JSON lists (e.g. crop_info, scaling_steps) back into tuples, also inside
+    dicts (e.g. the background color of collage_options).
+    """
+    if isinstance(value, list):
+        return tuple(_to_tuples(v) for v in value)
+    if isinstance(value, dict):
+        return {k: _to_tuples(v) for k, v in value.items()}
+    return value
+
+def collect_videos(source):
+    """
+    Collect the videos to process and their per-video config overrides.
+    
+    Args:
+        source: A directory (all videos inside it), a glob pattern, a text manifest
+                (one video path per line) or a JSON manifest. A JSON manifest is either
+                a list of entries or {"defaults": {...}, "videos": [...]}, where each
+                entry is a path or a dict with "video_path" plus config overrides.
+                Relative paths in manifests are resolved against the manifest folder.
+    
+    Returns:
+        List of (video_path, overrides) tuples
+    """
+    if os.path.isdir(source):
+        videos = sorted(os.path.join(source, f) for f in os.listdir(source)
+                        if f.lower().endswith(VIDEO_FORMATS))
+        return [(v, {}) for v in videos]
+    
+    if os.path.isfile(source) and not source.lower().endswith(VIDEO_FORMATS):
+        manifest_dir = os.path.dirname(os.path.abspath(source))
+        
+        if source.lower().endswith('.json'):
+            with open(source) as f:
+                manifest = json.load(f)
+            defaults = {}
+            if isinstance(manifest, dict):
+                defaults = manifest.get('defaults', {})
+                manifest = manifest.get('videos', [])
+        else:
+            with open(source) as f:
+                manifest = [line.strip() for line in f
+                            if line.strip() and not line.strip().startswith('#')]
+            defaults = {}
+        
+        videos = []
+        for entry in manifest:
+            if isinstance(entry, str):
+                entry = {'video_path': entry}
+            overrides = dict(defaults)
+            overrides.update({k: v for k, v in entry.items() if k != 'video_path'})
+            videos.append((os.path.join(manifest_dir, entry['video_path']), overrides))
+        return videos
+    
+    # Anything else is treated as a glob pattern (a single video path matches itself)
+    return [(v, {}) for v in sorted(glob.glob(source))]
+
+def build_jobs(videos, shared_config=None):
+    """
+    Merge DEFAULT_CONFIG, the shared config and the per-video overrides into job dicts.
+    
+    Args:
+        videos: Output of collect_videos
+        shared_config: Config applied to every video (default: None)
+    
+    Raises:
+        ValueError: If a config sets a key that is not in CONFIG_KEYS, e.g. a misspelled
+                    option that would otherwise silently run with its default, or if a
+                    video is listed twice, as both jobs would write the same folders
+    """
+    check_config_keys(shared_config or {}, 'the shared config')
+    jobs = []
+    seen = set()
+    for video_path, overrides in videos:
+        if os.path.abspath(video_path) in seen:
+            raise ValueError(f"Video listed more than once: {video_path}")
+        seen.add(os.path.abspath(video_path))
+        check_config_keys(overrides, video_path)
+        config = dict(DEFAULT_CONFIG)
+        config.update(shared_config or {})
+        config.update(overrides)
+        config = {k: _to_tuples(v) for k, v in config.items()}
+        jobs.append({'index': len(jobs), 'video_path': video_path, 'config': config})
+    return jobs
+
+def check_config_keys(config, source):
+    """Raise a ValueError naming the keys of config that are not in CONFIG_KEYS; source names the config."""
+    unknown = sorted(set(config) - CONFIG_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown config keys in {source}: {', '.join(unknown)}. "
+                         f"Valid keys are: {', '.join(sorted(CONFIG_KEYS))}")
+
+def run_video_job(job):
+    """
+    Run video2Image for one job inside a worker process.
+    
+    All output of the job is captured so parallel jobs don't interleave on the console,
+    and any exception is caught so one bad video cannot take down the batch.
+    With the 'profile' config key set, the per-stage timings and counters of the run
+    are added to the result.
+    
+    Returns:
+        Result dict with status, timing and the captured log (or the traceback)
+    """
+    video_path = job['video_path']
+    config = job['config']
+    original_frame_dir, selected_frame_dir, scaled_frame_dir, output_path = get_output_paths(video_path)
+    
+    log = io.StringIO()
+    started_at = time.time()
+    start = time.perf_counter()
+    # Multi-region runs write one collage per view, and the output encoder may change the extension
+    if config['regions']:
+        output_paths = [path for _, path in get_region_paths(None, output_path, len(config['regions']))]
+    else:
+        output_paths = [output_path]
+    output_paths = [get_encoder(config['output_encoder']).output_path(path) for path in output_paths]
+    result = {'index': job['index'], 'video_path': video_path, 'output_path': output_paths[0] if len(output_paths) == 1 else output_paths}
+    instrumentation = Instrumentation(keep_frames=False) if config['profile'] else None
+    try:
+        with capture_logs(log):
+            video2Image(video_path, original_frame_dir, selected_frame_dir, scaled_frame_dir, output_path,
+                        *[config[key] for key in POSITIONAL_KEYS], instrumentation=instrumentation,
+                        **{key: value for key, value in config.items() if key in VIDEO2IMAGE_OPTIONS})
+        # video2Image reports most problems by logging them, so check a fresh collage was written
+        for path in output_paths:
+            if not os.path.exists(path) or os.path.getmtime(path) < started_at - 1:
+                raise RuntimeError("video2Image finished without writing a collage")
+        result['status'] = 'ok'
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = f"{type(e).__name__}: {e}"
+        result['traceback'] = traceback.format_exc()
+    result['seconds'] = time.perf_counter() - start
+    result['log'] = log.getvalue()
+    if instrumentation is not None:
+        profile = instrumentation.report()
+        result['profile'] = {'stages': profile['stages'], 'counters': profile['counters']}
+    return result
+
+def run_batch(jobs, max_workers=None, report_path=None):
+    """
+    Fan video2Image jobs out over a process pool and summarize the results.
+    
+    Args:
+        jobs: Output of build_jobs
+        max_workers: Maximum number of videos processed at once (default: number of CPUs)
+        report_path: If given, write the JSON summary report here
+    
+    Returns:
+        The summary report dict
+    """
+    if not jobs:
+        logger.warning("No videos found to process")
+        return None
+    
+    logger.info(f"Processing {len(jobs)} videos with up to {max_workers or os.cpu_count()} workers")
+    
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_video_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. killed or out of memory)
+                result = {'index': job['index'], 'video_path': job['video_path'], 'status': 'failed',
+                          'error': f"{type(e).__name__}: {e}", 'seconds': None}
+            results.append(result)
+            
+            if result['status'] == 'ok':
+                logger.info(f"Done: {result['video_path']} ({result['seconds']:.1f}s)")
+            else:
+                logger.error(f"Failed: {result['video_path']} - {result['error']}")
+    
+    # Keep the report in input order regardless of completion order
+    results.sort(key=lambda r: r['index'])
+    
+    succeeded = sum(1 for r in results if r['status'] == 'ok')
+    report = {
+        'total': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'wall_seconds': time.perf_counter() - start,
+        'results': results,
+    }
+    
+    logger.info(f"\nBatch completed!")
+    logger.info(f"Successfully processed {succeeded} out of {len(results)} videos in {report['wall_seconds']:.1f}s")
+    for r in results:
+        seconds = f"{r['seconds']:.1f}s" if r['seconds'] is not None else "-"
+        logger.info(f"  {r['status']:>6}  {seconds:>8}  {r['video_path']}")
+    
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report saved to: {report_path}")
+    
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Run video2Image on many videos in parallel')
+    parser.add_argument('source', help='Video directory, glob pattern, or .txt/.json manifest of videos')
+    parser.add_argument('-c', '--config', default=None,
+                       help='JSON file with config shared by all videos (default: settings from main.py)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                       help='Maximum number of videos processed at once (default: number of CPUs)')
+    parser.add_argument('-r', '--report', default='batch_report.json',
+                       help='Output path for the JSON summary report (default: batch_report.json)')
+    
+    add_logging_arguments(parser)
+    
+    args = parser.parse_args()
+    
+    setup_logging(args.log_level)
+    shared_config = None
+    if args.config:
+        with open(args.config) as f:
+            shared_config = json.load(f)
+    
+    try:
+        jobs = build_jobs(collect_videos(args.source), shared_config)
+    except ValueError as e:
+        logger.error(f"Error: {e}")
+        raise SystemExit(1)
+    report = run_batch(jobs, args.workers, args.report)
+    
+    if report is None or report['failed']:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import cv2
+import os
+import logging
+import argparse
+import threading
+import contextlib
+import numpy as np
+from PIL import Image
+from frame_dealing import get_split_box
+from frame_scaling import add_resampling_arguments, cv2_interpolation, get_crop_box
+from frame_transform import TransformPlan, _rotation_matrix, parse_step
+from frame_buffer import Frame, image_array
+from frame_encoding import EncodePool, add_encoder_arguments, encoder_from_args, get_encoder
+from frame_instrumentation import add_logging_arguments, get_instrumentation, save_image, setup_logging
+from frame_store import list_frames, open_frame, open_frame_store
+
+logger = logging.getLogger(__name__)
+
+# Cached gather indices of non-square 90/270 degree rotations, keyed on (width, height, angle)
+_ROTATION_INDICES = {}
+
+def stack_frames(images):
+    """
+    Stack same-sized frames (PIL images or RGB arrays) into one (N, H, W, 3) uint8 array.
+    """
+    return np.stack([image_array(img) if isinstance(img, Image.Image) else img for img in images])
+
+def split_stack(stack, splits):
+    """Keep one grid cell of every frame, as a view (see frame_dealing.get_split_box)."""
+    left, top, right, bottom = get_split_box((stack.shape[2], stack.shape[1]), splits)
+    return stack[:, top:bottom, left:right]
+
+def crop_stack(stack, scale_factor, position):
+    """Crop every frame to a position, as a view (see frame_scaling.get_crop_box)."""
+    left, top, right, bottom = get_crop_box((stack.shape[2], stack.shape[1]), scale_factor, position)
+    return stack[:, top:bottom, left:right]
+
+def _rotation_indices(size, angle):
+    """
+    Gather indices reproducing PIL's Image.rotate(angle) without expand, which samples
+    the nearest source pixel of every output pixel center and fills the rest with black.
+    """
+    key = size + (angle,)
+    if key not in _ROTATION_INDICES:
+        width, height = size
+        a, b, c, d, e, f = _rotation_matrix(size, angle)
+        x = np.arange(width) + 0.5
+        y = np.arange(height)[:, None] + 0.5
+        source_x = np.floor(a * x + b * y + c).astype(np.intp)
+        source_y = np.floor(d * x + e * y + f).astype(np.intp)
+        valid = (source_x >= 0) & (source_x < width) & (source_y >= 0) & (source_y < height)
+        _ROTATION_INDICES[key] = (np.where(valid, source_y, 0), np.where(valid, source_x, 0), valid)
+    return _ROTATION_INDICES[key]
+
+def rotate_stack(stack, rotation_angle):
+    """
+    Rotate every frame counter-clockwise without expanding, exactly like Image.rotate.
+    
+    180 degrees is a flipped view and 90/270 degrees on square frames is np.rot90 (also a
+    view); 90/270 degrees on other frames is one gather over the whole stack. Arbitrary
+    angles fall back to PIL frame by frame.
+    """
+    angle = rotation_angle % 360
+    if angle == 0:
+        return stack
+    if angle == 180:
+        return stack[:, ::-1, ::-1]
+    height, width = stack.shape[1:3]
+    if angle in (90, 270):
+        if width == height:
+            return np.rot90(stack, 1 if angle == 90 else 3, axes=(1, 2))
+        rows, cols, valid = _rotation_indices((width, height), angle)
+        rotated = stack[:, rows, cols]
+        rotated[:, ~valid] = 0
+        return rotated
+    return np.stack([np.asarray(Frame(frame, 'RGB').image().rotate(angle)) for frame in stack])
+
+def resize_stack(stack, size, resampling='lanczos'):
+    """
+    Resize every frame to size (width, height) into one preallocated stack.
+    
+    Args:
+        stack: (N, H, W, 3) uint8 array, may be a view
+        size: Target (width, height)
+        resampling: One of frame_scaling.RESAMPLING_METHODS, mapped to the OpenCV kernel
+                    by frame_scaling.cv2_interpolation (default: 'lanczos', INTER_AREA when
+                    shrinking and INTER_LANCZOS4 otherwise)
+    """
+    height, width = stack.shape[1:3]
+    if (width, height) == tuple(size):
+        return stack
+    interpolation = cv2_interpolation(resampling, size[0] < width and size[1] < height)
+    resized = np.empty((len(stack), size[1], size[0]) + stack.shape[3:], dtype=stack.dtype)
+    for frame, out in zip(stack, resized):
+        # cv2 reads strided crops directly, but not the negative strides of flipped views
+        if frame.strides[0] < 0 or frame.strides[1] < 0:
+            frame = np.ascontiguousarray(frame)
+        cv2.resize(frame, tuple(size), dst=out, interpolation=interpolation)
+    return resized
+
+def apply_plan_to_stack(stack, plan):
+    """
+    Run the steps of a frame_transform.TransformPlan on a stack of same-sized frames.
+    
+    Splits and crops are views, rotations go through rotate_stack and every crop-and-resize
+    or resize step is one resize_stack call, so the only per-frame copies are resamples.
+    Unlike TransformPlan.apply, every resizing step resamples on its own and the kernel is
+    OpenCV's, so results are close to but not bit-identical with the PIL path.
+    
+    Returns:
+        (N, H', W', 3) uint8 array, possibly a view of stack
+    """
+    for kind, params in plan.steps:
+        if kind == 'split':
+            stack = split_stack(stack, params)
+        elif kind == 'rotate':
+            stack = rotate_stack(stack, params)
+        elif kind == 'crop_resize':
+            height, width = stack.shape[1:3]
+            stack = resize_stack(crop_stack(stack, *params), (width, height), plan.resampling)
+        else:
+            stack = resize_stack(stack, params, plan.resampling)
+    return stack
+
+def transform_images(images, plan):
+    """
+    Apply a TransformPlan to a list of PIL images with the batch engine, one stack per
+    run of same-sized images.
+    
+    Returns:
+        List of PIL RGB images in input order
+    """
+    results = []
+    start = 0
+    while start < len(images):
+        end = start + 1
+        while end < len(images) and images[end].size == images[start].size:
+            end += 1
+        stack = apply_plan_to_stack(stack_frames(images[start:end]), plan)
+        results.extend(Frame(frame, 'RGB').image() for frame in stack)
+        start = end
+    return results
+
+def batch_transform_images(input_dir, output_dir, plan, batch_size=32, workers=1, instrumentation=None, encoder=None):
+    """
+    Apply a TransformPlan to all images in a folder with the NumPy batch engine.
+    
+    Images are decoded into stacks of up to batch_size same-sized frames, transformed
+    as a whole (see apply_plan_to_stack) and encoded on a pool of workers threads.
+    
+    Args:
+        input_dir: Input directory containing images
+        output_dir: Output directory for transformed images
+        plan: TransformPlan built with add_* or frame_transform.region_plan
+        batch_size: Maximum number of frames transformed at once (default: 32)
+        workers: Number of images encoded concurrently (default: 1)
+        instrumentation: frame_instrumentation.Instrumentation collecting decode, encode and
+                         io timings per frame and the transform time per batch (default: None)
+        encoder: frame_encoding.EncoderConfig, preset name or dict for the output images
+                 (default: None, format from the file name with library defaults)
+    """
+    instrumentation = get_instrumentation(instrumentation)
+    encoder = get_encoder(encoder)
+    
+    # Create output directory if it doesn't exist
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    # Get all image files (or stored frames) from input directory and sort them
+    store = open_frame_store(input_dir)
+    image_files = list_frames(input_dir, store=store)
+    if store is not None and os.path.abspath(output_dir) == os.path.abspath(input_dir):
+        logger.error(f"Error: Cannot write images into the frame store folder {input_dir} they are read from")
+        return
+    
+    if not image_files:
+        logger.warning(f"No image files found in {input_dir}")
+        return
+    
+    logger.info(f"Found {len(image_files)} image files")
+    logger.info(f"Applying {len(plan.steps)} transform steps in batches of {batch_size}")
+    
+    def flush(names, frames, encode_pool):
+        with instrumentation.timer('batch_transform_images', 'transform'):
+            stack = apply_plan_to_stack(stack_frames(frames), plan)
+        for (filename, frame_context, frame_timer), frame in zip(names, stack):
+            output_path = encoder.output_path(os.path.join(output_dir, filename))
+            encode_pool.submit(encode_one, filename, frame_context, frame_timer, Frame(frame, 'RGB').image(), output_path)
+    
+    def encode_one(filename, frame_context, frame_timer, img, output_path):
+        # Closes the frame timer opened when the file was decoded
+        nonlocal processed_count
+        try:
+            with frame_context:
+                save_image(img, output_path, frame_timer, encoder)
+        except Exception as e:
+            logger.error(f"Error processing {filename}: {str(e)}")
+            return
+        with count_lock:
+            processed_count += 1
+        logger.debug(f"Processed: {filename}")
+    
+    processed_count = 0
+    count_lock = threading.Lock()
+    names, frames = [], []
+    with EncodePool(max(1, workers)) as encode_pool:
+        for filename in image_files:
+            # One frame timer per file, from its decode until encode_one has written it
+            frame_context = contextlib.ExitStack()
+            frame_timer = frame_context.enter_context(instrumentation.frame('batch_transform_images', filename))
+            try:
+                input_path = os.path.join(input_dir, filename)
+                with open_frame(store, input_path, frame_timer) as img:
+                    with frame_timer.timer('decode'):
+                        array = image_array(img)
+            except Exception as e:
+                frame_context.close()
+                logger.error(f"Error processing {filename}: {str(e)}")
+                continue
+            
+            # A batch holds frames of one size only
+            if frames and (len(frames) == batch_size or array.shape != frames[0].shape):
+                flush(names, frames, encode_pool)
+                names, frames = [], []
+            names.append((filename, frame_context, frame_timer))
+            frames.append(array)
+        
+        if frames:
+            flush(names, frames, encode_pool)
+    
+    logger.info(f"\nProcessing completed!")
+    logger.info(f"Successfully processed {processed_count} out of {len(image_files)} images")
+    logger.info(f"Output directory: {output_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Split, rotate and crop/resize images with the NumPy batch engine')
+    parser.add_argument('input_dir', help='Input directory containing images')
+    parser.add_argument('-o', '--output', default='processed_images',
+                       help='Output directory (default: processed_images)')
+    parser.add_argument('steps', nargs='+', type=parse_step,
+                       help='Steps in order, as for frame_transform: "split:h,hi,v,vi", "rotate:angle", "crop:scale,position", "resize:width,height"')
+    parser.add_argument('-b', '--batch-size', type=int, default=32,
+                       help='Maximum number of frames transformed at once (default: 32)')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                       help='Number of images encoded concurrently (default: 1)')
+    add_resampling_arguments(parser)
+    
+    add_encoder_arguments(parser)
+    add_logging_arguments(parser)
+    
+    args = parser.parse_args()
+    
+    setup_logging(args.log_level)
+    plan = TransformPlan(args.resampling)
+    for kind, params in args.steps:
+        if kind == 'split':
+            plan.add_split(params)
+        elif kind == 'rotate':
+            plan.add_rotation(params)
+        elif kind == 'resize':
+            plan.add_resize(params)
+        else:
+            plan.add_crop_resize(*params)
+    
+    batch_transform_images(args.input_dir, args.output, plan, args.batch_size, args.workers, encoder=encoder_from_args(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from frame_cutting import video_to_frames
+from frame_selecting import select_uniform_frames
+from frame_dealing import process_images
+from frame_scaling import crop_and_resize_images, RESAMPLING_METHODS
+from frame_concat import create_collage
+from main import video2Image
+from frame_instrumentation import capture_logs
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def make_synthetic_frame(width, height, index):
+    """Draw a moving gradient with a frame counter, so codecs see real motion and detail."""
+    yy, xx = np.mgrid[0:height, 0:width]
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[..., 0] = (xx + index * 4) % 256
+    frame[..., 1] = (yy + index * 2) % 256
+    frame[..., 2] = ((xx + yy) // 4 + index * 8) % 256
+    cv2.putText(frame, str(index), (width // 3, height // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                max(1, height // 200), (255, 255, 255), max(2, height // 150))
+    return frame
+
+def make_synthetic_video(path, width, height, fps, duration):
+    """
+    Write a synthetic test video with cv2.VideoWriter.
+    
+    Args:
+        path: Output video path (.mp4)
+        width, height: Frame size in pixels
+        fps: Frame rate
+        duration: Length in seconds
+    """
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for index in range(int(round(fps * duration))):
+        writer.write(make_synthetic_frame(width, height, index))
+    writer.release()
+    return path
+
+def make_synthetic_images(output_dir, count, width, height):
+    """Write a folder of synthetic JPEG frames named like video_to_frames output."""
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    for index in range(count):
+        cv2.imwrite(os.path.join(output_dir, f"frame_{index:06d}.jpg"), make_synthetic_frame(width, height, index))
+    return output_dir
+
+def _path_bytes(path):
+    """Total size of a file, or of all files directly inside a directory."""
+    if os.path.isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def _count_images(path):
+    if path is None or not os.path.isdir(path):
+        return 0
+    return sum(1 for f in os.listdir(path) if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+
+def _peak_rss_mb():
+    """Peak resident set size of the current process in MB, or None if unavailable."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+def psnr(a, b):
+    """Peak signal-to-noise ratio of two uint8 images in dB (inf when identical)."""
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+def ssim(a, b):
+    """Mean structural similarity of two uint8 BGR images on their luma, with the usual 11x11 Gaussian window."""
+    a = cv2.cvtColor(a, cv2.COLOR_BGR2GRAY).astype(np.float64)
+    b = cv2.cvtColor(b, cv2.COLOR_BGR2GRAY).astype(np.float64)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    blur = lambda x: cv2.GaussianBlur(x, (11, 11), 1.5)
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a ** 2
+    var_b = blur(b * b) - mu_b ** 2
+    covariance = blur(a * b) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * covariance + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+def compare_quality(output_dir, reference_dir):
+    """
+    Mean PSNR and SSIM of every image in output_dir against the same file in reference_dir.
+    
+    Returns:
+        (psnr, ssim), None for both when there are no images to compare
+    """
+    scores = []
+    for name in sorted(os.listdir(reference_dir)):
+        output_path = os.path.join(output_dir, name)
+        if not name.lower().endswith(('.jpg', '.jpeg', '.png')) or not os.path.exists(output_path):
+            continue
+        output, reference = cv2.imread(output_path), cv2.imread(os.path.join(reference_dir, name))
+        scores.append((psnr(output, reference), ssim(output, reference)))
+    if not scores:
+        return None, None
+    return tuple(float(np.mean(values)) for values in zip(*scores))
+
+def _run_stage(stage, kwargs, input_path, output_path, frames_path):
+    """Run one stage in a fresh worker process and measure it."""
+    stages = {
+        'video_to_frames': video_to_frames,
+        'select_uniform_frames': select_uniform_frames,
+        'process_images': process_images,
+        'crop_and_resize_images': crop_and_resize_images,
+        'create_collage': create_collage,
+        'video2Image': video2Image,
+    }
+    # Only let warnings through the stage loggers; keep console I/O out of the measurement
+    with capture_logs(io.StringIO(), logging.WARNING):
+        start = time.perf_counter()
+        stages[stage](**kwargs)
+        seconds = time.perf_counter() - start
+    
+    frames = _count_images(frames_path)
+    bytes_read = _path_bytes(input_path)
+    bytes_written = _path_bytes(output_path)
+    return {
+        'stage': stage,
+        'seconds': seconds,
+        'frames': frames,
+        'frames_per_s': frames / seconds if seconds > 0 else None,
+        'mb_read': bytes_read / (1024 * 1024),
+        'mb_written': bytes_written / (1024 * 1024),
+        'mb_per_s': bytes_read / (1024 * 1024) / seconds if seconds > 0 else None,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+def measure(stage, kwargs, input_path, output_path, frames_path):
+    """
+    Run a stage in its own spawned process, so peak RSS is measured per stage
+    rather than accumulated over the whole benchmark.
+    """
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(_run_stage, stage, kwargs, input_path, output_path, frames_path).result()
+
+def benchmark_case(work_dir, width, height, fps, duration, image_count=100, target_fps=6, num_frames=8, resampling=()):
+    """
+    Benchmark every stage on one synthetic video and one synthetic image folder.
+    
+    Args:
+        resampling: Resampling methods to compare on crop_and_resize_images, each run is
+                    reported as crop_and_resize_images[method] with the PSNR and SSIM of
+                    its output against the default lanczos output (default: none)
+    
+    Returns:
+        List of result dicts, one per stage
+    """
+    case_dir = os.path.join(work_dir, f"{width}x{height}_{fps}fps_{duration}s")
+    if os.path.exists(case_dir):
+        shutil.rmtree(case_dir)
+    os.makedirs(case_dir)
+    
+    video_path = make_synthetic_video(os.path.join(case_dir, 'video.mp4'), width, height, fps, duration)
+    images_dir = make_synthetic_images(os.path.join(case_dir, 'images'), image_count, width, height)
+    original_dir = os.path.join(case_dir, 'original')
+    selected_dir = os.path.join(case_dir, 'selected')
+    split_dir = os.path.join(case_dir, 'split')
+    scaled_dir = os.path.join(case_dir, 'scaled')
+    splits_config = ((3, 3), (2, 1))
+    
+    runs = [
+        ('video_to_frames', dict(video_path=video_path, output_dir=original_dir, fps=target_fps),
+         video_path, original_dir, original_dir),
+        ('select_uniform_frames', dict(input_dir=original_dir, output_dir=selected_dir, num_frames=num_frames),
+         original_dir, selected_dir, selected_dir),
+        ('process_images', dict(input_dir=images_dir, output_dir=split_dir, splits_config=splits_config, rotation_angle=0),
+         images_dir, split_dir, split_dir),
+        ('crop_and_resize_images', dict(input_dir=images_dir, output_dir=scaled_dir, scale_factor=0.95, position='top-left'),
+         images_dir, scaled_dir, scaled_dir),
+        ('create_collage', dict(input_dir=selected_dir, output_path=os.path.join(case_dir, 'collage.jpg')),
+         selected_dir, os.path.join(case_dir, 'collage.jpg'), selected_dir),
+    ]
+    
+    # End-to-end runs, once per pipeline mode
+    for mode, options in (('disk', {}), ('in_memory', {'in_memory': True}), ('fused', {'in_memory': True, 'fused': True})):
+        mode_dir = os.path.join(case_dir, f"e2e_{mode}")
+        collage_path = os.path.join(case_dir, f"e2e_{mode}.jpg")
+        kwargs = dict(video_path=video_path,
+                      original_frame_dir=os.path.join(mode_dir, 'original_frame_dir'),
+                      selected_frame_dir=os.path.join(mode_dir, 'selected_frame_dir'),
+                      scaled_frame_dir=os.path.join(mode_dir, 'scaled_frame_dir'),
+                      output_path=collage_path, fps=target_fps, total_frame_num=num_frames,
+                      crop_info=splits_config, rotation_angle=0,
+                      scaling_direction='top-left', scaling_factor=0.95, **options)
+        runs.append(('video2Image', kwargs, video_path, collage_path, None))
+    
+    # Quality/speed trade-off of the resampling kernels; the default lanczos output is the reference
+    reference_dir = os.path.join(case_dir, 'resampling_lanczos')
+    for method in sorted(resampling, key=lambda method: method != 'lanczos'):
+        method_dir = os.path.join(case_dir, f"resampling_{method}")
+        runs.append(('crop_and_resize_images', dict(input_dir=images_dir, output_dir=method_dir, scale_factor=0.95,
+                                                    position='top-left', resampling=method),
+                     images_dir, method_dir, method_dir))
+    if resampling and 'lanczos' not in resampling:
+        crop_and_resize_images(images_dir, reference_dir, scale_factor=0.95, position='top-left')
+    
+    results = []
+    for stage, kwargs, input_path, output_path, frames_path in runs:
+        result = measure(stage, kwargs, input_path, output_path, frames_path)
+        if stage == 'video2Image':
+            result['stage'] = f"video2Image[{'fused' if kwargs.get('fused') else 'in_memory' if kwargs.get('in_memory') else 'disk'}]"
+            result['frames'] = num_frames
+            result['frames_per_s'] = num_frames / result['seconds']
+        if 'resampling' in kwargs:
+            result['stage'] = f"crop_and_resize_images[{kwargs['resampling']}]"
+            result['psnr'], result['ssim'] = compare_quality(output_path, reference_dir)
+        result.update({'width': width, 'height': height, 'fps': fps, 'duration': duration})
+        results.append(result)
+        print(f"  {result['stage']:<34} {result['seconds']:8.3f}s {result['frames_per_s'] or 0:9.1f} frames/s "
+              f"{result['mb_per_s'] or 0:8.1f} MB/s  peak RSS {result['peak_rss_mb'] or 0:7.1f} MB"
+              + (f"  PSNR {result['psnr']:6.2f} dB  SSIM {result['ssim']:.4f}" if result.get('ssim') is not None else ''))
+    return results
+
+def compare_results(current, baseline, threshold=0.2):
+    """
+    Compare two benchmark reports stage by stage.
+    
+    Returns:
+        List of (key, baseline_seconds, current_seconds) for stages that got slower
+        by more than threshold (relative)
+    """
+    def index(report):
+        return {(r['stage'], r['width'], r['height'], r['fps'], r['duration']): r for r in report['results']}
+    
+    baseline_index = index(baseline)
+    regressions = []
+    for key, result in index(current).items():
+        if key in baseline_index:
+            before = baseline_index[key]['seconds']
+            if before > 0 and result['seconds'] > before * (1 + threshold):
+                regressions.append((key, before, result['seconds']))
+    return regressions
+
+def run_benchmarks(resolutions, frame_rates, durations, output_path='benchmark_results.json',
+                   work_dir=None, image_count=100, keep=False, resampling=()):
+    """
+    Run all benchmark cases and write the results to JSON.
+    
+    Args:
+        resolutions: List of (width, height) tuples
+        frame_rates: List of source video frame rates
+        durations: List of video durations in seconds
+        output_path: JSON report path (default: benchmark_results.json)
+        work_dir: Where to put synthetic inputs and outputs (default: a temporary directory)
+        image_count: Number of images in each synthetic image folder (default: 100)
+        keep: Keep the synthetic data after the run (default: False)
+        resampling: Resampling methods to compare, see benchmark_case (default: none)
+    """
+    temporary = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix='frame_benchmark_')
+    
+    results = []
+    try:
+        for width, height in resolutions:
+            for fps in frame_rates:
+                for duration in durations:
+                    print(f"Benchmarking {width}x{height} @ {fps} fps, {duration} s")
+                    results.extend(benchmark_case(work_dir, width, height, fps, duration, image_count,
+                                                  resampling=resampling))
+    finally:
+        if temporary and not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'versions': {'opencv': cv2.__version__, 'pillow': Image.__version__, 'numpy': np.__version__},
+        'results': results,
+    }
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to: {output_path}")
+    return report
+
+def _parse_list(value, convert):
+    return [convert(v) for v in value.split(',') if v]
+
+def _parse_resolution(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every pipeline stage on synthetic videos and images')
+    parser.add_argument('-o', '--output', default='benchmark_results.json',
+                       help='Output path for the JSON results (default: benchmark_results.json)')
+    parser.add_argument('-r', '--resolutions', default='640x360,1920x1080',
+                       help='Comma separated WIDTHxHEIGHT list (default: 640x360,1920x1080)')
+    parser.add_argument('-f', '--fps', default='30,60',
+                       help='Comma separated source frame rates (default: 30,60)')
+    parser.add_argument('-d', '--durations', default='5',
+                       help='Comma separated video durations in seconds (default: 5)')
+    parser.add_argument('-n', '--images', type=int, default=100,
+                       help='Number of images in each synthetic image folder (default: 100)')
+    parser.add_argument('--work-dir', default=None,
+                       help='Directory for synthetic data (default: temporary directory)')
+    parser.add_argument('--keep', action='store_true',
+                       help='Keep the synthetic data after the run')
+    parser.add_argument('--compare', default=None,
+                       help='Baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                       help='Relative slowdown reported as a regression (default: 0.2)')
+    parser.add_argument('--resampling', default='',
+                       help=f"Comma separated resampling methods to compare by time, PSNR and SSIM, "
+                            f"e.g. {','.join(RESAMPLING_METHODS)} (default: none)")
+    
+    args = parser.parse_args()
+    
+    report = run_benchmarks(_parse_list(args.resolutions, _parse_resolution),
+                            _parse_list(args.fps, float),
+                            _parse_list(args.durations, float),
+                            args.output, args.work_dir, args.images, args.keep,
+                            _parse_list(args.resampling, str))
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.threshold)
+        for key, before, after in regressions:
+            print(f"Regression: {key[0]} at {key[1]}x{key[2]} {key[3]}fps {key[4]}s: {before:.3f}s -> {after:.3f}s")
+        if regressions:
+            raise SystemExit(1)
+        print("No regressions found")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+from PIL import Image
+
+# Channel orders a Frame can hold; 'BGR' is what OpenCV decodes, 'RGB' what PIL and frame stores use
+FRAME_ORDERS = ('BGR', 'RGB', 'L')
+
+class Frame:
+    """
+    A decoded frame: one uint8 pixel buffer plus its channel order, shared between the
+    OpenCV and PIL sides of the pipeline without converting it up front.
+    
+    bgr() and rgb() are array views of the buffer (a channel-reversed view when the order
+    differs). image() builds the PIL image once, unpacking the buffer straight from its
+    channel order, so BGR frames are never converted into a second array first; 'L'
+    frames share their memory with the PIL image. to_rgb() swaps the channels in place
+    for consumers that need RGB arrays.
+    
+    Args:
+        array: (height, width, 3) uint8 array, or (height, width) for 'L'
+        order: 'BGR', 'RGB' or 'L' (default: 'BGR', as returned by cv2.VideoCapture.read)
+    """
+    def __init__(self, array, order='BGR'):
+        if order not in FRAME_ORDERS:
+            raise ValueError(f"Unknown channel order '{order}'. Valid options are: {', '.join(FRAME_ORDERS)}")
+        self.array = array
+        self.order = order
+        self._image = None
+    
+    @classmethod
+    def from_image(cls, img):
+        """Wrap a PIL image, converting it only when it is neither RGB nor L."""
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        frame = cls(np.asarray(img), img.mode)
+        frame._image = img
+        return frame
+    
+    @property
+    def size(self):
+        """(width, height), like PIL's Image.size."""
+        return self.array.shape[1], self.array.shape[0]
+    
+    def bgr(self):
+        """Pixels in BGR order for OpenCV, a view of the buffer."""
+        if self.order == 'RGB':
+            return self.array[..., ::-1]
+        return self.array
+    
+    def rgb(self):
+        """Pixels in RGB order, a view of the buffer."""
+        if self.order == 'BGR':
+            return self.array[..., ::-1]
+        return self.array
+    
+    def to_rgb(self):
+        """Swap a BGR buffer to RGB in place (no new array), e.g. before storing it."""
+        if self.order == 'BGR':
+            if not self.array.flags.writeable or not self.array.flags.c_contiguous:
+                # Read-only (e.g. a memory map) or strided buffers need a copy of their own
+                self.array = np.array(self.array)
+            cv2.cvtColor(self.array, cv2.COLOR_BGR2RGB, dst=self.array)
+            self.order = 'RGB'
+            self._image = None
+        return self
+    
+    def image(self):
+        """
+        The frame as a PIL image (RGB or L), created on first use.
+        
+        PIL keeps RGB pixels 4 bytes apart, so RGB images hold their own copy, made in
+        one unpack from the buffer's channel order; L images use the buffer itself.
+        """
+        if self._image is None:
+            array = self.array
+            if not array.flags.c_contiguous:
+                array = np.ascontiguousarray(array)
+            mode = 'L' if self.order == 'L' else 'RGB'
+            self._image = Image.frombuffer(mode, self.size, array, 'raw', self.order, 0, 1)
+        return self._image
+
+def to_rgb_image(img):
+    """img as an RGB PIL image, without the copy Image.convert makes when it already is one."""
+    return img if img.mode == 'RGB' else img.convert('RGB')
+
+def image_array(img):
+    """Pixels of a PIL image as an RGB uint8 array, converting the mode only when needed."""
+    return np.asarray(to_rgb_image(img))
@@ -0,0 +1,186 @@
+import os
+import json
+import hashlib
+import logging
+import argparse
+import numpy as np
+from PIL import Image
+from frame_buffer import image_array
+from frame_instrumentation import add_logging_arguments, setup_logging
+
+logger = logging.getLogger(__name__)
+
+def file_fingerprint(path, content_hash=False):
+    """
+    Fingerprint an input file for cache keys.
+    
+    Args:
+        path: Path to the file
+        content_hash: Hash the whole file content instead of using size and
+                      modification time (slower, but survives copies and touches)
+    """
+    if content_hash:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        return 'sha256:' + sha.hexdigest()
+    
+    stat = os.stat(path)
+    return f"stat:{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def stage_key(parent_key, stage, params):
+    """
+    Build the cache key of a stage from the key of its input, the stage name and its parameters.
+    
+    Chaining keys this way means changing a parameter only invalidates that stage
+    and the stages downstream of it.
+    """
+    payload = json.dumps([parent_key, stage, params], sort_keys=True, default=repr)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class StageCache:
+    """
+    Local on-disk cache of in-memory pipeline stage results with size-bounded LRU eviction.
+    
+    Every entry is one uncompressed .npz file holding the frames of a stage as RGB arrays
+    together with their file names, so cached frames are bit-exact and quick to load.
+    The file modification time doubles as the last access time for eviction.
+    """
+    def __init__(self, cache_dir='.frame_cache', max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+    
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+    
+    def get_frames(self, key):
+        """
+        Load the frames stored for key.
+        
+        Returns:
+            List of (filename, PIL RGB image) tuples, or None on a cache miss
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                names = [str(name) for name in data['names']]
+                frames = [(name, Image.fromarray(data[f"frame_{i}"])) for i, name in enumerate(names)]
+            # Mark the entry as recently used
+            os.utime(path)
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return None
+        return frames
+    
+    def put_frames(self, key, frames):
+        """
+        Store (filename, PIL image) pairs under key and evict old entries if the cache is too big.
+        """
+        arrays = {f"frame_{i}": image_array(img) for i, (_, img) in enumerate(frames)}
+        arrays['names'] = np.array([name for name, _ in frames])
+        
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        
+        self.evict()
+    
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.npz') and '.tmp' not in entry.name:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+    
+    def clear(self):
+        """Delete every cache entry."""
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.npz'):
+                os.remove(entry.path)
+
+def run_stages(stages, root_key=None, cache=None):
+    """
+    Run a chain of frame stages, reusing cached results where possible.
+    
+    All stage keys are derived up front from root_key and the stage parameters, so only
+    the output of the last cached stage is loaded, and only the stages after it run.
+    
+    Args:
+        stages: List of (name, params, func) tuples; func takes the frames of the previous
+                stage (None for the first one) and returns a list of (filename, PIL image)
+        root_key: Fingerprint of the pipeline input, e.g. from file_fingerprint
+        cache: StageCache, or None to just run every stage
+    
+    Returns:
+        The frames returned by the last stage
+    """
+    keys = []
+    key = root_key
+    for name, params, _ in stages:
+        key = stage_key(key, name, params)
+        keys.append(key)
+    
+    frames = None
+    start = 0
+    if cache is not None:
+        for index in range(len(stages) - 1, -1, -1):
+            cached = cache.get_frames(keys[index])
+            if cached is not None:
+                logger.info(f"Cache hit for {stages[index][0]} stage ({len(cached)} frames)")
+                frames = cached
+                start = index + 1
+                break
+    
+    for index in range(start, len(stages)):
+        name, _, func = stages[index]
+        frames = func(frames)
+        if cache is not None and frames:
+            cache.put_frames(keys[index], frames)
+            logger.info(f"Cached {name} stage ({len(frames)} frames)")
+        if not frames:
+            break
+    
+    return frames
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or clear the video2Image stage cache')
+    parser.add_argument('cache_dir', nargs='?', default='.frame_cache',
+                       help='Cache directory (default: .frame_cache)')
+    parser.add_argument('--clear', action='store_true',
+                       help='Delete all cache entries')
+    parser.add_argument('--max-mb', type=float, default=None,
+                       help='Evict least recently used entries down to this size in MB')
+    
+    add_logging_arguments(parser)
+    
+    args = parser.parse_args()
+    
+    setup_logging(args.log_level)
+    cache = StageCache(args.cache_dir)
+    if args.clear:
+        cache.clear()
+    elif args.max_mb is not None:
+        cache.max_bytes = int(args.max_mb * 1024 * 1024)
+        cache.evict()
+    
+    entries = [e for e in os.scandir(args.cache_dir) if e.name.endswith('.npz')]
+    total = sum(e.stat().st_size for e in entries)
+    logger.info(f"{len(entries)} cache entries, {total / (1024 * 1024):.1f} MB in {args.cache_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -93,107 +93,264 @@
 
 from PIL import Image
 import os
+import logging
 import argparse
+from frame_encoding import add_encoder_arguments, encoder_from_args, get_encoder
+from frame_instrumentation import FrameTimer, add_logging_arguments, get_instrumentation, save_image, setup_logging
+from frame_index import get_frame_index
+from frame_store import list_frames, open_frame, open_frame_store
 
-def create_collage(input_dir, output_path, direction='horizontal'):
+logger = logging.getLogger(__name__)
+
+def compute_layout(sizes, direction='horizontal', rows=None, cols=None, padding=0,
+                   target_width=None, target_height=None, max_dimension=None):
     """
-    Create a collage by arranging all images from a folder either horizontally or vertically.
+    Calculate the canvas size and the slot of every tile for a strip or grid collage.
+    
+    Tiles fill the grid row by row. Each column is as wide as its widest tile and each
+    row as tall as its tallest tile; smaller tiles are centered in their cell. With the
+    defaults this is exactly the old horizontal/vertical strip.
+    
+    Args:
+        sizes: List of (width, height) tuples in display order
+        direction: 'horizontal' (one row) or 'vertical' (one column), used when neither
+                   rows nor cols is given (default: 'horizontal')
+        rows: Number of grid rows (default: derived from cols or direction)
+        cols: Number of grid columns (default: derived from rows or direction)
+        padding: Gutter in pixels between tiles and around the border (default: 0)
+        target_width: Scale the tiles so the collage is this wide (default: None)
+        target_height: Scale the tiles so the collage is this tall (default: None)
+        max_dimension: Shrink the tiles so neither side of the collage exceeds this (default: None)
+    
+    Returns:
+        ((canvas_width, canvas_height), [(x, y, tile_width, tile_height), ...])
+    """
+    count = len(sizes)
+    if rows is None and cols is None:
+        rows, cols = (1, count) if direction == 'horizontal' else (count, 1)
+    elif rows is None:
+        rows = (count + cols - 1) // cols
+    elif cols is None:
+        cols = (count + rows - 1) // rows
+    if rows * cols < count:
+        raise ValueError(f"A {rows}x{cols} grid cannot hold {count} images")
+    
+    # Natural cell sizes
+    col_widths = [0] * cols
+    row_heights = [0] * rows
+    for i, (width, height) in enumerate(sizes):
+        row, col = divmod(i, cols)
+        col_widths[col] = max(col_widths[col], width)
+        row_heights[row] = max(row_heights[row], height)
+    
+    # Work out one scale factor for all tiles; the padding itself is never scaled
+    content_width = sum(col_widths)
+    content_height = sum(row_heights)
+    padding_width = padding * (cols + 1)
+    padding_height = padding * (rows + 1)
+    
+    scales = []
+    if target_width is not None:
+        scales.append((target_width - padding_width) / content_width)
+    if target_height is not None:
+        scales.append((target_height - padding_height) / content_height)
+    if max_dimension is not None:
+        scales.append(min(1.0, (max_dimension - padding_width) / content_width,
+                          (max_dimension - padding_height) / content_height))
+    scale = min(scales) if scales else 1.0
+    if scale <= 0:
+        raise ValueError("Padding leaves no room for the images at the requested size")
+    
+    # Round cumulative edges rather than each cell, so rounding errors don't add up
+    def edges(lengths):
+        result = [0]
+        total = 0
+        for length in lengths:
+            total += length
+            result.append(int(round(total * scale)))
+        return result
+    
+    x_edges = edges(col_widths)
+    y_edges = edges(row_heights)
+    
+    slots = []
+    for i, (width, height) in enumerate(sizes):
+        row, col = divmod(i, cols)
+        cell_width = x_edges[col + 1] - x_edges[col]
+        cell_height = y_edges[row + 1] - y_edges[row]
+        if scale == 1.0:
+            tile_width, tile_height = width, height
+        else:
+            tile_width = max(1, min(cell_width, int(round(width * scale))))
+            tile_height = max(1, min(cell_height, int(round(height * scale))))
+        x = padding * (col + 1) + x_edges[col] + (cell_width - tile_width) // 2
+        y = padding * (row + 1) + y_edges[row] + (cell_height - tile_height) // 2
+        slots.append((x, y, tile_width, tile_height))
+    
+    canvas_size = (x_edges[-1] + padding_width, y_edges[-1] + padding_height)
+    return canvas_size, slots
+
+def fit_tile(img, size):
+    """
+    Resize an image straight to its slot size with a single resample.
+    
+    JPEG files that have not been decoded yet are first put in draft mode, so the decoder
+    does the bulk of a large downscale cheaply via DCT scaling; reducing_gap then lets PIL
+    use reduce() for the remaining integer factor before the final LANCZOS pass.
+    
+    Args:
+        img: PIL image (freshly opened or already loaded)
+        size: (width, height) of the slot
+    """
+    if img.size != size:
+        img.draft('RGB', size)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if img.size != size:
+        img = img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    return img
+
+def build_collage(images, direction='horizontal', rows=None, cols=None, padding=0, background=(0, 0, 0),
+                  target_width=None, target_height=None, max_dimension=None):
+    """
+    Arrange already loaded images in a strip or grid into a new image.
+    
+    Args:
+        images: List of PIL images in display order
+        direction: Arrangement direction - 'horizontal' or 'vertical' (default: 'horizontal')
+        background: Color of the gutters and empty cells (default: black)
+        rows, cols, padding, target_width, target_height, max_dimension: see compute_layout
+    
+    Returns:
+        The collage as a PIL image
+    """
+    canvas_size, slots = compute_layout([img.size for img in images], direction, rows, cols, padding,
+                                        target_width, target_height, max_dimension)
+    
+    # Create a new blank image with the calculated dimensions
+    collage = Image.new('RGB', canvas_size, background)
+    
+    # Paste each image into the collage
+    for img, (x, y, width, height) in zip(images, slots):
+        collage.paste(fit_tile(img, (width, height)), (x, y))
+    
+    return collage
+
+def create_collage(input_dir, output_path, direction='horizontal', rows=None, cols=None, padding=0,
+                   background=(0, 0, 0), target_width=None, target_height=None, max_dimension=None,
+                   instrumentation=None, encoder=None):
+    """
+    Create a collage by arranging all images from a folder in a strip or grid.
+    
+    The images are streamed in two passes: the first only reads dimensions from the
+    file headers, the second decodes, pastes and closes one image at a time. Peak
+    memory is the canvas plus a single image, and at most one file is open at once.
+    When the collage is scaled, every tile is decoded and resized once, straight to
+    its slot size.
     
     Args:
         input_dir: Input directory containing images
         output_path: Output path for the collage image
         direction: Arrangement direction - 'horizontal' or 'vertical' (default: 'horizontal')
+        background: Color of the gutters and empty cells (default: black)
+        rows, cols, padding, target_width, target_height, max_dimension: see compute_layout
+        instrumentation: frame_instrumentation.Instrumentation collecting io, decode, transform
+                         (resize and paste) and encode timings plus bytes read and written
+                         (default: None)
+        encoder: frame_encoding.EncoderConfig, preset name or dict for the collage; a
+                 configured format replaces the extension of output_path (default: None,
+                 format from output_path)
+    
+    Returns:
+        Path of the saved collage, or None if nothing was saved
     """
-    # Get all image files from input directory
-    supported_formats = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif')
-    image_files = [f for f in os.listdir(input_dir) 
-                  if f.lower().endswith(supported_formats)]
+    instrumentation = get_instrumentation(instrumentation)
+    encoder = get_encoder(encoder)
+    output_path = encoder.output_path(output_path)
     
-    # Sort image files to ensure consistent ordering
-    image_files.sort()
+    # Get all image files (or stored frames) from input directory, sorted to ensure consistent ordering
+    store = open_frame_store(input_dir)
+    image_files = list_frames(input_dir, store=store)
     
     if not image_files:
-        print("No images found to create collage")
+        logger.warning("No images found to create collage")
         return
     
-    print(f"Creating {direction} collage with {len(image_files)} images:")
+    layout_name = f"{rows or '-'}x{cols or '-'} grid" if rows or cols else direction
+    logger.info(f"Creating {layout_name} collage with {len(image_files)} images:")
     for img in image_files:
-        print(f"  - {img}")
-    
-    # Open all images and collect their dimensions
-    images = []
-    widths = []
-    heights = []
-    
-    for filename in image_files:
-        img_path = os.path.join(input_dir, filename)
-        img = Image.open(img_path)
-        images.append(img)
-        widths.append(img.width)
-        heights.append(img.height)
-    
-    if direction == 'horizontal':
-        # Calculate total width and determine max height
-        total_width = sum(widths)
-        max_height = max(heights)
-        
-        # Create a new blank image with the calculated dimensions
-        collage = Image.new('RGB', (total_width, max_height))
-        
-        # Paste each image into the collage
-        x_offset = 0
-        for i, img in enumerate(images):
-            # If image height is less than max height, center it vertically
-            if img.height < max_height:
-                y_offset = (max_height - img.height) // 2
-                collage.paste(img, (x_offset, y_offset))
-            else:
-                collage.paste(img, (x_offset, 0))
-            
-            x_offset += img.width
-            
-    else:  # vertical direction
-        # Calculate total height and determine max width
-        total_height = sum(heights)
-        max_width = max(widths)
-        
-        # Create a new blank image with the calculated dimensions
-        collage = Image.new('RGB', (max_width, total_height))
-        
-        # Paste each image into the collage
-        y_offset = 0
-        for i, img in enumerate(images):
-            # If image width is less than max width, center it horizontally
-            if img.width < max_width:
-                x_offset = (max_width - img.width) // 2
-                collage.paste(img, (x_offset, y_offset))
-            else:
-                collage.paste(img, (0, y_offset))
-            
-            y_offset += img.height
+        logger.debug(f"  - {img}")
     
-    # Save the collage
-    collage.save(output_path)
-    print(f"Collage saved to: {output_path}")
+    # First pass: dimensions from the frame index, which only parses the headers it has not
+    # seen yet (a frame store has the shapes in its index)
+    with instrumentation.timer('create_collage', 'io'):
+        if store is not None:
+            sizes = [tuple(store.entry(filename)['shape'][1::-1]) for filename in image_files]
+        else:
+            sizes = get_frame_index(input_dir).sizes(image_files)
+    
+    try:
+        canvas_size, slots = compute_layout(sizes, direction, rows, cols, padding,
+                                            target_width, target_height, max_dimension)
+    except ValueError as e:
+        logger.error(f"Error: {e}")
+        return
     
-    if direction == 'horizontal':
-        print(f"Final dimensions: {collage.width} x {collage.height}")
-    else:
-        print(f"Final dimensions: {collage.width} x {collage.height}")
+    # Create a new blank image with the calculated dimensions
+    collage = Image.new('RGB', canvas_size, background)
+    
+    # Second pass: decode, paste and release one image at a time
+    for filename, (x, y, width, height) in zip(image_files, slots):
+        with instrumentation.frame('create_collage', filename) as frame_timer, \
+                open_frame(store, os.path.join(input_dir, filename), frame_timer) as img:
+            # Pick the draft size before load() so the decode time includes the DCT scaling
+            if img.size != (width, height):
+                img.draft('RGB', (width, height))
+            with frame_timer.timer('decode'):
+                img.load()
+            with frame_timer.timer('transform'):
+                collage.paste(fit_tile(img, (width, height)), (x, y))
+    
+    # Save the collage
+    save_image(collage, output_path, FrameTimer(instrumentation, 'create_collage', output_path), encoder)
+    logger.info(f"Collage saved to: {output_path}")
+    logger.info(f"Final dimensions: {collage.width} x {collage.height}")
+    return output_path
 
 def main():
-    parser = argparse.ArgumentParser(description='Create a horizontal or vertical collage from all images in a folder')
+    parser = argparse.ArgumentParser(description='Create a strip or grid collage from all images in a folder')
     parser.add_argument('input_dir', help='Input directory containing images')
     parser.add_argument('-o', '--output', default='collage.jpg', 
                        help='Output path for collage image (default: collage.jpg)')
     parser.add_argument('-d', '--direction', choices=['horizontal', 'vertical'], default='horizontal',
                        help='Arrangement direction (default: horizontal)')
+    parser.add_argument('--rows', type=int, default=None,
+                       help='Number of grid rows (default: one strip in --direction)')
+    parser.add_argument('--cols', type=int, default=None,
+                       help='Number of grid columns (default: one strip in --direction)')
+    parser.add_argument('-p', '--padding', type=int, default=0,
+                       help='Gutter in pixels between and around tiles (default: 0)')
+    parser.add_argument('-b', '--background', default='black',
+                       help='Background color, e.g. "white" or "#202020" (default: black)')
+    parser.add_argument('--width', type=int, default=None,
+                       help='Target collage width in pixels (default: natural size)')
+    parser.add_argument('--height', type=int, default=None,
+                       help='Target collage height in pixels (default: natural size)')
+    parser.add_argument('-m', '--max-dimension', type=int, default=None,
+                       help='Maximum collage width and height in pixels (default: no limit)')
+    
+    add_encoder_arguments(parser)
+    add_logging_arguments(parser)
     
     args = parser.parse_args()
     
-    create_collage(args.input_dir, args.output, args.direction)
+    setup_logging(args.log_level)
+    create_collage(args.input_dir, args.output, args.direction, args.rows, args.cols, args.padding,
+                   args.background, args.width, args.height, args.max_dimension, encoder=encoder_from_args(args))
 
 if __name__ == "__main__":
+    setup_logging()
+    
     # Example usage
     input_directory = "input_images"  # Change to your input directory
     output_path = "collage.jpg"
@@ -1,16 +1,68 @@
 import cv2
 import os
+import math
+import time
+import logging
+import contextlib
 import argparse
+import numpy as np
+from PIL import Image
+from frame_selecting import SIGNATURE_SIZE, motion_indices, save_signatures, save_timestamps, uniform_indices
+from frame_buffer import Frame
+from frame_encoding import EncodePool, get_encoder
+from frame_index import note_written
+from frame_instrumentation import get_instrumentation, setup_logging
+from frame_store import FrameStore, remove_frame_store
 
-def video_to_frames(video_path, output_dir, fps=6):
+logger = logging.getLogger(__name__)
+
+# Slack when comparing frame timestamps with sample times; backends often round them to milliseconds
+TIME_TOLERANCE = 1e-3
+
+def video_to_frames(video_path, output_dir, fps=6, num_frames=None, seek_threshold=None, instrumentation=None,
+                    selection='uniform', store=False, encoder=None, encode_workers=0, start_time=None, end_time=None,
+                    start_frame=None, end_frame=None, roi=None):
     """
     Extract frames from video at specified frame rate
     
     Args:
         video_path: path to video file
         output_dir: output directory for frames
-        fps: target frame rate (default: 6fps)
+        fps: target frame rate (default: 6fps); any rate works, also fractional ratios to the
+             source rate or rates above it (see sample_frame_indices). Sample k is the first
+             frame at or after k / fps seconds, taken from the frame timestamps, and is saved
+             as frame_k; the source frame number and timestamp of every saved frame go to
+             frame_selecting.TIMESTAMP_FILE (or the frame store)
+        num_frames: if given, compute the uniformly selected frames up front and
+                    decode only those (targeted mode); file names stay the same as
+                    in a full extraction
+        seek_threshold: in targeted mode, gap (in frames) above which to seek
+                        instead of grab() through the video (default: None, only grab)
+        instrumentation: frame_instrumentation.Instrumentation collecting decode, encode
+                         and io timings plus bytes written (default: None)
+        selection: 'uniform', or a motion-aware method of frame_selecting.motion_indices
+                   ('segments', 'coverage'). In targeted mode this picks the frames to decode
+                   from a cheap signature pass over the video; in full mode the signatures
+                   of all saved frames are written to frame_selecting.SIGNATURE_FILE so
+                   select_frames does not have to decode the frames again
+        store: Write the frames losslessly into a frame_store.FrameStore in output_dir
+               instead of one JPEG file per frame (default: False)
+        encoder: frame_encoding.EncoderConfig, preset name or dict for the frame files, e.g.
+                 'lossless' for PNG intermediates (default: None, JPEG with OpenCV defaults)
+        encode_workers: Encode and write the frames on this many background threads while
+                        the next frames are decoded (default: 0, encode inline)
+        start_time, end_time: Only extract the window between these times in seconds; the
+                              capture seeks straight to the start and stops at the end
+                              (default: None, from the first to the last frame)
+        start_frame, end_frame: The same window as frame numbers, end exclusive; they win
+                                over start_time and end_time. Frames keep the sample numbers
+                                of a full extraction, so a window is a subset of it
+        roi: (left, top, right, bottom) box every frame is cropped to before it is encoded,
+             e.g. the crop_info cell from get_split_box (default: None, whole frames)
     """
+    instrumentation = get_instrumentation(instrumentation)
+    encoder = get_encoder(encoder)
+    
     # Create output directory
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -19,53 +71,479 @@ def video_to_frames(video_path, output_dir, fps=6):
     cap = cv2.VideoCapture(video_path)
     
     if not cap.isOpened():
-        print(f"Error: Cannot open video file {video_path}")
+        logger.error(f"Error: Cannot open video file {video_path}")
         return
     
+    # Frames go either into one store or into separate files; never leave a stale store behind
+    frame_store = FrameStore(output_dir, 'w') if store else None
+    if not store:
+        remove_frame_store(output_dir)
+    
     # Get video information
     original_fps = cap.get(cv2.CAP_PROP_FPS)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     duration = total_frames / original_fps
     
-    print(f"Video Info:")
-    print(f"  Original FPS: {original_fps:.2f}")
-    print(f"  Total frames: {total_frames}")
-    print(f"  Duration: {duration:.2f} seconds")
-    print(f"  Target FPS: {fps}")
+    logger.info(f"Video Info:")
+    logger.info(f"  Original FPS: {original_fps:.2f}")
+    logger.info(f"  Total frames: {total_frames}")
+    logger.info(f"  Duration: {duration:.2f} seconds")
+    logger.info(f"  Target FPS: {fps}")
+    
+    first_frame, last_frame = get_frame_range(total_frames, original_fps, start_time, end_time, start_frame, end_frame)
+    if (first_frame, last_frame) != (0, total_frames):
+        logger.info(f"  Window: frames {first_frame} to {last_frame} "
+                    f"({first_frame / original_fps:.2f}s to {last_frame / original_fps:.2f}s)")
+    if roi is not None:
+        logger.info(f"  Region of interest: {roi}")
+    seek_frame(cap, first_frame)
+    
+    if num_frames is not None:
+        # Targeted mode: only decode the frames that will be kept
+        if selection == 'uniform':
+            targets = get_target_frame_indices(last_frame, original_fps, fps, num_frames, first_frame)
+        else:
+            with instrumentation.timer('video_to_frames', 'signatures'):
+                targets = get_motion_frame_indices(cap, last_frame, original_fps, fps, num_frames, selection, first_frame)
+        sample_indices = {frame_index: sample_index for sample_index, frame_index in targets}
+        logger.info(f"  Targeted extraction of {len(targets)} frames")
+        
+        saved_count = 0
+        names, times = [], []
+        try:
+            with EncodePool(encode_workers) as encode_pool:
+                # The time spent in the generator (grabs, seeks and the read) is the decode time of the frame
+                decode_start = time.perf_counter()
+                for frame_index, frame in read_frames_at(cap, [f for _, f in targets], seek_threshold, first_frame):
+                    timestamp = frame_timestamp(cap, frame_index, original_fps)
+                    frame = crop_to_roi(frame, roi)
+                    output_filename = f"frame_{sample_indices[frame_index]:06d}.jpg"
+                    output_path = encoder.output_path(os.path.join(output_dir, output_filename))
+                    # The frame timer stays open until the encode pool has written the frame
+                    with contextlib.ExitStack() as frame_context:
+                        frame_timer = frame_context.enter_context(instrumentation.frame('video_to_frames', output_filename))
+                        frame_timer.add('decode', time.perf_counter() - decode_start)
+                        if frame_store is not None:
+                            store_frame(frame_store, frame, output_filename, frame_index, timestamp, frame_timer)
+                        else:
+                            encode_pool.submit(close_after, frame_context.pop_all(), write_frame, frame, output_path,
+                                               frame_timer, encoder)
+                    names.append(os.path.basename(output_path))
+                    times.append((frame_index, timestamp))
+                    saved_count += 1
+                    decode_start = time.perf_counter()
+        finally:
+            cap.release()
+        
+        if frame_store is not None:
+            frame_store.close()
+        else:
+            save_timestamps(output_dir, names, times)
+        
+        logger.info(f"\nConversion completed!")
+        logger.info(f"Total frames saved: {saved_count}")
+        logger.info(f"Output directory: {output_dir}")
+        return
     
-    # Calculate frame interval
-    frame_interval = int(original_fps / fps)
+    # Sample k is due at k / fps seconds; a window keeps the numbers of a full extraction
+    next_sample = first_sample_index(first_frame, original_fps, fps)
     
-    frame_count = 0
+    frame_count = first_frame
     saved_count = 0
+    signature_names = []
+    signatures = []
+    names, times = [], []
+    try:
+        with EncodePool(encode_workers) as encode_pool:
+            while frame_count < last_frame:
+                decode_start = time.perf_counter()
+                ret, frame = cap.read()
+                decode_seconds = time.perf_counter() - decode_start
+                
+                if not ret:
+                    break
+                
+                # Save the first frame at or after the time of the next sample
+                timestamp = frame_timestamp(cap, frame_count, original_fps)
+                if timestamp + TIME_TOLERANCE >= next_sample / fps:
+                    # Generate output filename
+                    output_filename = f"frame_{next_sample:06d}.jpg"
+                    output_path = encoder.output_path(os.path.join(output_dir, output_filename))
+                    next_sample = next_sample_index(timestamp, fps)
+                    
+                    # Save frame; the frame timer stays open until the encode pool has written it
+                    with contextlib.ExitStack() as frame_context:
+                        frame_timer = frame_context.enter_context(instrumentation.frame('video_to_frames', output_filename))
+                        frame_timer.add('decode', decode_seconds)
+                        if selection != 'uniform':
+                            # Signatures of the whole frame, as in targeted mode
+                            with frame_timer.timer('signatures'):
+                                signatures.append(frame_signature(frame))
+                            signature_names.append(output_filename)
+                        frame = crop_to_roi(frame, roi)
+                        if frame_store is not None:
+                            store_frame(frame_store, frame, output_filename, frame_count, timestamp, frame_timer)
+                        else:
+                            encode_pool.submit(close_after, frame_context.pop_all(), write_frame, frame, output_path,
+                                               frame_timer, encoder)
+                    names.append(os.path.basename(output_path))
+                    times.append((frame_count, timestamp))
+                    saved_count += 1
+                    
+                    if saved_count % 50 == 0:
+                        logger.debug(f"Saved {saved_count} frames...")
+                else:
+                    # Frames that are skipped still had to be decoded
+                    instrumentation.add_time('video_to_frames', 'decode', decode_seconds)
+                
+                frame_count += 1
+    finally:
+        # Release resources
+        cap.release()
     
+    if frame_store is not None:
+        frame_store.close()
+    else:
+        save_timestamps(output_dir, names, times)
+    
+    if signatures:
+        save_signatures(output_dir, signature_names, signatures)
+    
+    logger.info(f"\nConversion completed!")
+    logger.info(f"Total frames saved: {saved_count}")
+    logger.info(f"Output directory: {output_dir}")
+
+def encode_params(encoder, extension):
+    """
+    cv2.imencode parameters for an EncoderConfig, the OpenCV counterpart of
+    EncoderConfig.save_kwargs. Settings left at None keep the OpenCV defaults.
+    """
+    params = []
+    extension = extension.lower()
+    if extension in ('.jpg', '.jpeg'):
+        if encoder.quality is not None:
+            params += [cv2.IMWRITE_JPEG_QUALITY, encoder.quality]
+        if encoder.optimize:
+            params += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+        if encoder.progressive:
+            params += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+    elif extension == '.png':
+        if encoder.compress_level is not None:
+            params += [cv2.IMWRITE_PNG_COMPRESSION, encoder.compress_level]
+    elif extension == '.webp':
+        # OpenCV writes lossless WebP for qualities above 100
+        if encoder.lossless:
+            params += [cv2.IMWRITE_WEBP_QUALITY, 101]
+        elif encoder.quality is not None:
+            params += [cv2.IMWRITE_WEBP_QUALITY, encoder.quality]
+    return params
+
+def write_frame(frame, output_path, frame_timer, encoder=None):
+    """
+    Save a BGR frame like cv2.imwrite, timing the encoding and the file write separately.
+    
+    Args:
+        frame: BGR frame as returned by cv2.VideoCapture.read
+        output_path: Output path; the extension selects the format
+        frame_timer: frame_instrumentation.FrameTimer receiving encode and io timings
+        encoder: frame_encoding.EncoderConfig with the quality/compression settings
+                 (default: None, OpenCV defaults)
+    """
+    extension = os.path.splitext(output_path)[1]
+    with frame_timer.timer('encode'):
+        ok, buffer = cv2.imencode(extension, frame, encode_params(get_encoder(encoder), extension))
+    if not ok:
+        raise IOError(f"Cannot encode frame for {output_path}")
+    with frame_timer.timer('io'):
+        buffer.tofile(output_path)
+    frame_timer.count('bytes_written', buffer.size)
+    note_written(output_path, (frame.shape[1], frame.shape[0]))
+
+def close_after(frame_context, func, *args):
+    """Call func, then close frame_context, e.g. the frame timer of a frame written on an EncodePool."""
+    with frame_context:
+        func(*args)
+
+def store_frame(frame_store, frame, name, frame_index, timestamp, frame_timer):
+    """
+    Append a BGR frame to a FrameStore as RGB, timing the conversion as encode and the write as io.
+    The frame is swapped to RGB in place, so do not use it as BGR afterwards.
+    """
+    with frame_timer.timer('encode'):
+        rgb = Frame(frame, 'BGR').to_rgb().array
+    with frame_timer.timer('io'):
+        frame_store.append(name, rgb, frame_index, timestamp)
+    frame_timer.count('bytes_written', rgb.nbytes)
+
+def get_target_frame_indices(total_frames, original_fps, fps, num_frames, start_frame=0):
+    """
+    Work out up front which source frames a fps-sampled, uniformly selected extraction keeps.
+    
+    The result is the same set of frames that video_to_frames followed by
+    select_uniform_frames would produce, without decoding anything.
+    
+    Args:
+        total_frames: Frame count reported by the video (CAP_PROP_FRAME_COUNT)
+        original_fps: Frame rate reported by the video (CAP_PROP_FPS)
+        fps: target frame rate used for sampling
+        num_frames: Number of frames to keep
+        start_frame: First frame of the window to select from; total_frames is then the end
+                     of the window (default: 0, see get_frame_range)
+    
+    Returns:
+        List of (sample_index, frame_index) tuples in ascending order
+    """
+    samples = sample_frame_indices(total_frames, original_fps, fps, start_frame)
+    return [samples[index] for index in uniform_indices(len(samples), num_frames)]
+
+def first_sample_index(start_frame, original_fps, fps):
+    """
+    Number of the first sample falling on start_frame or later, so a window numbers its
+    samples like a full extraction; the ones due before fall on the frames before it.
+    """
+    if start_frame <= 0:
+        return 0
+    return next_sample_index((start_frame - 1) / original_fps, fps)
+
+def next_sample_index(timestamp, fps):
+    """Number of the first sample due after a frame at timestamp; the ones due until then all fall on it."""
+    return math.floor((timestamp + TIME_TOLERANCE) * fps) + 1
+
+def sample_frame_indices(total_frames, original_fps, fps, start_frame=0):
+    """
+    Frames an fps-rate extraction of a constant-rate video keeps, computed without decoding.
+    
+    Sample k is the first frame at or after k / fps seconds, so the samples follow the
+    target rate for any ratio to the source rate (e.g. 6 fps from 29.97 fps) instead of
+    drifting with a rounded frame interval. Above the source rate several samples fall on
+    one frame, which is kept once under the first of their numbers.
+    
+    Args:
+        total_frames, original_fps, fps: see get_target_frame_indices
+        start_frame: First frame of the window; total_frames is its end (default: 0)
+    
+    Returns:
+        List of (sample_index, frame_index) tuples in ascending order
+    """
+    samples = []
+    sample_index = first_sample_index(start_frame, original_fps, fps)
     while True:
+        frame_index = max(start_frame, math.ceil((sample_index / fps - TIME_TOLERANCE) * original_fps))
+        if frame_index >= total_frames:
+            return samples
+        samples.append((sample_index, frame_index))
+        sample_index = next_sample_index(frame_index / original_fps, fps)
+
+def frame_timestamp(cap, frame_index, original_fps):
+    """
+    Presentation time in seconds of the frame just read from cap (CAP_PROP_POS_MSEC),
+    or frame_index / original_fps for backends that do not report it.
+    """
+    msec = cap.get(cv2.CAP_PROP_POS_MSEC)
+    if msec <= 0 and frame_index > 0:
+        return frame_index / original_fps
+    return msec / 1000
+
+def get_frame_range(total_frames, original_fps, start_time=None, end_time=None, start_frame=None, end_frame=None):
+    """
+    Frame window of an extraction limited to a time or frame range.
+    
+    Args:
+        total_frames, original_fps: see get_target_frame_indices
+        start_time, end_time: Window in seconds (default: None, the start/end of the video)
+        start_frame, end_frame: Window in frames, end exclusive; these win over the times
+    
+    Returns:
+        (first_frame, end_frame), clamped to the video
+    """
+    if start_frame is None:
+        start_frame = int(round(start_time * original_fps)) if start_time is not None else 0
+    if end_frame is None:
+        end_frame = int(round(end_time * original_fps)) if end_time is not None else total_frames
+    end_frame = min(end_frame, total_frames)
+    return max(0, min(start_frame, end_frame)), end_frame
+
+def seek_frame(cap, frame_index):
+    """
+    Position an opened capture at frame_index, letting the backend jump to the nearest
+    keyframe instead of decoding everything before it. Frame 0 needs no seek.
+    """
+    if frame_index > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+
+def crop_to_roi(frame, roi):
+    """View of the roi (left, top, right, bottom) box of a BGR frame; the frame itself if roi is None."""
+    if roi is None:
+        return frame
+    left, top, right, bottom = roi
+    return frame[top:bottom, left:right]
+
+def get_video_size(video_path):
+    """
+    (width, height) of the decoded frames of a video, or None if it cannot be read.
+    
+    Reads the first frame rather than the stream header, so the size matches the frames
+    after any rotation the backend applies; use it to turn a grid cell into an roi box.
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
         ret, frame = cap.read()
+        return (frame.shape[1], frame.shape[0]) if ret else None
+    finally:
+        cap.release()
+
+def frame_signature(frame, size=SIGNATURE_SIZE):
+    """
+    Motion signature of a BGR frame, the cv2 counterpart of frame_selecting.image_signature.
+    """
+    return cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), size, interpolation=cv2.INTER_AREA)
+
+def get_motion_frame_indices(cap, total_frames, original_fps, fps, num_frames, method='segments', start_frame=0):
+    """
+    Motion-aware counterpart of get_target_frame_indices.
+    
+    Runs one pass over the fps-sampled frames keeping only their signatures, picks
+    num_frames of them with frame_selecting.motion_indices, and rewinds the capture.
+    
+    Args:
+        cap: opened cv2.VideoCapture positioned at start_frame
+        total_frames, original_fps, fps, num_frames, start_frame: see get_target_frame_indices
+        method: Selection method, see frame_selecting.motion_indices (default: 'segments')
+    
+    Returns:
+        List of (sample_index, frame_index) tuples in ascending order
+    """
+    samples = sample_frame_indices(total_frames, original_fps, fps, start_frame)
+    signatures = [frame_signature(frame) for _, frame in read_frames_at(cap, [f for _, f in samples], position=start_frame)]
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    
+    if not signatures:
+        return []
+    return [samples[index] for index in motion_indices(np.stack(signatures), num_frames, method)]
+
+def read_frames_at(cap, frame_indices, seek_threshold=None, position=None):
+    """
+    Decode only the requested frames from an opened video.
+    
+    Frames between targets are skipped with grab(), which demuxes and decodes
+    without the costly retrieve()/color conversion. When the gap to the next
+    target is larger than seek_threshold frames, the capture seeks straight to it
+    instead, letting the backend jump to the nearest keyframe.
+    
+    Args:
+        cap: opened cv2.VideoCapture
+        frame_indices: ascending list of frame numbers to decode
+        seek_threshold: gap (in frames) above which to seek instead of grabbing,
+                        None to never seek
+        position: Frame the capture is positioned at, e.g. after seek_frame
+                  (default: None, asked from the capture)
+    
+    Yields:
+        (frame_index, BGR frame) tuples; stops early if the video ends
+    """
+    if position is None:
+        position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+    for frame_index in frame_indices:
+        if seek_threshold is not None and frame_index - position > seek_threshold:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            position = frame_index
+        
+        while position < frame_index:
+            if not cap.grab():
+                return
+            position += 1
         
+        ret, frame = cap.read()
         if not ret:
-            break
+            return
+        position += 1
+        
+        yield frame_index, frame
+
+def iter_video_frames(video_path, fps=6, num_frames=None, seek_threshold=None, selection='uniform',
+                      instrumentation=None, stage='iter_video_frames', start_time=None, end_time=None, roi=None):
+    """
+    Open a video and decode the frames a targeted extraction keeps, one at a time.
+    
+    Args:
+        video_path: path to video file
+        fps, num_frames, seek_threshold, selection: see video_to_frame_list
+        instrumentation: frame_instrumentation.Instrumentation collecting the time of the
+                         motion signature pass (default: None)
+        stage: Stage name the signature pass is recorded under
+        start_time, end_time, roi: see video_to_frames; frames are views of the roi box
+    
+    Yields:
+        (sample_index, BGR frame) tuples; nothing if the video cannot be opened
+    """
+    instrumentation = get_instrumentation(instrumentation)
+    
+    # Open video file
+    cap = cv2.VideoCapture(video_path)
+    
+    if not cap.isOpened():
+        logger.error(f"Error: Cannot open video file {video_path}")
+        return
+    
+    try:
+        # Get video information
+        original_fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        
+        first_frame, last_frame = get_frame_range(total_frames, original_fps, start_time, end_time)
+        seek_frame(cap, first_frame)
         
-        # Save frame at specified interval
-        if frame_count % frame_interval == 0:
-            # Generate output filename
-            output_filename = f"frame_{saved_count:06d}.jpg"
-            output_path = os.path.join(output_dir, output_filename)
-            
-            # Save frame
-            cv2.imwrite(output_path, frame)
-            saved_count += 1
-            
-            if saved_count % 50 == 0:
-                print(f"Saved {saved_count} frames...")
+        if num_frames is None:
+            num_frames = total_frames
+        if selection == 'uniform':
+            targets = get_target_frame_indices(last_frame, original_fps, fps, num_frames, first_frame)
+        else:
+            with instrumentation.timer(stage, 'signatures'):
+                targets = get_motion_frame_indices(cap, last_frame, original_fps, fps, num_frames, selection, first_frame)
+        sample_indices = {frame_index: sample_index for sample_index, frame_index in targets}
         
-        frame_count += 1
+        for frame_index, frame in read_frames_at(cap, [f for _, f in targets], seek_threshold, first_frame):
+            yield sample_indices[frame_index], crop_to_roi(frame, roi)
+    finally:
+        # Release resources, also when the caller stops early
+        cap.release()
+
+def video_to_frame_list(video_path, fps=6, num_frames=None, seek_threshold=None, instrumentation=None,
+                        selection='uniform', start_time=None, end_time=None, roi=None):
+    """
+    Extract frames from video at specified frame rate and keep them in memory
+    instead of writing them to disk.
     
-    # Release resources
-    cap.release()
+    Args:
+        video_path: path to video file
+        fps: target frame rate (default: 6fps)
+        num_frames: if given, only decode this many frames selected uniformly from
+                    the sampled ones, so the whole clip is never held in memory
+        seek_threshold: see read_frames_at (default: None, only grab)
+        instrumentation: frame_instrumentation.Instrumentation collecting the decode
+                         time of every frame (default: None)
+        selection: How to pick the num_frames frames: 'uniform', or a motion-aware method
+                   of frame_selecting.motion_indices (default: 'uniform')
+        start_time, end_time, roi: Time window and crop box, see video_to_frames
+    
+    Returns:
+        List of (sample_index, PIL RGB image) tuples, where sample_index is the
+        number video_to_frames would use in its frame_%06d.jpg filename
+    """
+    instrumentation = get_instrumentation(instrumentation)
+    
+    frames = []
+    decode_start = time.perf_counter()
+    for sample_index, frame in iter_video_frames(video_path, fps, num_frames, seek_threshold, selection,
+                                                 instrumentation, 'video_to_frame_list', start_time, end_time, roi):
+        with instrumentation.frame('video_to_frame_list', sample_index) as frame_timer:
+            # Unpacked from BGR straight into the PIL image, without an RGB copy in between
+            frames.append((sample_index, Frame(frame, 'BGR').image()))
+            frame_timer.add('decode', time.perf_counter() - decode_start)
+        decode_start = time.perf_counter()
     
-    print(f"\nConversion completed!")
-    print(f"Total frames saved: {saved_count}")
-    print(f"Output directory: {output_dir}")
+    logger.info(f"Decoded {len(frames)} frames from {video_path} into memory")
+    return frames
 
 # # if __name__ == "__main__":
 # #     parser = argparse.ArgumentParser(description='Extract frames from video at 6fps')
@@ -80,6 +558,8 @@ def video_to_frames(video_path, output_dir, fps=6):
 #     video_to_frames(args.video_path, args.output, args.fps)
 
 if __name__ == "__main__":
+    setup_logging()
+    
     # Example usage
     video_path = "C:/Users/pengqh/Downloads/Archive/MP4/25455306.mp4"
     output_dir = "./"
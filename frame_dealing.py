@@ -1,18 +1,34 @@
 from PIL import Image
 import os
+import time
+import queue
+import logging
 import argparse
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from frame_cutting import iter_video_frames
+from frame_buffer import Frame
+from frame_encoding import add_encoder_arguments, encoder_from_args, get_encoder
+from frame_manifest import Manifest
+from frame_instrumentation import add_logging_arguments, get_instrumentation, save_image, setup_logging
+from frame_store import list_frames, open_frame, open_frame_store
 
-def process_images(input_dir, output_dir, splits_config=((2, 2),(1, 1)), rotation_angle=180):
+logger = logging.getLogger(__name__)
+
+VIDEO_FORMATS = ('.mov', '.mp4', '.avi', '.mkv', '.m4v')
+
+# Marks the end of a clip in its prefetch queue
+_END_OF_CLIP = object()
+
+def unpack_splits_config(splits_config):
     """
-    Process all images in a folder: split images into multiple parts both horizontally and vertically, 
-    keep one part, and rotate it by specified angle.
+    Unpack a ((horizontal_splits, horizontal_index), (vertical_splits, vertical_index))
+    configuration with 1-based indices into a validated 0-based tuple.
     
-    Args:
-        input_dir: Input directory containing images
-        output_dir: Output directory for processed images
-        splits_config: Tuple of (horizontal_splits, vertical_splits, horizontal_index, vertical_index)
-                     (default: (2, 2, 1, 1) - split into 2x2, keep bottom-right part)
-        rotation_angle: Rotation angle in degrees (default: 180)
+    Returns:
+        (horizontal_splits, vertical_splits, horizontal_index, vertical_index),
+        or None if the configuration is invalid
     """
     # Unpack splits configuration
     horizontal_splits, horizontal_index= splits_config[0]
@@ -21,106 +37,403 @@ def process_images(input_dir, output_dir, splits_config=((2, 2),(1, 1)), rotatio
     vertical_index-=1
     # Validate parameters
     if horizontal_splits < 1 or vertical_splits < 1:
-        print("Error: Both horizontal_splits and vertical_splits must be at least 1")
-        return
+        logger.error("Error: Both horizontal_splits and vertical_splits must be at least 1")
+        return None
     
     if horizontal_index < 0 or horizontal_index >= horizontal_splits:
-        print(f"Error: horizontal_index must be between 0 and {horizontal_splits-1}")
-        return
+        logger.error(f"Error: horizontal_index must be between 0 and {horizontal_splits-1}")
+        return None
     
     if vertical_index < 0 or vertical_index >= vertical_splits:
-        print(f"Error: vertical_index must be between 0 and {vertical_splits-1}")
+        logger.error(f"Error: vertical_index must be between 0 and {vertical_splits-1}")
+        return None
+    
+    return horizontal_splits, vertical_splits, horizontal_index, vertical_index
+
+def get_split_box(size, splits):
+    """
+    Calculate the crop box of the kept part for an image of the given size.
+    
+    Args:
+        size: (width, height) of the image
+        splits: Tuple returned by unpack_splits_config
+    """
+    width, height = size
+    horizontal_splits, vertical_splits, horizontal_index, vertical_index = splits
+    
+    # Calculate width and height of each split part
+    part_width = width // horizontal_splits
+    part_height = height // vertical_splits
+    
+    # Calculate the coordinates for the part to keep
+    left = horizontal_index * part_width
+    right = (horizontal_index + 1) * part_width if horizontal_index < horizontal_splits - 1 else width
+    
+    top = vertical_index * part_height
+    bottom = (vertical_index + 1) * part_height if vertical_index < vertical_splits - 1 else height
+    
+    return (left, top, right, bottom)
+
+def split_and_rotate_image(img, splits, rotation_angle=180):
+    """
+    Keep one part of a single image and rotate it.
+    
+    Args:
+        img: PIL image
+        splits: Tuple returned by unpack_splits_config
+        rotation_angle: Rotation angle in degrees (default: 180)
+    
+    Returns:
+        The processed PIL image
+    """
+    # Convert to RGB if necessary
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    # Extract the specified part
+    kept_part = img.crop(get_split_box(img.size, splits))
+    
+    # Rotate the kept part
+    return kept_part.rotate(rotation_angle)
+
+def process_images(input_dir, output_dir, splits_config=((2, 2),(1, 1)), rotation_angle=180, workers=1, plan=None, instrumentation=None,
+                   encoder=None, incremental=True, later_params=None):
+    """
+    Process all images in a folder: split images into multiple parts both horizontally and vertically, 
+    keep one part, and rotate it by specified angle.
+    
+    Args:
+        input_dir: Input directory containing images
+        output_dir: Output directory for processed images
+        splits_config: ((horizontal_splits, horizontal_index), (vertical_splits, vertical_index))
+                       with 1-based indices, see unpack_splits_config
+                       (default: ((2, 2), (1, 1)) - split into 2 columns, keep the right one)
+        rotation_angle: Rotation angle in degrees (default: 180)
+        workers: Number of images processed concurrently in a thread pool (default: 1)
+        plan: If a frame_transform.TransformPlan is given, append the split and rotation
+              to it and return it instead of processing any files
+        instrumentation: frame_instrumentation.Instrumentation collecting decode, transform,
+                         encode and io timings plus bytes read and written (default: None)
+        encoder: frame_encoding.EncoderConfig, preset name or dict for the output images
+                 (default: None, format from the file name with library defaults)
+        incremental: Skip images whose output is up to date according to the frame_manifest.Manifest
+                     of output_dir, so reruns only process new or changed inputs and in-place
+                     reruns are idempotent; False reprocesses everything (default: True)
+        later_params: Normalized parameters of the stages applied in place to the files of
+                      output_dir afterwards, e.g. frame_scaling.crop_and_resize_params; lets
+                      a rerun skip files the whole chain is up to date for (default: None)
+    """
+    instrumentation = get_instrumentation(instrumentation)
+    encoder = get_encoder(encoder)
+    
+    # Unpack and validate splits configuration
+    splits = unpack_splits_config(splits_config)
+    if splits is None:
         return
+    horizontal_splits, vertical_splits, horizontal_index, vertical_index = splits
+    
+    if plan is not None:
+        return plan.add_split(splits_config).add_rotation(rotation_angle)
     
     # Create output directory if it doesn't exist
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
-    # Supported image formats
-    supported_formats = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif')
-    
-    # Get all image files from input directory
-    image_files = [f for f in os.listdir(input_dir) 
-                  if f.lower().endswith(supported_formats)]
+    # Get all image files (or stored frames) from input directory and sort them
+    store = open_frame_store(input_dir)
+    image_files = list_frames(input_dir, store=store)
+    if store is not None and os.path.abspath(output_dir) == os.path.abspath(input_dir):
+        logger.error(f"Error: Cannot write images into the frame store folder {input_dir} they are read from")
+        return
     
     if not image_files:
-        print(f"No image files found in {input_dir}")
+        logger.warning(f"No image files found in {input_dir}")
         return
     
-    print(f"Found {len(image_files)} image files")
-    print(f"Splitting each image into {horizontal_splits}x{vertical_splits} parts")
-    print(f"Keeping part at position ({horizontal_index}, {vertical_index}) (0-based)")
-    print(f"Rotation angle: {rotation_angle} degrees")
+    logger.info(f"Found {len(image_files)} image files")
+    logger.info(f"Splitting each image into {horizontal_splits}x{vertical_splits} parts")
+    logger.info(f"Keeping part at position ({horizontal_index}, {vertical_index}) (0-based)")
+    logger.info(f"Rotation angle: {rotation_angle} degrees")
     
-    processed_count = 0
+    manifest = Manifest(output_dir)
+    params = Manifest.normalize({'stage': 'process_images', 'splits_config': splits_config,
+                                 'rotation_angle': rotation_angle, 'encoder': encoder.to_dict()})
+    skipped = []
     
-    for filename in image_files:
+    def process_one(filename):
         try:
-            # Open image
             input_path = os.path.join(input_dir, filename)
-            with Image.open(input_path) as img:
-                # Convert to RGB if necessary
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                width, height = img.size
-                
-                # Calculate width and height of each split part
-                part_width = width // horizontal_splits
-                part_height = height // vertical_splits
-                
-                # Calculate the coordinates for the part to keep
-                left = horizontal_index * part_width
-                right = (horizontal_index + 1) * part_width if horizontal_index < horizontal_splits - 1 else width
+            output_path = encoder.output_path(os.path.join(output_dir, filename))
+            source_key = manifest.source_key(store, input_path)
+            if incremental and manifest.is_current(input_path, output_path, source_key, params, later_params=later_params):
+                skipped.append(filename)
+                return True, f"Up to date: {filename}"
+            
+            # Open image
+            with instrumentation.frame('process_images', filename) as frame_timer, \
+                    open_frame(store, input_path, frame_timer) as img:
+                with frame_timer.timer('decode'):
+                    img.load()
+                with frame_timer.timer('transform'):
+                    processed_img = split_and_rotate_image(img, splits, rotation_angle)
                 
-                top = vertical_index * part_height
-                bottom = (vertical_index + 1) * part_height if vertical_index < vertical_splits - 1 else height
+                # Save processed image
+                save_image(processed_img, output_path, frame_timer, encoder)
+                manifest.record(input_path, output_path, source_key, params)
                 
-                # Extract the specified part
-                kept_part = img.crop((left, top, right, bottom))
+                return True, f"Processed: {filename}"
                 
-                # Rotate the kept part
-                processed_img = kept_part.rotate(rotation_angle)
+        except Exception as e:
+            return False, f"Error processing {filename}: {str(e)}"
+    
+    processed_count = 0
+    
+    # PIL releases the GIL while decoding, rotating and encoding, so threads scale with cores.
+    # map() yields results in input order, so the report stays deterministic.
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for ok, message in executor.map(process_one, image_files):
+            if ok:
+                processed_count += 1
+                logger.debug(message)
+            else:
+                logger.error(message)
+    manifest.close()
+    
+    logger.info(f"\nProcessing completed!")
+    logger.info(f"Successfully processed {processed_count} out of {len(image_files)} images")
+    if skipped:
+        logger.info(f"  {len(skipped)} of them were up to date and skipped")
+    logger.info(f"Output directory: {output_dir}")
+
+def clip_output_dirs(video_paths, output_dir):
+    """
+    One output folder per clip, named after the video file; clips with the same name
+    (e.g. the same episode from several cameras) get the folder of their camera too.
+    
+    Returns:
+        List of folder paths in the order of video_paths
+    """
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in video_paths]
+    names = []
+    for path, stem in zip(video_paths, stems):
+        if stems.count(stem) > 1:
+            stem = f"{os.path.basename(os.path.dirname(os.path.abspath(path)))}_{stem}"
+        names.append(stem)
+    # Still colliding, e.g. the same file given twice: number them
+    return [os.path.join(output_dir, name if names.count(name) == 1 else f"{name}_{i}")
+            for i, name in enumerate(names)]
+
+def read_clip(video_path, frames, stop, fps=6, num_frames=None, seek_threshold=None, selection='uniform',
+              instrumentation=None):
+    """
+    Reader thread body: decode the frames of one clip into a bounded prefetch queue.
+    
+    Every frame is put as (sample_index, BGR frame, decode seconds); the clip ends with
+    _END_OF_CLIP, or with the exception that stopped the reader. put() blocks while the
+    queue is full, which holds the reader back until the transform stage catches up.
+    
+    Args:
+        video_path: path to video file
+        frames: queue.Queue to fill
+        stop: threading.Event set by the consumer to make the reader give up
+        fps, num_frames, seek_threshold, selection: see frame_cutting.iter_video_frames
+        instrumentation: frame_instrumentation.Instrumentation (default: None)
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    try:
+        decode_start = time.perf_counter()
+        for sample_index, frame in iter_video_frames(video_path, fps, num_frames, seek_threshold, selection,
+                                                     instrumentation, 'process_videos'):
+            if not put((sample_index, frame, time.perf_counter() - decode_start)):
+                return
+            decode_start = time.perf_counter()
+    except Exception as e:
+        put(e)
+        return
+    put(_END_OF_CLIP)
+
+def process_videos(video_paths, output_dir, splits_config=((2, 2),(1, 1)), rotation_angle=180, fps=6, num_frames=None,
+                   seek_threshold=None, selection='uniform', readers=2, prefetch=16, workers=1, instrumentation=None,
+                   encoder=None):
+    """
+    Split and rotate the frames of several clips straight from the videos, e.g. all camera
+    streams of one episode or a batch of episodes.
+    
+    A pool of reader threads decodes the clips in the background, each into a bounded
+    prefetch queue, while the frames are split, rotated and encoded by a second pool, so
+    decoding overlaps with transforming and encoding instead of running before it. The
+    clips are consumed in order; with more clips than readers, the next clips are read
+    ahead as soon as a reader is free.
+    
+    Args:
+        video_paths: List of video files
+        output_dir: Output directory; every clip gets its own folder in it (see
+                    clip_output_dirs) holding frame_%06d.jpg files as video_to_frames names them
+        splits_config, rotation_angle: see process_images
+        fps: target frame rate (default: 6fps)
+        num_frames: if given, only decode this many frames per clip, see
+                    frame_cutting.video_to_frame_list (default: None, all sampled frames)
+        seek_threshold: see frame_cutting.read_frames_at (default: None, only grab)
+        selection: 'uniform' or a motion-aware method of frame_selecting.motion_indices
+                   (default: 'uniform')
+        readers: Number of clips decoded concurrently (default: 2)
+        prefetch: Maximum number of decoded frames queued per clip (default: 16)
+        workers: Number of frames transformed and encoded concurrently (default: 1)
+        instrumentation: frame_instrumentation.Instrumentation collecting decode, transform,
+                         encode and io timings plus the time spent waiting on the readers
+                         as queue_wait (default: None)
+        encoder: frame_encoding.EncoderConfig, preset name or dict for the output images
+                 (default: None, format from the file name with library defaults)
+    
+    Returns:
+        List with the number of frames written per clip, or None on error
+    """
+    instrumentation = get_instrumentation(instrumentation)
+    encoder = get_encoder(encoder)
+    
+    # Unpack and validate splits configuration
+    splits = unpack_splits_config(splits_config)
+    if splits is None:
+        return None
+    
+    if not video_paths:
+        logger.warning("No video files given")
+        return []
+    
+    clip_dirs = clip_output_dirs(video_paths, output_dir)
+    for clip_dir in clip_dirs:
+        if not os.path.exists(clip_dir):
+            os.makedirs(clip_dir)
+    
+    logger.info(f"Processing {len(video_paths)} clips with {readers} readers and {workers} workers")
+    
+    def process_one(clip_dir, sample_index, frame, decode_seconds):
+        filename = f"frame_{sample_index:06d}.jpg"
+        try:
+            with instrumentation.frame('process_videos', os.path.join(os.path.basename(clip_dir), filename)) as frame_timer:
+                frame_timer.add('decode', decode_seconds)
+                with frame_timer.timer('transform'):
+                    img = Frame(frame, 'BGR').image()
+                    processed_img = split_and_rotate_image(img, splits, rotation_angle)
+                save_image(processed_img, encoder.output_path(os.path.join(clip_dir, filename)), frame_timer, encoder)
+            return True, f"Processed: {filename}"
+        except Exception as e:
+            return False, f"Error processing {filename}: {str(e)}"
+    
+    frame_queues = [queue.Queue(maxsize=max(1, prefetch)) for _ in video_paths]
+    stop = threading.Event()
+    counts = []
+    
+    with ThreadPoolExecutor(max_workers=max(1, readers)) as reader_pool, \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as worker_pool:
+        try:
+            for video_path, frames in zip(video_paths, frame_queues):
+                reader_pool.submit(read_clip, video_path, frames, stop, fps, num_frames, seek_threshold, selection,
+                                   instrumentation)
+            
+            for video_path, clip_dir, frames in zip(video_paths, clip_dirs, frame_queues):
+                processed_count = 0
+                # Bound the frames in flight in the worker pool too, so memory stays flat
+                pending = collections.deque()
                 
-                # Save processed image
-                output_path = os.path.join(output_dir, filename)
-                processed_img.save(output_path)
+                def collect(future):
+                    nonlocal processed_count
+                    ok, message = future.result()
+                    if ok:
+                        processed_count += 1
+                        logger.debug(message)
+                    else:
+                        logger.error(message)
                 
-                processed_count += 1
-                print(f"Processed: {filename}")
+                while True:
+                    with instrumentation.timer('process_videos', 'queue_wait'):
+                        item = frames.get()
+                    if item is _END_OF_CLIP:
+                        break
+                    if isinstance(item, Exception):
+                        logger.error(f"Error reading {video_path}: {str(item)}")
+                        break
+                    pending.append(worker_pool.submit(process_one, clip_dir, *item))
+                    if len(pending) >= 2 * max(1, workers):
+                        collect(pending.popleft())
                 
-        except Exception as e:
-            print(f"Error processing {filename}: {str(e)}")
+                while pending:
+                    collect(pending.popleft())
+                counts.append(processed_count)
+                logger.info(f"{video_path}: {processed_count} frames written to {clip_dir}")
+        finally:
+            # Unblock the readers if the consumer stops early
+            stop.set()
     
-    print(f"\nProcessing completed!")
-    print(f"Successfully processed {processed_count} out of {len(image_files)} images")
-    print(f"Output directory: {output_dir}")
+    logger.info(f"\nProcessing completed!")
+    logger.info(f"Successfully processed {sum(counts)} frames from {len(video_paths)} clips")
+    logger.info(f"Output directory: {output_dir}")
+    return counts
 
 def parse_splits_config(splits_str):
-    """Parse splits configuration from string format 'h,v,hi,vi' to tuple"""
+    """
+    Parse splits configuration from string format 'h,v,hi,vi' with 0-based indices to the
+    ((h, hi), (v, vi)) configuration with 1-based indices process_images takes
+    """
     try:
         parts = splits_str.split(',')
         if len(parts) != 4:
             raise ValueError("Splits config must have exactly 4 values")
-        return tuple(int(x) for x in parts)
+        horizontal_splits, vertical_splits, horizontal_index, vertical_index = (int(x) for x in parts)
+        return (horizontal_splits, horizontal_index + 1), (vertical_splits, vertical_index + 1)
     except ValueError as e:
         raise argparse.ArgumentTypeError(f"Invalid splits config: {e}")
 
 def main():
     parser = argparse.ArgumentParser(description='Split images into multiple parts both horizontally and vertically, keep one part and rotate it')
-    parser.add_argument('input_dir', help='Input directory containing images')
+    parser.add_argument('inputs', nargs='+',
+                       help='Input directory containing images, or one or more video files to read directly')
     parser.add_argument('-o', '--output', default='processed_images', 
                        help='Output directory (default: processed_images)')
-    parser.add_argument('-s', '--splits', type=parse_splits_config, default=(2, 2, 1, 1),
-                       help='Splits configuration as "horizontal_splits,vertical_splits,horizontal_index,vertical_index" (default: "2,2,1,1")')
+    parser.add_argument('-s', '--splits', type=parse_splits_config, default='2,2,1,1',
+                       help='Splits configuration as "horizontal_splits,vertical_splits,horizontal_index,vertical_index" with 0-based indices (default: "2,2,1,1")')
     parser.add_argument('-r', '--rotation', type=float, default=180, 
                        help='Rotation angle in degrees (default: 180)')
+    parser.add_argument('-w', '--workers', type=int, default=1, 
+                       help='Number of images processed concurrently (default: 1)')
+    parser.add_argument('--fps', type=float, default=6,
+                       help='Target frame rate when reading videos (default: 6)')
+    parser.add_argument('-n', '--num-frames', type=int, default=None,
+                       help='Only decode this many frames per video (default: all sampled frames)')
+    parser.add_argument('--readers', type=int, default=2,
+                       help='Number of videos decoded concurrently (default: 2)')
+    parser.add_argument('--prefetch', type=int, default=16,
+                       help='Maximum number of decoded frames queued per video (default: 16)')
+    
+    parser.add_argument('-f', '--force', action='store_true',
+                       help='Reprocess all images, also those that are up to date')
+    
+    add_encoder_arguments(parser)
+    add_logging_arguments(parser)
     
     args = parser.parse_args()
     
-    process_images(args.input_dir, args.output, args.splits, args.rotation)
+    setup_logging(args.log_level)
+    if all(path.lower().endswith(VIDEO_FORMATS) for path in args.inputs):
+        process_videos(args.inputs, args.output, args.splits, args.rotation, args.fps, args.num_frames,
+                       readers=args.readers, prefetch=args.prefetch, workers=args.workers, encoder=encoder_from_args(args))
+    elif len(args.inputs) == 1:
+        process_images(args.inputs[0], args.output, args.splits, args.rotation, args.workers, encoder=encoder_from_args(args),
+                       incremental=not args.force)
+    else:
+        parser.error('Give either one image directory or only video files')
 
 if __name__ == "__main__":
+    setup_logging()
+    
     # Example usage
     input_directory = "C:/Users/pengqh/Desktop/develop/25455306_frames"
     output_directory = "C:/Users/pengqh/Desktop/develop/25455306_frames_after"
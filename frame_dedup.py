@@ -0,0 +1,280 @@
+import os
+import shutil
+import logging
+import argparse
+import numpy as np
+from PIL import Image
+from frame_instrumentation import add_logging_arguments, get_instrumentation, setup_logging
+from frame_index import note_removed, note_written
+from frame_manifest import array_crc, file_crc
+from frame_selecting import load_timestamps, save_timestamps
+from frame_store import (STORE_DATA_FILE, STORE_INDEX_FILE, FrameStore, list_frames, open_frame_store,
+                         remove_frame_store)
+
+logger = logging.getLogger(__name__)
+
+HASH_METHODS = ('ahash', 'dhash', 'phash')
+HASH_INDEX_FILE = 'frame_hashes_{method}.npz'
+
+# Grayscale thumbnail size (width, height) each hash is computed from
+_THUMBNAIL_SIZES = {'ahash': (8, 8), 'dhash': (9, 8), 'phash': (32, 32)}
+
+# Number of set bits of every byte value, for Hamming distances
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II matrix, so the 2D DCT of X is C @ X @ C.T."""
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+_DCT_32 = _dct_matrix(32)
+
+def hash_thumbnail(img, method='dhash'):
+    """
+    Grayscale thumbnail of an image at the size the hash method needs.
+    
+    JPEG files that have not been decoded yet are decoded in draft mode.
+    
+    Returns:
+        uint8 array of shape (height, width)
+    """
+    size = _THUMBNAIL_SIZES[method]
+    img.draft('L', size)
+    return np.asarray(img.convert('L').resize(size, Image.BOX))
+
+def compute_hashes(thumbnails, method='dhash'):
+    """
+    Compute 64-bit perceptual hashes for a whole batch of thumbnails at once.
+    
+    aHash sets a bit for every pixel brighter than the mean, dHash for every pixel
+    darker than its right neighbour, and pHash for every low-frequency DCT coefficient
+    above the median, which makes it the most robust to compression and small shifts.
+    
+    Args:
+        thumbnails: Array of shape (frames, height, width) from hash_thumbnail
+        method: 'ahash', 'dhash' or 'phash' (default: 'dhash')
+    
+    Returns:
+        uint64 array with one hash per frame
+    """
+    thumbnails = np.asarray(thumbnails, dtype=np.float32)
+    count = len(thumbnails)
+    if method == 'ahash':
+        pixels = thumbnails.reshape(count, -1)
+        bits = pixels > pixels.mean(axis=1, keepdims=True)
+    elif method == 'dhash':
+        bits = (thumbnails[:, :, 1:] > thumbnails[:, :, :-1]).reshape(count, -1)
+    elif method == 'phash':
+        coefficients = (_DCT_32 @ thumbnails @ _DCT_32.T)[:, :8, :8].reshape(count, -1)
+        bits = coefficients > np.median(coefficients, axis=1, keepdims=True)
+    else:
+        raise ValueError(f"Unknown hash method '{method}'. Valid options are: {', '.join(HASH_METHODS)}")
+    return np.packbits(bits, axis=1).view('>u8').ravel().astype(np.uint64)
+
+def hamming_distances(hashes, other):
+    """
+    Hamming distances between the hashes and one hash (or a broadcastable array of hashes).
+    
+    Returns:
+        uint8 array of bit differences (0-64)
+    """
+    xor = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.asarray(other, dtype=np.uint64))
+    xor = np.ascontiguousarray(xor)
+    return _POPCOUNT[xor.view(np.uint8)].reshape(xor.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+def find_duplicates(hashes, threshold=5, mode='consecutive'):
+    """
+    Group near-duplicate frames by the Hamming distance of their hashes.
+    
+    Args:
+        hashes: uint64 array of frame hashes in temporal order
+        threshold: Frames whose hashes differ in at most this many bits are duplicates (default: 5)
+        mode: 'consecutive' compares every frame with the last kept frame, which collapses
+              pauses; 'global' compares it with every kept frame, which also drops frames
+              that return to an earlier state
+    
+    Returns:
+        (kept_indices, duplicates) where duplicates maps every kept index to the list of
+        indices collapsed into it
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    kept = []
+    duplicates = {}
+    for index, value in enumerate(hashes):
+        if kept:
+            if mode == 'consecutive':
+                candidates = kept[-1:]
+            elif mode == 'global':
+                candidates = kept
+            else:
+                raise ValueError(f"Unknown dedup mode '{mode}'")
+            distances = hamming_distances(hashes[candidates], value)
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= threshold:
+                duplicates[candidates[nearest]].append(index)
+                continue
+        kept.append(index)
+        duplicates[index] = []
+    return kept, duplicates
+
+def dedup_images(images, threshold=5, method='dhash', mode='consecutive'):
+    """
+    In-memory counterpart of dedup_frames: drop near-duplicates from a list of images.
+    
+    Returns:
+        List of the kept images
+    """
+    if not images:
+        return []
+    hashes = compute_hashes(np.stack([hash_thumbnail(img, method) for img in images]), method)
+    kept, _ = find_duplicates(hashes, threshold, mode)
+    return [images[idx] for idx in kept]
+
+def load_hash_index(input_dir, image_files, method='dhash', store=None):
+    """
+    Get the hashes of image_files in input_dir, reusing the hash index of earlier runs.
+    
+    The index is stored in input_dir as HASH_INDEX_FILE and keyed on file name, size and
+    CRC32, so frames re-extracted from the same video keep their hashes and only new or
+    changed files are decoded. Frames of a frame_store.FrameStore given as store are
+    keyed on the CRC32 of their pixels instead.
+    
+    Returns:
+        uint64 array with one hash per file
+    """
+    index_path = os.path.join(input_dir, HASH_INDEX_FILE.format(method=method))
+    known = {}
+    if os.path.exists(index_path):
+        with np.load(index_path) as data:
+            for name, size, crc, value in zip(data['names'], data['sizes'], data['crcs'], data['hashes']):
+                known[str(name)] = (int(size), int(crc), value)
+    
+    if store is not None:
+        keys = [array_crc(store.get_array(filename)) for filename in image_files]
+    else:
+        keys = [file_crc(os.path.join(input_dir, filename)) for filename in image_files]
+    hashes = np.zeros(len(image_files), dtype=np.uint64)
+    missing = []
+    for i, (filename, key) in enumerate(zip(image_files, keys)):
+        entry = known.get(filename)
+        if entry is not None and entry[:2] == key:
+            hashes[i] = entry[2]
+        else:
+            missing.append(i)
+    
+    if missing:
+        thumbnails = []
+        for i in missing:
+            if store is not None:
+                thumbnails.append(hash_thumbnail(store.get_image(image_files[i]), method))
+                continue
+            with Image.open(os.path.join(input_dir, image_files[i])) as img:
+                thumbnails.append(hash_thumbnail(img, method))
+        hashes[missing] = compute_hashes(np.stack(thumbnails), method)
+        np.savez(index_path, names=np.array(image_files), sizes=np.array([k[0] for k in keys], dtype=np.int64),
+                 crcs=np.array([k[1] for k in keys], dtype=np.int64), hashes=hashes)
+    
+    logger.info(f"Hashed {len(missing)} frames, reused {len(image_files) - len(missing)} from the hash index")
+    return hashes
+
+def dedup_frames(input_dir, output_dir=None, threshold=5, method='dhash', mode='consecutive', instrumentation=None):
+    """
+    Drop near-duplicate frames from a folder, e.g. the long runs of identical frames
+    extracted while the robot pauses, before selecting frames from it.
+    
+    Args:
+        input_dir: Input directory containing images
+        output_dir: Output directory for the kept frames; if None, the duplicates are
+                    deleted from input_dir instead (default: None)
+        threshold: Maximum Hamming distance (out of 64 bits) between duplicates (default: 5)
+        method: Hash method - 'ahash', 'dhash' or 'phash' (default: 'dhash')
+        mode: 'consecutive' or 'global', see find_duplicates (default: 'consecutive')
+        instrumentation: frame_instrumentation.Instrumentation collecting the hashing and
+                         io time (default: None)
+    
+    A frame_store.FrameStore in input_dir is rewritten with only the kept frames, or
+    copied that way into output_dir.
+    
+    Returns:
+        List of the kept file names, or None on error
+    """
+    instrumentation = get_instrumentation(instrumentation)
+    
+    if method not in HASH_METHODS:
+        logger.error(f"Error: Invalid hash method '{method}'. Valid options are: {', '.join(HASH_METHODS)}")
+        return None
+    
+    # Get all image files (or stored frames) from input directory and sort them
+    store = open_frame_store(input_dir)
+    image_files = list_frames(input_dir, store=store)
+    
+    if not image_files:
+        logger.warning(f"No image files found in {input_dir}")
+        return []
+    
+    with instrumentation.timer('dedup_frames', 'hash'):
+        hashes = load_hash_index(input_dir, image_files, method, store)
+    kept, duplicates = find_duplicates(hashes, threshold, mode)
+    
+    for index in kept:
+        if duplicates[index]:
+            logger.debug(f"Kept: {image_files[index]} ({len(duplicates[index])} duplicates)")
+    
+    with instrumentation.timer('dedup_frames', 'io'):
+        if store is not None:
+            # Write the kept frames to a new store, next to the old one when deduplicating in place
+            target_dir = output_dir if output_dir is not None else os.path.join(input_dir, '.dedup_store')
+            with FrameStore(target_dir, 'w') as kept_store:
+                for index in kept:
+                    entry = store.entry(image_files[index])
+                    kept_store.append(image_files[index], store.get_array(image_files[index]),
+                                      entry['frame_index'], entry['timestamp'])
+            if output_dir is None:
+                store.close()
+                for filename in (STORE_DATA_FILE, STORE_INDEX_FILE):
+                    os.replace(os.path.join(target_dir, filename), os.path.join(input_dir, filename))
+                os.rmdir(target_dir)
+        elif output_dir is None:
+            kept_set = set(kept)
+            for index, filename in enumerate(image_files):
+                if index not in kept_set:
+                    os.remove(os.path.join(input_dir, filename))
+                    note_removed(os.path.join(input_dir, filename))
+        else:
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+            remove_frame_store(output_dir)
+            for index in kept:
+                shutil.copy2(os.path.join(input_dir, image_files[index]), os.path.join(output_dir, image_files[index]))
+                note_written(os.path.join(output_dir, image_files[index]))
+            # Keep the frame timestamps with the copies, for selecting by time
+            times = load_timestamps(input_dir, [image_files[index] for index in kept])
+            if times is not None:
+                save_timestamps(output_dir, [image_files[index] for index in kept], times)
+    
+    logger.info(f"Kept {len(kept)} of {len(image_files)} frames ({len(image_files) - len(kept)} near-duplicates dropped)")
+    return [image_files[index] for index in kept]
+
+def main():
+    parser = argparse.ArgumentParser(description='Drop near-duplicate frames from a folder using perceptual hashes')
+    parser.add_argument('input_dir', help='Input directory containing images')
+    parser.add_argument('-o', '--output', default=None,
+                       help='Output directory for the kept frames (default: delete duplicates in place)')
+    parser.add_argument('-t', '--threshold', type=int, default=5,
+                       help='Maximum Hamming distance between duplicates, out of 64 bits (default: 5)')
+    parser.add_argument('-m', '--method', choices=HASH_METHODS, default='dhash',
+                       help='Hash method (default: dhash)')
+    parser.add_argument('--mode', choices=['consecutive', 'global'], default='consecutive',
+                       help='Compare with the last kept frame or with all kept frames (default: consecutive)')
+    add_logging_arguments(parser)
+    
+    args = parser.parse_args()
+    
+    setup_logging(args.log_level)
+    dedup_frames(args.input_dir, args.output, args.threshold, args.method, args.mode)
+
+if __name__ == "__main__":
+    main()
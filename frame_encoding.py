@@ -0,0 +1,207 @@
+import io
+import os
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+ENCODER_FORMATS = ('jpeg', 'png', 'webp')
+
+# File extension written for every format
+_EXTENSIONS = {'jpeg': '.jpg', 'png': '.png', 'webp': '.webp'}
+
+# Named configurations for the CLIs and the batch config
+ENCODER_PRESETS = {
+    # Library defaults, format taken from the file name
+    'default': {},
+    # Fast lossless intermediates: no quality loss between stages, little time in zlib
+    'lossless': {'format': 'png', 'compress_level': 1},
+    'webp-lossless': {'format': 'webp', 'lossless': True, 'quality': 0},
+    # High quality JPEG intermediates
+    'jpeg-high': {'format': 'jpeg', 'quality': 95},
+    # Smaller final collages, at the cost of a slower encode
+    'jpeg-small': {'format': 'jpeg', 'quality': 85, 'optimize': True, 'progressive': True},
+}
+
+class EncoderConfig:
+    """
+    How images are encoded, shared by every save path of the pipeline.
+    
+    Args:
+        format: 'jpeg', 'png' or 'webp'; None keeps the format the file name implies
+                (default: None)
+        quality: JPEG/WebP quality 1-100, None for the library default. For lossless
+                 WebP it is the compression effort (default: None)
+        optimize: Optimize the JPEG Huffman tables / PNG encoding (default: False)
+        progressive: Write progressive JPEGs (default: False)
+        compress_level: PNG zlib level 0-9; 1 is fast, 9 small (default: None, library default)
+        lossless: Write lossless WebP (default: False)
+    """
+    def __init__(self, format=None, quality=None, optimize=False, progressive=False, compress_level=None,
+                 lossless=False):
+        if format is not None:
+            format = format.lower().replace('jpg', 'jpeg')
+            if format not in ENCODER_FORMATS:
+                raise ValueError(f"Unknown image format '{format}'. Valid options are: {', '.join(ENCODER_FORMATS)}")
+        self.format = format
+        self.quality = quality
+        self.optimize = optimize
+        self.progressive = progressive
+        self.compress_level = compress_level
+        self.lossless = lossless
+    
+    def __repr__(self):
+        return f"EncoderConfig({', '.join(f'{k}={v!r}' for k, v in self.to_dict().items())})"
+    
+    def to_dict(self):
+        """The non-default settings, e.g. for the batch config or a cache key."""
+        defaults = EncoderConfig.__init__.__defaults__
+        names = ('format', 'quality', 'optimize', 'progressive', 'compress_level', 'lossless')
+        return {name: getattr(self, name) for name, default in zip(names, defaults)
+                if getattr(self, name) != default}
+    
+    def output_path(self, path):
+        """
+        path with the extension of the configured format, e.g. frame_000001.jpg becomes
+        frame_000001.png for PNG intermediates; unchanged when no format is set.
+        
+        A stage working in place with a new format leaves the old files next to the new ones.
+        """
+        if self.format is None:
+            return path
+        return os.path.splitext(path)[0] + _EXTENSIONS[self.format]
+    
+    def image_format(self, path):
+        """PIL format name for writing path."""
+        if self.format is not None:
+            return self.format.upper()
+        return Image.registered_extensions()['.' + path.rsplit('.', 1)[-1].lower()]
+    
+    def save_kwargs(self, image_format):
+        """Keyword arguments for Image.save in the given PIL format."""
+        kwargs = {}
+        if image_format == 'JPEG':
+            if self.quality is not None:
+                kwargs['quality'] = self.quality
+            if self.optimize:
+                kwargs['optimize'] = True
+            if self.progressive:
+                kwargs['progressive'] = True
+        elif image_format == 'PNG':
+            if self.optimize:
+                kwargs['optimize'] = True
+            if self.compress_level is not None:
+                kwargs['compress_level'] = self.compress_level
+        elif image_format == 'WEBP':
+            if self.quality is not None:
+                kwargs['quality'] = self.quality
+            if self.lossless:
+                kwargs['lossless'] = True
+        return kwargs
+    
+    def encode(self, img, path, **save_kwargs):
+        """
+        Encode a PIL image for path into memory.
+        
+        Args:
+            img: PIL image
+            path: Output path, only used for the format when none is configured
+            save_kwargs: Extra Image.save arguments, overriding the configuration
+        
+        Returns:
+            io.BytesIO holding the encoded image
+        """
+        image_format = save_kwargs.pop('format', None) or self.image_format(path)
+        kwargs = self.save_kwargs(image_format)
+        kwargs.update(save_kwargs)
+        buffer = io.BytesIO()
+        img.save(buffer, format=image_format, **kwargs)
+        return buffer
+
+DEFAULT_ENCODER = EncoderConfig()
+
+def get_encoder(encoder=None):
+    """
+    Turn None (library defaults), a preset name, a dict of EncoderConfig arguments or an
+    EncoderConfig into an EncoderConfig.
+    """
+    if encoder is None:
+        return DEFAULT_ENCODER
+    if isinstance(encoder, EncoderConfig):
+        return encoder
+    if isinstance(encoder, str):
+        if encoder not in ENCODER_PRESETS:
+            raise ValueError(f"Unknown encoder preset '{encoder}'. Valid options are: {', '.join(ENCODER_PRESETS)}")
+        return EncoderConfig(**ENCODER_PRESETS[encoder])
+    return EncoderConfig(**encoder)
+
+def add_encoder_arguments(parser):
+    """Add the encoder options to a CLI; pass args to encoder_from_args."""
+    parser.add_argument('--encoder', choices=list(ENCODER_PRESETS), default='default',
+                       help='Encoder preset (default: library defaults, format from the file name)')
+    parser.add_argument('--format', choices=ENCODER_FORMATS, default=None,
+                       help='Output image format (default: from the preset or file name)')
+    parser.add_argument('--quality', type=int, default=None,
+                       help='JPEG/WebP quality 1-100 (default: from the preset)')
+    parser.add_argument('--compress-level', type=int, default=None,
+                       help='PNG compression level 0-9 (default: from the preset)')
+    parser.add_argument('--optimize', action='store_true',
+                       help='Optimize JPEG/PNG encoding')
+    parser.add_argument('--progressive', action='store_true',
+                       help='Write progressive JPEGs')
+
+def encoder_from_args(args):
+    """EncoderConfig from the preset and overrides added by add_encoder_arguments."""
+    options = dict(ENCODER_PRESETS[args.encoder])
+    for name in ('format', 'quality', 'compress_level'):
+        if getattr(args, name) is not None:
+            options[name] = getattr(args, name)
+    for name in ('optimize', 'progressive'):
+        if getattr(args, name):
+            options[name] = True
+    return EncoderConfig(**options)
+
+class EncodePool:
+    """
+    Runs encode-and-write calls on background threads, so a serial loop (e.g. decoding a
+    video) can move on to the next frame while the last one is encoded. Encoders release
+    the GIL, so this overlaps with decoding.
+    
+    At most max_pending calls are in flight; submit() blocks on the oldest one beyond that,
+    which keeps memory bounded. Errors are raised from submit() or close(). With
+    workers=0 every call runs inline.
+    
+    Args:
+        workers: Number of encoder threads (default: 2)
+        max_pending: Maximum number of queued calls (default: 2 * workers)
+    """
+    def __init__(self, workers=2, max_pending=None):
+        self.workers = workers
+        self.max_pending = max_pending or 2 * max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers) if workers > 0 else None
+        self._pending = collections.deque()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        elif self._executor is not None:
+            # Do not mask the original error; let queued calls finish quietly
+            self._executor.shutdown(wait=True)
+    
+    def submit(self, func, *args, **kwargs):
+        if self._executor is None:
+            return func(*args, **kwargs)
+        while len(self._pending) >= self.max_pending:
+            self._pending.popleft().result()
+        self._pending.append(self._executor.submit(func, *args, **kwargs))
+    
+    def close(self):
+        """Wait for all queued calls, raising the first error."""
+        try:
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
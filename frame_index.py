@@ -0,0 +1,233 @@
+import os
+import json
+import atexit
+import time
+import logging
+import threading
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Image file formats every stage reads
+IMAGE_FORMATS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp')
+
+INDEX_FILE = 'frame_index.json'
+INDEX_VERSION = 1
+
+# Timestamps this close to the scan may still change within the same clock tick
+# (git calls these "racy"), so they are not trusted on the next run
+_RACY_NS = 2 * 10 ** 9
+
+# Indexes loaded in this process, keyed on the absolute directory path
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+class FrameIndex:
+    """
+    Listing of the image files in a directory with their stat metadata and, once read,
+    their dimensions, so stages running one after another do not each list the folder
+    and open every file for its size.
+    
+    The listing is built with os.scandir and checked against the modification time of
+    the directory on every use (one stat instead of a listing). Stages of this pipeline
+    report the files they write or remove (note_written/note_removed), which keeps a
+    loaded index current without a rescan; any other change to the directory triggers
+    one, and a rescan only reads the headers of new or changed files.
+    
+    Overwriting a file in place does not change the directory time, so sizes() also
+    checks the (st_size, st_mtime_ns) of every file it is asked about and reads the
+    header again if the file changed since its dimensions were recorded.
+    
+    The index is saved as INDEX_FILE inside the directory and reused by the next run.
+    Use get_frame_index to share one index per directory within a process.
+    
+    Args:
+        directory: Directory to index
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_FILE)
+        # name -> [size, mtime_ns, width, height]; width and height are None until read
+        self.entries = {}
+        self.dir_mtime_ns = None
+        # When dir_mtime_ns was read, to tell whether it was racy
+        self.scanned_ns = None
+        # Whether dir_mtime_ns comes from a scan rather than from noted writes (see save)
+        self._scanned = False
+        # Whether entries changed since the last save
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._load()
+    
+    def _load(self):
+        """Read the saved index; it is trusted as a whole only if the directory is unchanged since."""
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get('version') != INDEX_VERSION:
+            return
+        self.entries = saved['entries']
+        # A racy directory time is only used to carry over the file entries on a rescan
+        if saved['dir_mtime_ns'] is not None and saved['scanned_ns'] - saved['dir_mtime_ns'] > _RACY_NS:
+            self.dir_mtime_ns = saved['dir_mtime_ns']
+            self.scanned_ns = saved['scanned_ns']
+            self._scanned = True
+    
+    def _refresh(self):
+        """Rescan the directory if it changed since the index was built."""
+        scanned_ns = time.time_ns()
+        dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+        if dir_mtime_ns == self.dir_mtime_ns:
+            return
+        entries = {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.lower().endswith(IMAGE_FORMATS) or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                previous = self.entries.get(entry.name)
+                if (previous is not None and previous[:2] == [stat.st_size, stat.st_mtime_ns]
+                        and scanned_ns - stat.st_mtime_ns > _RACY_NS):
+                    entries[entry.name] = previous
+                else:
+                    entries[entry.name] = [stat.st_size, stat.st_mtime_ns, None, None]
+        self.entries = entries
+        self.dir_mtime_ns = dir_mtime_ns
+        self.scanned_ns = scanned_ns
+        self._scanned = True
+        logger.debug(f"Indexed {len(entries)} image files in {self.directory}")
+        self.save()
+    
+    def names(self, supported_formats=IMAGE_FORMATS):
+        """Sorted names of the image files with one of the supported formats."""
+        with self._lock:
+            self._refresh()
+            return sorted(name for name in self.entries if name.lower().endswith(supported_formats))
+    
+    def stat(self, name):
+        """(size, mtime_ns) of a file as of the last scan or note_written."""
+        with self._lock:
+            self._refresh()
+            return tuple(self.entries[name][:2])
+    
+    def sizes(self, names):
+        """
+        (width, height) of every named file. Only headers not in the index yet or of files
+        changed since are read (Image.open parses the header without decoding), and those
+        are saved with it.
+        """
+        with self._lock:
+            self._refresh()
+            sizes = []
+            missing = False
+            for name in names:
+                entry = self.entries[name]
+                # Files overwritten in place keep the directory time; only their own stat shows it
+                stat = os.stat(os.path.join(self.directory, name))
+                if entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+                    entry[:] = [stat.st_size, stat.st_mtime_ns, None, None]
+                if entry[2] is None:
+                    with Image.open(os.path.join(self.directory, name)) as img:
+                        entry[2], entry[3] = img.size
+                    missing = True
+                sizes.append((entry[2], entry[3]))
+            if missing:
+                self.save()
+            return sizes
+    
+    def size(self, name):
+        """(width, height) of one file, see sizes."""
+        return self.sizes([name])[0]
+    
+    def note_written(self, name, size=None):
+        """
+        Record a file a stage just wrote, keeping the index current without a rescan.
+        
+        Args:
+            name: File name in the directory
+            size: (width, height) of the written image if known (default: None, read on demand)
+        """
+        if not name.lower().endswith(IMAGE_FORMATS):
+            return
+        stat = os.stat(os.path.join(self.directory, name))
+        with self._lock:
+            width, height = size if size is not None else (None, None)
+            self.entries[name] = [stat.st_size, stat.st_mtime_ns, width, height]
+            self._dirty = True
+            self._note_dir_changed()
+    
+    def note_removed(self, name):
+        """Record a file a stage just removed or moved away."""
+        with self._lock:
+            if self.entries.pop(name, None) is not None:
+                self._dirty = True
+                self._note_dir_changed()
+    
+    def _note_dir_changed(self):
+        # The write changed the directory time; an index that was current stays current
+        # in this process, but another process may have changed the folder meanwhile
+        if self.dir_mtime_ns is not None:
+            self.dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+            self._scanned = False
+    
+    def save(self):
+        """
+        Write the index to INDEX_FILE; read-only directories are skipped silently.
+        
+        The directory time is only saved when it comes from a scan and is not racy, so the
+        next run trusts the saved listing only if nothing can have changed unseen; otherwise
+        it rescans, still reusing the dimensions of unchanged files.
+        """
+        with self._lock:
+            created = not os.path.exists(self.path)
+            try:
+                self._write()
+                self._dirty = False
+                if created and self._scanned:
+                    # Creating the file changed the directory time; record the new one
+                    self.dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+                    self._write()
+            except OSError as e:
+                logger.debug(f"Cannot save the frame index of {self.directory}: {e}")
+    
+    def _write(self):
+        # Rewritten in place rather than replaced, so saving does not change the directory time;
+        # a file cut off by an interrupted write fails to parse and is rebuilt
+        with open(self.path, 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'dir_mtime_ns': self.dir_mtime_ns if self._scanned else None,
+                       'scanned_ns': self.scanned_ns, 'entries': self.entries}, f)
+
+def get_frame_index(directory):
+    """The FrameIndex of a directory, shared by all stages of the process."""
+    key = os.path.abspath(directory)
+    with _INDEXES_LOCK:
+        if key not in _INDEXES:
+            _INDEXES[key] = FrameIndex(directory)
+        return _INDEXES[key]
+
+@atexit.register
+def save_frame_indexes():
+    """Save every loaded index with unsaved changes, e.g. the files written by the last stage."""
+    with _INDEXES_LOCK:
+        indexes = list(_INDEXES.values())
+    for index in indexes:
+        if index._dirty and os.path.isdir(index.directory):
+            index.save()
+
+def _loaded_index(path):
+    with _INDEXES_LOCK:
+        return _INDEXES.get(os.path.dirname(os.path.abspath(path)))
+
+def note_written(path, size=None):
+    """Tell the index of path's directory, if one is loaded, that path was written."""
+    index = _loaded_index(path)
+    if index is not None:
+        index.note_written(os.path.basename(path), size)
+
+def note_removed(path):
+    """Tell the index of path's directory, if one is loaded, that path was removed."""
+    index = _loaded_index(path)
+    if index is not None:
+        index.note_removed(os.path.basename(path))
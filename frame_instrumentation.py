@@ -0,0 +1,251 @@
+import io
+import os
+import csv
+import json
+import time
+import logging
+import threading
+import contextlib
+from PIL import Image
+from frame_encoding import get_encoder
+from frame_index import note_written
+
+def setup_logging(level=logging.INFO):
+    """
+    Send the pipeline log messages to the console, the way the old print calls did.
+    
+    Summaries are logged at INFO and per-file progress at DEBUG, so pass
+    logging.DEBUG to see every file, or logging.WARNING to silence everything
+    but problems.
+    """
+    logging.basicConfig(level=level, format='%(message)s')
+    # Pillow logs every plugin import at DEBUG; keep that out of the verbose output
+    logging.getLogger('PIL').setLevel(max(level, logging.INFO))
+
+def add_logging_arguments(parser):
+    """Add -v/--verbose and -q/--quiet to a CLI; pass args.log_level to setup_logging."""
+    parser.add_argument('-v', '--verbose', dest='log_level', action='store_const',
+                       const=logging.DEBUG, default=logging.INFO,
+                       help='Also log every processed file')
+    parser.add_argument('-q', '--quiet', dest='log_level', action='store_const',
+                       const=logging.WARNING,
+                       help='Only log warnings and errors')
+
+@contextlib.contextmanager
+def capture_logs(stream, level=logging.INFO):
+    """
+    Send all log messages to stream instead of the configured handlers for the duration
+    of the block, e.g. to keep the log of one job together in a worker process.
+    """
+    root = logging.getLogger()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    saved_handlers, saved_level = root.handlers[:], root.level
+    root.handlers = [handler]
+    root.setLevel(level)
+    try:
+        yield stream
+    finally:
+        root.handlers = saved_handlers
+        root.setLevel(saved_level)
+
+class FrameTimer:
+    """Per-frame timings collected inside Instrumentation.frame()."""
+    def __init__(self, instrumentation, stage, item):
+        self.instrumentation = instrumentation
+        self.stage = stage
+        self.item = item
+        self.timings = {}
+    
+    @contextlib.contextmanager
+    def timer(self, category):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[category] = self.timings.get(category, 0.0) + elapsed
+            self.instrumentation.add_time(self.stage, category, elapsed)
+    
+    def add(self, category, seconds):
+        """Record time measured elsewhere, e.g. inside a generator."""
+        self.timings[category] = self.timings.get(category, 0.0) + seconds
+        self.instrumentation.add_time(self.stage, category, seconds)
+    
+    def count(self, name, value=1):
+        self.instrumentation.count(name, value, self.stage)
+
+class Instrumentation:
+    """
+    Collects per-stage and per-frame timings plus counters for one pipeline run.
+    
+    Timings are grouped by stage and category (decode, transform, encode, io, ...),
+    counters track things like bytes_read, bytes_written and frames. Hooks are
+    called with a dict for every stage_start, stage_end and frame event, so callers
+    can stream progress to their own monitoring. All methods are thread-safe.
+    """
+    def __init__(self, keep_frames=True):
+        self.keep_frames = keep_frames
+        self.stages = {}
+        self.times = {}
+        self.counters = {}
+        self.frames = []
+        self.hooks = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+    
+    def add_hook(self, hook):
+        """Register a callable that receives every event dict."""
+        self.hooks.append(hook)
+        return hook
+    
+    def emit(self, event):
+        for hook in self.hooks:
+            hook(event)
+    
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time a whole stage, e.g. with instrumentation.stage('process_images'): ..."""
+        self.emit({'event': 'stage_start', 'stage': name})
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            self.emit({'event': 'stage_end', 'stage': name, 'seconds': elapsed})
+    
+    @contextlib.contextmanager
+    def timer(self, stage, category):
+        """Add the time spent in the block to a stage/category total."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, category, time.perf_counter() - start)
+    
+    @contextlib.contextmanager
+    def frame(self, stage, item):
+        """Collect the timings of one frame; yields a FrameTimer with its own timer()."""
+        frame_timer = FrameTimer(self, stage, item)
+        try:
+            yield frame_timer
+        finally:
+            record = {'stage': stage, 'item': item, 'timings': frame_timer.timings}
+            with self._lock:
+                self.counters.setdefault(stage, {})
+                self.counters[stage]['frames'] = self.counters[stage].get('frames', 0) + 1
+                if self.keep_frames:
+                    self.frames.append(record)
+            self.emit(dict(record, event='frame'))
+    
+    def add_time(self, stage, category, seconds):
+        with self._lock:
+            stage_times = self.times.setdefault(stage, {})
+            stage_times[category] = stage_times.get(category, 0.0) + seconds
+    
+    def count(self, name, value=1, stage=None):
+        with self._lock:
+            stage_counters = self.counters.setdefault(stage or 'total', {})
+            stage_counters[name] = stage_counters.get(name, 0) + value
+    
+    def report(self):
+        """Summary of the run as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                'wall_seconds': time.perf_counter() - self._start,
+                'stages': {name: {'seconds': seconds,
+                                  'times': dict(self.times.get(name, {})),
+                                  'counters': dict(self.counters.get(name, {}))}
+                           for name, seconds in self.stages.items()},
+                'times': {stage: dict(times) for stage, times in self.times.items()},
+                'counters': {stage: dict(counters) for stage, counters in self.counters.items()},
+                'frames': list(self.frames),
+            }
+    
+    def write_report(self, path):
+        """
+        Write the run report to path: JSON for .json, otherwise CSV with one row
+        per stage (item empty) and one row per frame.
+        """
+        report = self.report()
+        if path.lower().endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            return
+        
+        categories = sorted({c for times in report['times'].values() for c in times} |
+                            {c for frame in report['frames'] for c in frame['timings']})
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['stage', 'item', 'seconds'] + categories)
+            for name, stage in report['stages'].items():
+                writer.writerow([name, '', stage['seconds']] + [stage['times'].get(c, '') for c in categories])
+            for frame in report['frames']:
+                writer.writerow([frame['stage'], frame['item'], sum(frame['timings'].values())]
+                                + [frame['timings'].get(c, '') for c in categories])
+
+class NullInstrumentation(Instrumentation):
+    """Instrumentation that records nothing, used when no instrumentation is passed in."""
+    def __init__(self):
+        super().__init__(keep_frames=False)
+    
+    def add_hook(self, hook):
+        raise ValueError("Pass an Instrumentation instance to use hooks")
+    
+    def emit(self, event):
+        pass
+    
+    def add_time(self, stage, category, seconds):
+        pass
+    
+    def count(self, name, value=1, stage=None):
+        pass
+    
+    @contextlib.contextmanager
+    def stage(self, name):
+        yield self
+    
+    @contextlib.contextmanager
+    def frame(self, stage, item):
+        yield FrameTimer(self, stage, item)
+
+_NULL_INSTRUMENTATION = NullInstrumentation()
+
+def get_instrumentation(instrumentation=None):
+    """Return instrumentation, or a shared no-op instance if it is None."""
+    return instrumentation if instrumentation is not None else _NULL_INSTRUMENTATION
+
+def open_image(path, frame_timer):
+    """
+    Read an image file and open it lazily from memory, timing the read as io.
+    
+    Decoding happens on the first load(); wrap that in frame_timer.timer('decode').
+    Draft mode still works on the returned image.
+    """
+    with frame_timer.timer('io'):
+        with open(path, 'rb') as f:
+            data = f.read()
+    frame_timer.count('bytes_read', len(data))
+    return Image.open(io.BytesIO(data))
+
+def save_image(img, path, frame_timer, encoder=None, **save_kwargs):
+    """
+    Encode an image in memory, then write it, timing the two parts as encode and io.
+    
+    The format and settings come from encoder (a frame_encoding.EncoderConfig, preset
+    name or dict); without one the format is taken from the file extension, like
+    Image.save does. Pass encoder.output_path(path) to match the extension to the format.
+    """
+    with frame_timer.timer('encode'):
+        buffer = get_encoder(encoder).encode(img, path, **save_kwargs)
+    with frame_timer.timer('io'):
+        # Write next to the target and rename, so an interrupted run never leaves a truncated
+        # image behind (or destroys the source of a stage running in place)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getbuffer())
+        os.replace(tmp_path, path)
+    frame_timer.count('bytes_written', buffer.tell())
+    note_written(path, img.size)
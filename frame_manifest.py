@@ -0,0 +1,222 @@
+import os
+import json
+import zlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'frame_manifest.jsonl'
+
+def file_crc(path):
+    """(size, CRC32) of a file; unlike the modification time this survives re-extraction."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    return len(data), zlib.crc32(data)
+
+def array_crc(array):
+    """(size, CRC32) of the pixels of a frame_store.FrameStore frame, the counterpart of file_crc."""
+    return array.nbytes, zlib.crc32(array)
+
+def file_key(path):
+    """file_crc of a file as 'size:crc'."""
+    return "{}:{}".format(*file_crc(path))
+
+def stat_key(path):
+    """[size, modification time in ns] of a file, the cheap check before a file_key."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def frame_key(store, input_path):
+    """file_key of an input frame, from its pixels if it is in a frame_store.FrameStore."""
+    if store is None:
+        return file_key(input_path)
+    return "{}:{}".format(*array_crc(store.get_array(os.path.basename(input_path))))
+
+class Manifest:
+    """
+    Per output directory record of how every output file was made, so reruns of a stage
+    only process new or changed inputs.
+    
+    The manifest is a JSON-lines file (MANIFEST_FILE) in the output directory with one
+    line per written file: its name, the fingerprints of its source and of the written
+    output together with their stat_key, its lineage, the parameters of every stage applied since it was written
+    from a separate source (stages running in place add to it), and the position of each
+    of those stages in the chain. Lines are appended and flushed as soon as a file is
+    written, so an interrupted run resumes after the last finished file; the last line of
+    a file wins.
+    
+    An output is up to date when it is unchanged since it was written and
+    - for a stage writing to another folder, it was made from the same source with the
+      same parameters and nothing was applied to it since;
+    - for a stage running in place at a given chain position, the stage recorded at that
+      position has the same parameters, so rerunning a chain of in-place stages does not
+      apply a crop twice, while a chain repeating the same crop still applies it twice.
+      Without a position, the last stage applied must have the same parameters.
+    
+    Fingerprints of files whose stat_key matches the recorded one are taken from the
+    manifest instead of reading the file, so checking an unchanged folder costs a stat per
+    file; a file rewritten with the same content (e.g. re-extracted) costs a CRC.
+    """
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, MANIFEST_FILE)
+        self.entries = {}
+        # Absolute path -> (stat_key, file_key) of the sources and outputs recorded
+        self._known_keys = {}
+        self._lock = threading.Lock()
+        line_count = 0
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut off by an interrupted run
+                        continue
+                    self.entries[entry['file']] = entry
+                    line_count += 1
+        for name, entry in self.entries.items():
+            self._remember(os.path.join(output_dir, name), entry)
+        if line_count > 2 * len(self.entries) + 100:
+            self._compact()
+        self._file = open(self.path, 'a')
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def _compact(self):
+        """Rewrite the manifest with only the current line of every file."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + '\n')
+        os.replace(tmp_path, self.path)
+    
+    def _remember(self, output_path, entry):
+        if 'source_path' in entry:
+            self._known_keys[entry['source_path']] = (entry['source_stat'], entry['source'])
+        if 'output_stat' in entry:
+            # Set last, as in place the source path is the output path
+            self._known_keys[os.path.abspath(output_path)] = (entry['output_stat'], entry['output'])
+    
+    def file_key(self, path):
+        """file_key of a file, from the manifest if its stat_key matches the recorded one."""
+        path = os.path.abspath(path)
+        stat = stat_key(path)
+        known = self._known_keys.get(path)
+        if known is not None and known[0] == stat:
+            return known[1]
+        key = file_key(path)
+        self._known_keys[path] = (stat, key)
+        return key
+    
+    def source_key(self, store, input_path):
+        """frame_key of an input frame, from the manifest if it is an unchanged file (see file_key)."""
+        if store is None:
+            return self.file_key(input_path)
+        return frame_key(store, input_path)
+    
+    def made_from(self, output_path, source_path):
+        """
+        Whether output_path is unchanged since it was made from the current content of
+        source_path, e.g. a frame copied by select_frames and then reworked in place.
+        
+        Args:
+            output_path: File recorded in this manifest, or a plain copy of source_path
+            source_path: File the output was made from
+        """
+        if not os.path.exists(output_path):
+            return False
+        entry = self.entries.get(os.path.basename(output_path))
+        if entry is None:
+            return stat_key(output_path) == stat_key(source_path)
+        if stat_key(output_path) != entry.get('output_stat'):
+            return False
+        if stat_key(source_path) == entry.get('source_stat'):
+            return True
+        return file_key(source_path) == entry['source']
+    
+    @staticmethod
+    def normalize(params):
+        """Parameters as they read back from JSON (tuples become lists), for comparisons."""
+        return json.loads(json.dumps(params, sort_keys=True, default=repr))
+    
+    @staticmethod
+    def _positions(entry):
+        # Entries written before positions were recorded hold one stage per position
+        return entry.get('positions', list(range(len(entry['lineage']))))
+    
+    def is_current(self, input_path, output_path, source_key, params, position=None, later_params=None):
+        """
+        Whether output_path is up to date for the source fingerprint and parameters.
+        
+        Args:
+            input_path: Source file, used to tell in-place runs apart
+            output_path: File the stage would write
+            source_key: frame_key of the source
+            params: Normalized stage parameters (see normalize)
+            position: Position of the stage in its chain of in-place stages, e.g. the index
+                      of a crop-and-resize step (default: None, after the last one applied)
+            later_params: Normalized parameters of the stages the chain applies in place
+                          after this one, when writing to another folder; the output is
+                          only up to date if exactly those were applied to it since, as an
+                          in-place stage cannot undo the stages applied after it
+                          (default: None, no later stages)
+        """
+        entry = self.entries.get(os.path.basename(output_path))
+        if entry is None or not os.path.exists(output_path):
+            return False
+        in_place = os.path.abspath(input_path) == os.path.abspath(output_path)
+        output_key = source_key if in_place else self.file_key(output_path)
+        if output_key != entry['output']:
+            return False
+        if in_place:
+            if position is None:
+                return entry['lineage'][-1] == params
+            applied = dict(zip(self._positions(entry), entry['lineage']))
+            return applied.get(position) == params
+        return entry['lineage'] == [params] + list(later_params or []) and entry['source'] == source_key
+    
+    def record(self, input_path, output_path, source_key, params, position=None):
+        """
+        Append the entry of a freshly written output file.
+        
+        Args:
+            input_path, output_path, source_key, params, position: as passed to is_current
+        """
+        name = os.path.basename(output_path)
+        previous = self.entries.get(name)
+        in_place = os.path.abspath(input_path) == os.path.abspath(output_path)
+        if in_place and previous is not None and previous['output'] == source_key:
+            # Applied on top of the recorded state of the file, replacing the stages from its position on
+            positions = self._positions(previous)
+            if position is None:
+                position = positions[-1] + 1
+            kept = [i for i, p in enumerate(positions) if p < position]
+            source, source_path, source_stat = previous['source'], previous.get('source_path'), previous.get('source_stat')
+            lineage = [previous['lineage'][i] for i in kept] + [params]
+            positions = [positions[i] for i in kept] + [position]
+        else:
+            source, lineage, positions = source_key, [params], [position or 0]
+            # The stat the source key was taken at, the input may be overwritten by now
+            source_path = source_stat = None
+            known = self._known_keys.get(os.path.abspath(input_path))
+            if known is not None and known[1] == source_key:
+                source_path, source_stat = os.path.abspath(input_path), known[0]
+        entry = {'file': name, 'source': source, 'lineage': lineage, 'positions': positions,
+                 'output': file_key(output_path), 'output_stat': stat_key(output_path)}
+        if source_path is not None:
+            entry.update(source_path=source_path, source_stat=source_stat)
+        with self._lock:
+            self.entries[entry['file']] = entry
+            self._remember(output_path, entry)
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+    
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
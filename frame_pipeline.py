@@ -0,0 +1,140 @@
+import time
+import queue
+import logging
+import threading
+from frame_instrumentation import get_instrumentation
+
+logger = logging.getLogger(__name__)
+
+# Queue marker telling a worker that its stage has no more items
+_END_OF_STAGE = object()
+
+class PipelineStage:
+    """
+    One step of a pipeline run by run_pipeline.
+    
+    Args:
+        name: Stage name, used for the queue_wait and blocked timings
+        func: Called with every item; returns the item for the next stage, or None to drop it
+        workers: Number of threads running func concurrently (default: 1)
+        queue_size: Maximum number of items waiting for this stage (default: 2 * workers)
+    """
+    def __init__(self, name, func, workers=1, queue_size=None):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue_size = queue_size or 2 * self.workers
+
+def run_pipeline(source, stages, instrumentation=None, source_name='source'):
+    """
+    Run the items of source through stages with all stages working at the same time.
+    
+    source is iterated on its own thread and every stage runs on its own pool of
+    threads, linked by bounded queues. A stage that is ahead blocks once the queue of
+    the next one is full (backpressure), so memory stays bounded and the throughput is
+    set by the slowest stage instead of the sum of all stages. Per stage, the time
+    workers wait for input is recorded as queue_wait and the time spent waiting for
+    room downstream as blocked, which shows where the bottleneck is.
+    
+    The first exception raised by source or a stage stops the pipeline and is re-raised.
+    
+    Args:
+        source: Iterable of input items, e.g. a generator decoding a video
+        stages: List of PipelineStage
+        instrumentation: frame_instrumentation.Instrumentation (default: None)
+        source_name: Stage name the blocked time of the source is recorded under
+    
+    Returns:
+        List of the items returned by the last stage, in source order
+    """
+    instrumentation = get_instrumentation(instrumentation)
+    if not stages:
+        return list(source)
+    
+    queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+    stop = threading.Event()
+    lock = threading.Lock()
+    errors = []
+    results = {}
+    running = [stage.workers for stage in stages]
+    
+    def fail(e):
+        with lock:
+            errors.append(e)
+        stop.set()
+    
+    def put(index, item, name):
+        # Time spent waiting for room downstream is backpressure on the sender
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                queues[index].put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        instrumentation.add_time(name, 'blocked', time.perf_counter() - start)
+    
+    def get(index):
+        while not stop.is_set():
+            try:
+                return queues[index].get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _END_OF_STAGE
+    
+    def feed():
+        try:
+            for sequence, item in enumerate(source):
+                if stop.is_set():
+                    return
+                put(0, (sequence, item), source_name)
+        except Exception as e:
+            fail(e)
+        finally:
+            for _ in range(stages[0].workers):
+                put(0, _END_OF_STAGE, source_name)
+    
+    def work(index):
+        stage = stages[index]
+        while True:
+            with instrumentation.timer(stage.name, 'queue_wait'):
+                item = get(index)
+            if item is _END_OF_STAGE:
+                break
+            sequence, payload = item
+            try:
+                result = stage.func(payload)
+            except Exception as e:
+                fail(e)
+                break
+            if result is None:
+                continue
+            if index + 1 < len(stages):
+                put(index + 1, (sequence, result), stage.name)
+            else:
+                with lock:
+                    results[sequence] = result
+        # The last worker of a stage to finish ends the next stage
+        with lock:
+            running[index] -= 1
+            last = running[index] == 0
+        if last and index + 1 < len(stages):
+            for _ in range(stages[index + 1].workers):
+                put(index + 1, _END_OF_STAGE, stage.name)
+    
+    threads = [threading.Thread(target=feed, name=f"pipeline-{source_name}", daemon=True)]
+    for index, stage in enumerate(stages):
+        threads.extend(threading.Thread(target=work, args=(index,), name=f"pipeline-{stage.name}-{i}", daemon=True)
+                       for i in range(stage.workers))
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    finally:
+        # Also unblock everything if the caller is interrupted
+        stop.set()
+    
+    if errors:
+        raise errors[0]
+    return [results[sequence] for sequence in sorted(results)]
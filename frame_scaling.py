@@ -1,8 +1,152 @@
 from PIL import Image
 import os
+import cv2
+import numpy as np
+import logging
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from frame_encoding import add_encoder_arguments, encoder_from_args, get_encoder
+from frame_manifest import Manifest
+from frame_instrumentation import add_logging_arguments, get_instrumentation, save_image, setup_logging
+from frame_store import list_frames, open_frame, open_frame_store
 
-def crop_and_resize_images(input_dir, output_dir, scale_factor=0.8, position='bottom-left'):
+logger = logging.getLogger(__name__)
+
+# (horizontal, vertical) alignment of every crop position, in halves of the free space
+CROP_POSITIONS = {
+    'top-left': (0, 0), 'top-center': (1, 0), 'top-right': (2, 0),
+    'center-left': (0, 1), 'center-center': (1, 1), 'center-right': (2, 1),
+    'bottom-left': (0, 2), 'bottom-center': (1, 2), 'bottom-right': (2, 2),
+}
+
+# Resampling kernels, fastest first; 'lanczos' is the default and the sharpest
+RESAMPLING_METHODS = ('nearest', 'bilinear', 'area', 'lanczos')
+
+_PIL_FILTERS = {'nearest': Image.NEAREST, 'bilinear': Image.BILINEAR, 'area': Image.BOX, 'lanczos': Image.LANCZOS}
+
+def cv2_interpolation(resampling, shrinking):
+    """
+    OpenCV interpolation flag for a resampling method. INTER_AREA is used for every
+    downscale except 'nearest', as it is both faster and closer to PIL than cv2's
+    bilinear and Lanczos kernels there; 'area' enlarges bilinearly.
+    """
+    if resampling == 'nearest':
+        return cv2.INTER_NEAREST
+    if shrinking:
+        return cv2.INTER_AREA
+    return cv2.INTER_LANCZOS4 if resampling == 'lanczos' else cv2.INTER_LINEAR
+
+def resize_image(img, size, resampling='lanczos', box=None, reducing_gap=None):
+    """
+    Resize a PIL image with one of RESAMPLING_METHODS.
+    
+    'area' downscales with OpenCV's INTER_AREA, a box filter with fast paths for integer
+    factors, and enlarges bilinearly (averaging areas only makes sense when shrinking).
+    The other methods use the matching PIL filter.
+    
+    Args:
+        img: PIL image
+        size: Target (width, height)
+        resampling: 'nearest', 'bilinear', 'area' or 'lanczos' (default: 'lanczos')
+        box: Source region (left, top, right, bottom) to resize, may be fractional
+             (default: None, the whole image)
+        reducing_gap: Shrink by an integer factor with Image.reduce first, as long as the
+                      remaining factor stays above reducing_gap, before the final resample;
+                      much faster for large factors at a small cost in quality. Ignored by
+                      'nearest' and the OpenCV path (default: None, one pass)
+    
+    Returns:
+        The resized PIL image
+    """
+    if resampling not in _PIL_FILTERS:
+        raise ValueError(f"Unknown resampling '{resampling}'. Valid options are: {', '.join(RESAMPLING_METHODS)}")
+    if box is None:
+        box = (0, 0) + img.size
+    if resampling == 'area':
+        shrinking = size[0] < box[2] - box[0] and size[1] < box[3] - box[1]
+        if not shrinking:
+            return img.resize(size, Image.BILINEAR, box=box, reducing_gap=reducing_gap)
+        # OpenCV needs an integer source region; PIL's BOX filter handles the rest
+        if img.mode in ('RGB', 'L') and all(float(v).is_integer() for v in box):
+            left, top, right, bottom = (int(v) for v in box)
+            region = np.asarray(img)[top:bottom, left:right]
+            return Image.fromarray(cv2.resize(region, tuple(size), interpolation=cv2.INTER_AREA))
+    return img.resize(size, _PIL_FILTERS[resampling], box=box, reducing_gap=reducing_gap)
+
+def get_crop_box(size, scale_factor, position):
+    """
+    Calculate the crop box that keeps the given position of an image with its aspect ratio.
+    
+    Args:
+        size: (width, height) of the image
+        scale_factor: Scale factor for cropping
+        position: Position to keep (see crop_and_resize_images)
+    """
+    original_width, original_height = size
+    
+    # Calculate crop dimensions maintaining aspect ratio
+    crop_width = int(original_width * scale_factor)
+    crop_height = int(original_height * scale_factor)
+    
+    # Offset of the crop in the free space along each axis, in halves: 0 start, 1 center, 2 end
+    align_x, align_y = CROP_POSITIONS[position]
+    left = (original_width - crop_width) * align_x // 2
+    top = (original_height - crop_height) * align_y // 2
+    crop_box = (left, top, left + crop_width, top + crop_height)
+    
+    return crop_box
+
+def add_resampling_arguments(parser):
+    """Add the resampling options to a CLI."""
+    parser.add_argument('-r', '--resampling', choices=RESAMPLING_METHODS, default='lanczos',
+                       help='Resampling kernel; nearest and bilinear are fastest, lanczos sharpest (default: lanczos)')
+    parser.add_argument('--reducing-gap', type=float, default=None,
+                       help='Shrink large downscales by an integer factor first, e.g. 2.0 or 3.0 (default: one pass)')
+
+def crop_and_resize_image(img, scale_factor=0.8, position='bottom-left', resampling='lanczos', reducing_gap=None):
+    """
+    Crop a single image to the given position and resize it back to its original dimensions.
+    
+    Args:
+        img: PIL image
+        scale_factor: Scale factor for cropping (default: 0.8)
+        position: Position to keep (see crop_and_resize_images)
+        resampling: Resampling kernel, see resize_image (default: 'lanczos')
+        reducing_gap: see resize_image (default: None)
+    
+    Returns:
+        The processed PIL image
+    """
+    # Convert to RGB if necessary
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    # Crop the image
+    cropped_img = img.crop(get_crop_box(img.size, scale_factor, position))
+    
+    # Resize back to original dimensions
+    return resize_image(cropped_img, img.size, resampling, reducing_gap=reducing_gap)
+
+def crop_and_resize_params(scale_factor=0.8, position='bottom-left', encoder=None, resampling='lanczos', reducing_gap=None):
+    """
+    Normalized frame_manifest.Manifest parameters of a crop_and_resize_images step, e.g.
+    for the later_params of the stage writing the files the step reworks in place.
+    
+    Args:
+        scale_factor, position, encoder, resampling, reducing_gap: as passed to crop_and_resize_images
+    """
+    params = {'stage': 'crop_and_resize_images', 'scale_factor': scale_factor, 'position': position,
+              'encoder': get_encoder(encoder).to_dict()}
+    # Only add the keys when needed, so existing manifest entries stay valid
+    if resampling != 'lanczos':
+        params['resampling'] = resampling
+    if reducing_gap is not None:
+        params['reducing_gap'] = reducing_gap
+    return Manifest.normalize(params)
+
+def crop_and_resize_images(input_dir, output_dir, scale_factor=0.8, position='bottom-left', workers=1, plan=None, instrumentation=None,
+                           encoder=None, incremental=True, resampling='lanczos', reducing_gap=None, chain_position=None,
+                           later_params=None):
     """
     Crop images to keep a specific corner/position with original aspect ratio,
     then resize back to original dimensions.
@@ -14,105 +158,116 @@ def crop_and_resize_images(input_dir, output_dir, scale_factor=0.8, position='bo
         position: Position to keep ('top-left', 'top-center', 'top-right',
                  'center-left', 'center-center', 'center-right',
                  'bottom-left', 'bottom-center', 'bottom-right')
+        workers: Number of images processed concurrently in a thread pool (default: 1)
+        plan: If a frame_transform.TransformPlan is given, append the crop and resize
+              to it and return it instead of processing any files (the plan resamples
+              with its own resampling setting)
+        instrumentation: frame_instrumentation.Instrumentation collecting decode, transform,
+                         encode and io timings plus bytes read and written (default: None)
+        encoder: frame_encoding.EncoderConfig, preset name or dict for the output images
+                 (default: None, format from the file name with library defaults)
+        incremental: Skip images whose output is up to date according to the frame_manifest.Manifest
+                     of output_dir, so reruns only process new or changed inputs and in-place
+                     reruns are idempotent; False reprocesses everything (default: True)
+        resampling: Resampling kernel, 'nearest', 'bilinear', 'area' or 'lanczos'; the faster
+                    kernels trade sharpness for speed, see resize_image (default: 'lanczos')
+        reducing_gap: see resize_image (default: None)
+        chain_position: Position of this step in the chain of stages writing the files of
+                        output_dir, e.g. 1 for the first of several crop-and-resize steps
+                        after a split; lets an in-place rerun tell a repeated identical step
+                        from one already applied (see frame_manifest.Manifest)
+                        (default: None, after the last step applied)
+        later_params: crop_and_resize_params of the steps applied in place to the files of
+                      output_dir after this one, when it writes to another folder; lets a
+                      rerun skip files the whole chain is up to date for (default: None)
     """
-    # Create output directory if it doesn't exist
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    instrumentation = get_instrumentation(instrumentation)
+    encoder = get_encoder(encoder)
     
     # Validate position
-    valid_positions = [
-        'top-left', 'top-center', 'top-right',
-        'center-left', 'center-center', 'center-right',
-        'bottom-left', 'bottom-center', 'bottom-right'
-    ]
+    valid_positions = list(CROP_POSITIONS)
     
     if position not in valid_positions:
-        print(f"Error: Invalid position '{position}'. Valid options are: {', '.join(valid_positions)}")
+        logger.error(f"Error: Invalid position '{position}'. Valid options are: {', '.join(valid_positions)}")
+        return
+    
+    if resampling not in RESAMPLING_METHODS:
+        logger.error(f"Error: Invalid resampling '{resampling}'. Valid options are: {', '.join(RESAMPLING_METHODS)}")
         return
     
-    # Supported image formats
-    supported_formats = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif')
+    if plan is not None:
+        return plan.add_crop_resize(scale_factor, position)
+    
+    # Create output directory if it doesn't exist
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
     
-    # Get all image files from input directory
-    image_files = [f for f in os.listdir(input_dir) 
-                  if f.lower().endswith(supported_formats)]
+    # Get all image files (or stored frames) from input directory and sort them
+    store = open_frame_store(input_dir)
+    image_files = list_frames(input_dir, store=store)
+    if store is not None and os.path.abspath(output_dir) == os.path.abspath(input_dir):
+        logger.error(f"Error: Cannot write images into the frame store folder {input_dir} they are read from")
+        return
     
     if not image_files:
-        print(f"No image files found in {input_dir}")
+        logger.warning(f"No image files found in {input_dir}")
         return
     
-    print(f"Found {len(image_files)} image files")
-    print(f"Scale factor: {scale_factor}")
-    print(f"Position: {position}")
+    logger.info(f"Found {len(image_files)} image files")
+    logger.info(f"Scale factor: {scale_factor}")
+    logger.info(f"Position: {position}")
+    logger.info(f"Resampling: {resampling}")
     
-    processed_count = 0
+    manifest = Manifest(output_dir)
+    params = crop_and_resize_params(scale_factor, position, encoder, resampling, reducing_gap)
+    skipped = []
     
-    for filename in image_files:
+    def process_one(filename):
         try:
-            # Open image
             input_path = os.path.join(input_dir, filename)
-            with Image.open(input_path) as img:
-                # Convert to RGB if necessary
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
+            output_path = encoder.output_path(os.path.join(output_dir, filename))
+            source_key = manifest.source_key(store, input_path)
+            if incremental and manifest.is_current(input_path, output_path, source_key, params, chain_position,
+                                                   later_params):
+                skipped.append(filename)
+                return True, f"Up to date: {filename}"
+            
+            # Open image
+            with instrumentation.frame('crop_and_resize_images', filename) as frame_timer, \
+                    open_frame(store, input_path, frame_timer) as img:
                 original_width, original_height = img.size
-                
-                # Calculate crop dimensions maintaining aspect ratio
-                crop_width = int(original_width * scale_factor)
-                crop_height = int(original_height * scale_factor)
-                
-                # Calculate crop box based on position
-                if position == 'top-left':
-                    crop_box = (0, 0, crop_width, crop_height)
-                elif position == 'top-center':
-                    left = (original_width - crop_width) // 2
-                    crop_box = (left, 0, left + crop_width, crop_height)
-                elif position == 'top-right':
-                    left = original_width - crop_width
-                    crop_box = (left, 0, original_width, crop_height)
-                elif position == 'center-left':
-                    top = (original_height - crop_height) // 2
-                    crop_box = (0, top, crop_width, top + crop_height)
-                elif position == 'center-center':
-                    left = (original_width - crop_width) // 2
-                    top = (original_height - crop_height) // 2
-                    crop_box = (left, top, left + crop_width, top + crop_height)
-                elif position == 'center-right':
-                    left = original_width - crop_width
-                    top = (original_height - crop_height) // 2
-                    crop_box = (left, top, original_width, top + crop_height)
-                elif position == 'bottom-left':
-                    top = original_height - crop_height
-                    crop_box = (0, top, crop_width, original_height)
-                elif position == 'bottom-center':
-                    left = (original_width - crop_width) // 2
-                    top = original_height - crop_height
-                    crop_box = (left, top, left + crop_width, original_height)
-                elif position == 'bottom-right':
-                    left = original_width - crop_width
-                    top = original_height - crop_height
-                    crop_box = (left, top, original_width, original_height)
-                
-                # Crop the image
-                cropped_img = img.crop(crop_box)
-                
-                # Resize back to original dimensions
-                resized_img = cropped_img.resize((original_width, original_height), Image.LANCZOS)
+                with frame_timer.timer('decode'):
+                    img.load()
+                with frame_timer.timer('transform'):
+                    resized_img = crop_and_resize_image(img, scale_factor, position, resampling, reducing_gap)
                 
                 # Save processed image
-                output_path = os.path.join(output_dir, filename)
-                resized_img.save(output_path)
+                save_image(resized_img, output_path, frame_timer, encoder)
+                manifest.record(input_path, output_path, source_key, params, chain_position)
                 
-                processed_count += 1
-                print(f"Processed: {filename} - Original: {original_width}x{original_height}")
+                return True, f"Processed: {filename} - Original: {original_width}x{original_height}"
                 
         except Exception as e:
-            print(f"Error processing {filename}: {str(e)}")
+            return False, f"Error processing {filename}: {str(e)}"
+    
+    processed_count = 0
     
-    print(f"/nProcessing completed!")
-    print(f"Successfully processed {processed_count} out of {len(image_files)} images")
-    print(f"Output directory: {output_dir}")
+    # PIL releases the GIL while decoding, resizing and encoding, so threads scale with cores.
+    # map() yields results in input order, so the report stays deterministic.
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for ok, message in executor.map(process_one, image_files):
+            if ok:
+                processed_count += 1
+                logger.debug(message)
+            else:
+                logger.error(message)
+    manifest.close()
+    
+    logger.info(f"/nProcessing completed!")
+    logger.info(f"Successfully processed {processed_count} out of {len(image_files)} images")
+    if skipped:
+        logger.info(f"  {len(skipped)} of them were up to date and skipped")
+    logger.info(f"Output directory: {output_dir}")
 
 def main():
     parser = argparse.ArgumentParser(description='Crop images to a specific position and resize back to original dimensions')
@@ -126,12 +281,25 @@ def main():
                                'center-left', 'center-center', 'center-right',
                                'bottom-left', 'bottom-center', 'bottom-right'],
                        help='Position to keep (default: bottom-left)')
+    parser.add_argument('-w', '--workers', type=int, default=1, 
+                       help='Number of images processed concurrently (default: 1)')
+    parser.add_argument('-f', '--force', action='store_true',
+                       help='Reprocess all images, also those that are up to date')
+    add_resampling_arguments(parser)
+    
+    add_encoder_arguments(parser)
+    add_logging_arguments(parser)
     
     args = parser.parse_args()
     
-    crop_and_resize_images(args.input_dir, args.output, args.scale, args.position)
+    setup_logging(args.log_level)
+    crop_and_resize_images(args.input_dir, args.output, args.scale, args.position, args.workers,
+                           encoder=encoder_from_args(args), incremental=not args.force,
+                           resampling=args.resampling, reducing_gap=args.reducing_gap)
 
 if __name__ == "__main__":
+    setup_logging()
+    
     # Example usage
     input_directory = "C:/Users/pengqh/Desktop/develop/25455306_frames_after/selected_frames/"  # Change to your input directory
     output_directory = input_directory+"scaled_frames"
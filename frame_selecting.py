@@ -1,9 +1,285 @@
 import os
+import json
 import shutil
+import logging
 import argparse
+import numpy as np
 from PIL import Image
+from frame_instrumentation import add_logging_arguments, get_instrumentation, setup_logging
+from frame_index import note_written
+from frame_manifest import Manifest
+from frame_store import FrameStore, list_frames, open_frame_store, remove_frame_store
 
-def select_uniform_frames(input_dir, output_dir, num_frames=8):
+logger = logging.getLogger(__name__)
+
+# Motion signatures are tiny grayscale thumbnails; video_to_frames can save them next to the frames
+SIGNATURE_SIZE = (32, 32)
+SIGNATURE_FILE = 'signatures.npz'
+SELECTION_METHODS = ('uniform', 'segments', 'coverage')
+# select_frames can also spread the frames evenly in time, from the timestamps saved at extraction
+FRAME_SELECTION_METHODS = SELECTION_METHODS + ('time',)
+TIMESTAMP_FILE = 'frame_timestamps.json'
+
+def uniform_indices(total_count, num_frames):
+    """
+    Calculate the indices of num_frames items spread uniformly over total_count items.
+    
+    Args:
+        total_count: Number of items to choose from
+        num_frames: Number of items to select
+    
+    Returns:
+        List of selected indices in ascending order
+    """
+    if total_count <= 0 or num_frames <= 0:
+        return []
+    
+    num_frames = min(num_frames, total_count)
+    
+    if num_frames == 1:
+        # If only selecting one frame, choose the middle one
+        return [total_count // 2]
+    
+    # Calculate step size for uniform selection
+    step = (total_count - 1) / (num_frames - 1)
+    return [int(round(i * step)) for i in range(num_frames)]
+
+def select_uniform_images(images, num_frames=8):
+    """
+    In-memory counterpart of select_uniform_frames: pick images uniformly from a list.
+    
+    Args:
+        images: List of images (or any items) in temporal order
+        num_frames: Number of images to select (default: 8)
+    
+    Returns:
+        List of the selected items
+    """
+    return [images[idx] for idx in uniform_indices(len(images), num_frames)]
+
+def image_signature(img, size=SIGNATURE_SIZE):
+    """
+    Downsampled grayscale thumbnail of an image, used to measure motion between frames.
+    
+    JPEG files that have not been decoded yet are decoded in draft mode, so this is
+    much cheaper than a full decode.
+    
+    Args:
+        img: PIL image
+        size: (width, height) of the signature (default: SIGNATURE_SIZE)
+    
+    Returns:
+        uint8 array of shape (height, width)
+    """
+    img.draft('L', size)
+    return np.asarray(img.convert('L').resize(size, Image.BOX))
+
+def save_signatures(output_dir, names, signatures):
+    """Save the signatures of the frames called names to SIGNATURE_FILE in output_dir."""
+    np.savez(os.path.join(output_dir, SIGNATURE_FILE), names=np.array(names), signatures=np.asarray(signatures))
+
+def load_signatures(input_dir, image_files, size=SIGNATURE_SIZE, store=None):
+    """
+    Get the signatures of image_files in input_dir.
+    
+    Signatures saved during extraction are used if they cover all of these files (frames
+    may have been dropped since, e.g. by frame_dedup), otherwise they are computed from
+    the images (or from the frame_store.FrameStore given as store).
+    
+    Returns:
+        uint8 array of shape (len(image_files), height, width)
+    """
+    signature_path = os.path.join(input_dir, SIGNATURE_FILE)
+    if os.path.exists(signature_path):
+        with np.load(signature_path) as data:
+            rows = {str(name): i for i, name in enumerate(data['names'])}
+            if all(f in rows for f in image_files) and data['signatures'].shape[1:] == (size[1], size[0]):
+                return data['signatures'][[rows[f] for f in image_files]]
+    
+    signatures = np.empty((len(image_files), size[1], size[0]), dtype=np.uint8)
+    for i, filename in enumerate(image_files):
+        if store is not None:
+            signatures[i] = image_signature(store.get_image(filename), size)
+            continue
+        with Image.open(os.path.join(input_dir, filename)) as img:
+            signatures[i] = image_signature(img, size)
+    return signatures
+
+def motion_scores(signatures, metric='diff', bins=32):
+    """
+    Amount of change between every frame and the one before it, for a whole clip at once.
+    
+    Args:
+        signatures: Array of shape (frames, height, width) from image_signature
+        metric: 'diff' for the mean absolute pixel difference, or 'histogram' for the
+                change of the gray-level histogram (ignores small camera shake better)
+        bins: Number of histogram bins for the 'histogram' metric (default: 32)
+    
+    Returns:
+        float array with one score per frame; the first frame scores 0
+    """
+    signatures = np.asarray(signatures)
+    count = len(signatures)
+    scores = np.zeros(count, dtype=np.float64)
+    if count < 2:
+        return scores
+    
+    if metric == 'diff':
+        frames = signatures.reshape(count, -1).astype(np.int16)
+        scores[1:] = np.abs(np.diff(frames, axis=0)).mean(axis=1)
+    elif metric == 'histogram':
+        # One bincount over all frames, with each frame's bins offset into its own row
+        binned = signatures.reshape(count, -1).astype(np.int64) * bins // 256
+        offsets = np.arange(count)[:, None] * bins
+        histograms = np.bincount((binned + offsets).ravel(), minlength=count * bins).reshape(count, bins)
+        # Fraction of pixels that moved to another bin
+        scores[1:] = 0.5 * np.abs(np.diff(histograms, axis=0)).sum(axis=1) / binned.shape[1]
+    else:
+        raise ValueError(f"Unknown motion metric '{metric}'")
+    return scores
+
+def motion_indices(signatures, num_frames, method='segments', metric='diff', time_weight=0.1):
+    """
+    Pick num_frames frames of a clip based on how much happens between them.
+    
+    'segments' cuts the clip into num_frames stretches of equal cumulative motion and
+    keeps the frame at the start of every stretch (the first and last frame are always
+    kept), so busy parts such as a grasp get more frames than idle periods.
+    'coverage' greedily keeps the frame that looks least like every frame kept so far
+    (farthest-point sampling on the signatures), so every distinct state shows up once.
+    
+    Args:
+        signatures: Array of shape (frames, height, width) from image_signature
+        num_frames: Number of frames to select
+        method: 'segments', 'coverage' or 'uniform'
+        metric: Motion metric for 'segments', see motion_scores (default: 'diff')
+        time_weight: Share of the 'segments' budget spread evenly over time, so long idle
+                     periods are not skipped entirely (default: 0.1)
+    
+    Returns:
+        List of selected indices in ascending order
+    """
+    signatures = np.asarray(signatures)
+    total_count = len(signatures)
+    if total_count <= 0 or num_frames <= 0:
+        return []
+    num_frames = min(num_frames, total_count)
+    
+    if method == 'uniform':
+        return uniform_indices(total_count, num_frames)
+    
+    if method == 'segments':
+        scores = motion_scores(signatures, metric)
+        if scores.sum() == 0:
+            # A static clip has no motion to follow
+            return uniform_indices(total_count, num_frames)
+        weights = (1 - time_weight) * scores / scores.sum() + time_weight / total_count
+        cumulative = np.cumsum(weights) - weights[0]
+        targets = np.linspace(0, cumulative[-1], num_frames)
+        indices = np.minimum(np.searchsorted(cumulative, targets), total_count - 1)
+        # Several targets can fall in one burst of motion; spread them to distinct frames
+        steps = np.arange(num_frames)
+        indices = np.maximum.accumulate(indices - steps) + steps
+        indices = np.minimum(indices, total_count - num_frames + steps)
+        return [int(i) for i in indices]
+    
+    if method == 'coverage':
+        features = signatures.reshape(total_count, -1).astype(np.float32)
+        selected = [0]
+        distances = np.abs(features - features[0]).mean(axis=1)
+        distances[0] = -1
+        for _ in range(num_frames - 1):
+            index = int(np.argmax(distances))
+            selected.append(index)
+            distances = np.minimum(distances, np.abs(features - features[index]).mean(axis=1))
+            # Never pick a frame twice, even when the remaining frames are exact duplicates
+            distances[index] = -1
+        return sorted(selected)
+    
+    raise ValueError(f"Unknown selection method '{method}'. Valid options are: {', '.join(SELECTION_METHODS)}")
+
+def save_timestamps(output_dir, names, times):
+    """
+    Save where the frames called names come from to TIMESTAMP_FILE in output_dir.
+    
+    Args:
+        output_dir: Folder of the frames
+        names: Frame file names
+        times: (frame_index, timestamp) of every frame in the source video, timestamp in seconds
+    """
+    with open(os.path.join(output_dir, TIMESTAMP_FILE), 'w') as f:
+        json.dump({name: {'frame_index': frame_index, 'timestamp': timestamp}
+                   for name, (frame_index, timestamp) in zip(names, times)}, f)
+
+def load_timestamps(input_dir, image_files, store=None):
+    """
+    Get the source frame numbers and timestamps of image_files in input_dir, from the
+    frame_store.FrameStore given as store or from the TIMESTAMP_FILE saved at extraction.
+    
+    Returns:
+        List of (frame_index, timestamp) tuples, or None if some file has no timestamp
+        (e.g. frames that were not extracted by video_to_frames)
+    """
+    if store is not None:
+        entries = {name: store.entry(name) for name in image_files}
+    else:
+        timestamp_path = os.path.join(input_dir, TIMESTAMP_FILE)
+        if not os.path.exists(timestamp_path):
+            return None
+        with open(timestamp_path) as f:
+            entries = json.load(f)
+    if not all(name in entries and entries[name]['timestamp'] is not None for name in image_files):
+        return None
+    return [(entries[name]['frame_index'], entries[name]['timestamp']) for name in image_files]
+
+def time_indices(timestamps, num_frames):
+    """
+    Indices of num_frames frames spread evenly in time rather than over the frame list, so
+    gaps (e.g. frames dropped by frame_dedup) do not skew the selection.
+    
+    Every target time gets the nearest frame; a frame nearest to two targets is selected once.
+    
+    Args:
+        timestamps: Ascending frame timestamps in seconds
+        num_frames: Number of frames to select
+    
+    Returns:
+        List of selected indices in ascending order
+    """
+    if not timestamps or num_frames <= 0:
+        return []
+    times = np.asarray(timestamps, dtype=np.float64)
+    if num_frames == 1:
+        # If only selecting one frame, choose the middle one
+        targets = [(times[0] + times[-1]) / 2]
+    else:
+        targets = np.linspace(times[0], times[-1], num_frames)
+    indices = []
+    for target in targets:
+        index = int(np.abs(times - target).argmin())
+        if not indices or index != indices[-1]:
+            indices.append(index)
+    return indices
+
+def select_motion_images(images, num_frames=8, method='segments', metric='diff'):
+    """
+    In-memory counterpart of select_frames with a motion-aware method.
+    
+    Args:
+        images: List of PIL images in temporal order
+        num_frames: Number of images to select (default: 8)
+        method: Selection method, see motion_indices (default: 'segments')
+        metric: Motion metric, see motion_scores (default: 'diff')
+    
+    Returns:
+        List of the selected images
+    """
+    if method == 'uniform' or not images:
+        return select_uniform_images(images, num_frames)
+    signatures = np.stack([image_signature(img) for img in images])
+    return [images[idx] for idx in motion_indices(signatures, num_frames, method, metric)]
+
+def select_uniform_frames(input_dir, output_dir, num_frames=8, instrumentation=None):
     """
     Select a specified number of frames uniformly from all images in a folder.
     
@@ -11,59 +287,144 @@ def select_uniform_frames(input_dir, output_dir, num_frames=8):
         input_dir: Input directory containing images
         output_dir: Output directory for selected frames
         num_frames: Number of frames to select (default: 8)
+        instrumentation: frame_instrumentation.Instrumentation collecting the copy time
+                         and bytes of every selected frame (default: None)
+    """
+    select_frames(input_dir, output_dir, num_frames, 'uniform', instrumentation=instrumentation)
+
+def select_frames(input_dir, output_dir, num_frames=8, method='uniform', metric='diff', instrumentation=None,
+                  start_time=None, end_time=None):
+    """
+    Select a specified number of frames from all images in a folder.
+    
+    Args:
+        input_dir: Input directory containing images
+        output_dir: Output directory for selected frames
+        num_frames: Number of frames to select (default: 8)
+        method: 'uniform' spreads the frames evenly over the file list; 'time' evenly over
+                their timestamps (see time_indices); 'segments' and 'coverage' follow the
+                motion in the clip (see motion_indices)
+        metric: Motion metric for 'segments', see motion_scores (default: 'diff')
+        instrumentation: frame_instrumentation.Instrumentation collecting the copy time
+                         and bytes of every selected frame (default: None)
+        start_time, end_time: Only select from the frames with timestamps in this window,
+                              in seconds of the source video (default: None, all frames)
+    
+    If input_dir holds a frame_store.FrameStore, the selected frames are copied straight
+    from its memory map into a new store in output_dir, without any decoding or encoding.
+    
+    Selecting by time uses the timestamps video_to_frames saves with the frames (see
+    load_timestamps), so no frame is decoded for it; they are saved with the selected
+    frames as well.
     """
+    instrumentation = get_instrumentation(instrumentation)
+    
+    if method not in FRAME_SELECTION_METHODS:
+        logger.error(f"Error: Invalid selection method '{method}'. Valid options are: {', '.join(FRAME_SELECTION_METHODS)}")
+        return
+    
     # Create output directory if it doesn't exist
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
-    # Supported image formats
-    supported_formats = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp')
-    
-    # Get all image files from input directory and sort them
-    image_files = [f for f in os.listdir(input_dir) 
-                  if f.lower().endswith(supported_formats)]
+    # Get all image files (or stored frames) from input directory, sorted to ensure consistent ordering
+    store = open_frame_store(input_dir)
+    image_files = list_frames(input_dir, store=store)
     
     if not image_files:
-        print(f"No image files found in {input_dir}")
+        logger.warning(f"No image files found in {input_dir}")
         return
     
-    # Sort image files to ensure consistent ordering
-    image_files.sort()
+    times = load_timestamps(input_dir, image_files, store)
+    if times is None and (method == 'time' or start_time is not None or end_time is not None):
+        logger.error(f"Error: No frame timestamps in {input_dir}, cannot select by time")
+        return
+    if start_time is not None or end_time is not None:
+        window = [i for i, (_, timestamp) in enumerate(times)
+                  if (start_time is None or timestamp >= start_time) and (end_time is None or timestamp < end_time)]
+        image_files = [image_files[i] for i in window]
+        times = [times[i] for i in window]
+        logger.info(f"{len(image_files)} frames in the time window")
+        if not image_files:
+            logger.warning(f"No frames in the time window in {input_dir}")
+            return
     
     total_images = len(image_files)
     
-    print(f"Found {total_images} image files")
-    print(f"Selecting {num_frames} frames uniformly")
+    logger.info(f"Found {total_images} image files")
+    logger.info(f"Selecting {num_frames} frames ({method})")
     
     # If we have fewer images than requested frames, adjust the number
     if total_images < num_frames:
-        print(f"Warning: Only {total_images} images available, selecting all")
+        logger.warning(f"Warning: Only {total_images} images available, selecting all")
         num_frames = total_images
     
-    # Calculate the indices for uniform selection
-    if num_frames == 1:
-        # If only selecting one frame, choose the middle one
-        indices = [total_images // 2]
+    # Calculate the indices of the selected frames
+    if method == 'uniform':
+        indices = uniform_indices(total_images, num_frames)
+    elif method == 'time':
+        indices = time_indices([timestamp for _, timestamp in times], num_frames)
     else:
-        # Calculate step size for uniform selection
-        step = (total_images - 1) / (num_frames - 1)
-        indices = [int(round(i * step)) for i in range(num_frames)]
+        with instrumentation.timer('select_frames', 'signatures'):
+            signatures = load_signatures(input_dir, image_files, store=store)
+        indices = motion_indices(signatures, num_frames, method, metric)
+    
+    # Selected frames go into a new store when reading from one, otherwise they are copied as files
+    output_store = FrameStore(output_dir, 'w') if store is not None else None
+    manifest = None
+    if store is None:
+        remove_frame_store(output_dir)
+        # Tells the copies made by an earlier run, maybe reworked in place since, from stale ones
+        manifest = Manifest(output_dir)
     
     # Select and copy the frames
     selected_count = 0
+    kept_count = 0
+    selected_names, selected_times = [], []
     for i, idx in enumerate(indices):
         if idx < total_images:  # Ensure index is within bounds
             src_path = os.path.join(input_dir, image_files[idx])
             dst_path = os.path.join(output_dir, f"frame_{i+1:03d}_{image_files[idx]}")
             
             # Copy the image file
-            shutil.copy2(src_path, dst_path)
+            with instrumentation.frame('select_frames', image_files[idx]) as frame_timer:
+                with frame_timer.timer('io'):
+                    if output_store is not None:
+                        entry = store.entry(image_files[idx])
+                        array = store.get_array(image_files[idx])
+                        output_store.append(os.path.basename(dst_path), array, entry['frame_index'], entry['timestamp'])
+                        size = array.nbytes
+                    elif manifest.made_from(dst_path, src_path):
+                        # Unchanged since an earlier run, copying would undo the stages applied to it
+                        size = 0
+                        kept_count += 1
+                    else:
+                        shutil.copy2(src_path, dst_path)
+                        note_written(dst_path)
+                        size = os.path.getsize(dst_path)
+                frame_timer.count('bytes_read', size)
+                frame_timer.count('bytes_written', size)
             selected_count += 1
-            print(f"Selected: {image_files[idx]} -> frame_{i+1:03d}_{image_files[idx]}")
+            if times is not None:
+                selected_names.append(os.path.basename(dst_path))
+                selected_times.append(times[idx])
+            logger.debug(f"Selected: {image_files[idx]} -> frame_{i+1:03d}_{image_files[idx]}")
     
-    print(f"/nSelection completed!")
-    print(f"Successfully selected {selected_count} frames")
-    print(f"Output directory: {output_dir}")
+    if manifest is not None:
+        manifest.close()
+    if output_store is not None:
+        output_store.close()
+    elif times is not None:
+        save_timestamps(output_dir, selected_names, selected_times)
+    elif os.path.exists(os.path.join(output_dir, TIMESTAMP_FILE)):
+        # Left by an earlier run; it would give these frames the wrong times
+        os.remove(os.path.join(output_dir, TIMESTAMP_FILE))
+    
+    logger.info(f"/nSelection completed!")
+    logger.info(f"Successfully selected {selected_count} frames")
+    if kept_count:
+        logger.info(f"  {kept_count} of them were up to date and kept")
+    logger.info(f"Output directory: {output_dir}")
 
 def main():
     parser = argparse.ArgumentParser(description='Select uniform frames from a folder of images')
@@ -72,12 +433,26 @@ def main():
                        help='Output directory (default: selected_frames)')
     parser.add_argument('-n', '--number', type=int, default=8, 
                        help='Number of frames to select (default: 8)')
+    parser.add_argument('-m', '--method', choices=FRAME_SELECTION_METHODS, default='uniform',
+                       help='uniform spacing, even spacing in "time", or motion-aware "segments" / "coverage" (default: uniform)')
+    parser.add_argument('--metric', choices=['diff', 'histogram'], default='diff',
+                       help='Motion metric for the segments method (default: diff)')
+    parser.add_argument('--start', type=float, default=None,
+                       help='Only select frames from this time on, in seconds of the source video')
+    parser.add_argument('--end', type=float, default=None,
+                       help='Only select frames before this time, in seconds of the source video')
+    
+    add_logging_arguments(parser)
     
     args = parser.parse_args()
     
-    select_uniform_frames(args.input_dir, args.output, args.number)
+    setup_logging(args.log_level)
+    select_frames(args.input_dir, args.output, args.number, args.method, args.metric,
+                  start_time=args.start, end_time=args.end)
 
 if __name__ == "__main__":
+    setup_logging()
+    
     # Example usage
     input_directory = "C:/Users/pengqh/Desktop/develop/25455306_frames_after/"  # Change to your input directory
     output_directory = input_directory+"selected_frames"
@@ -0,0 +1,190 @@
+import os
+import json
+import logging
+import argparse
+import numpy as np
+from PIL import Image
+from frame_buffer import Frame, image_array
+from frame_index import IMAGE_FORMATS, get_frame_index
+from frame_instrumentation import add_logging_arguments, open_image, setup_logging
+
+logger = logging.getLogger(__name__)
+
+STORE_INDEX_FILE = 'frame_store.json'
+STORE_DATA_FILE = 'frame_store.bin'
+STORE_VERSION = 1
+
+class FrameStore:
+    """
+    A folder of frames kept as one raw RGB file plus a small JSON index.
+    
+    The data file is memory-mapped for reading, so get_array returns a zero-copy view
+    and any frame is found in O(1) from the index, without listing or decoding files.
+    Every index entry holds the frame name, its frame number and timestamp in the
+    source video, its shape and its byte offset in the data file.
+    
+    Open with mode 'r' to read an existing store or 'w' to create a new one (replacing
+    any store in the folder); a new store becomes visible when it is closed.
+    """
+    def __init__(self, store_dir, mode='r'):
+        self.store_dir = store_dir
+        self.mode = mode
+        self._data = None
+        self._file = None
+        if mode == 'w':
+            if not os.path.exists(store_dir):
+                os.makedirs(store_dir)
+            remove_frame_store(store_dir)
+            self.frames = []
+            self._file = open(os.path.join(store_dir, STORE_DATA_FILE), 'wb')
+        elif mode == 'r':
+            with open(os.path.join(store_dir, STORE_INDEX_FILE)) as f:
+                index = json.load(f)
+            if index.get('version') != STORE_VERSION:
+                raise ValueError(f"Unsupported frame store version {index.get('version')} in {store_dir}")
+            self.frames = index['frames']
+        else:
+            raise ValueError(f"Invalid frame store mode '{mode}'")
+        self._positions = {entry['name']: i for i, entry in enumerate(self.frames)}
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def __len__(self):
+        return len(self.frames)
+    
+    @property
+    def names(self):
+        """Frame names in store order."""
+        return [entry['name'] for entry in self.frames]
+    
+    def entry(self, name):
+        """Index entry of a frame: name, frame_index, timestamp, shape and offset."""
+        return self.frames[self._positions[name]]
+    
+    def append(self, name, array, frame_index=None, timestamp=None):
+        """
+        Add a frame to a store opened with mode 'w'.
+        
+        Args:
+            name: Frame name, used like a file name by the stages (e.g. frame_000012.jpg)
+            array: RGB uint8 array of shape (height, width, 3)
+            frame_index: Frame number in the source video (default: None)
+            timestamp: Time of the frame in the source video in seconds (default: None)
+        """
+        array = np.ascontiguousarray(array, dtype=np.uint8)
+        offset = self._file.tell()
+        self._file.write(array.data)
+        self._positions[name] = len(self.frames)
+        self.frames.append({'name': name, 'frame_index': frame_index, 'timestamp': timestamp,
+                            'shape': list(array.shape), 'offset': offset})
+    
+    def close(self):
+        """Finish writing the store, or release the memory map of a store opened for reading."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            # Write the index last, so a store without an index is never read half-written
+            tmp_path = os.path.join(self.store_dir, STORE_INDEX_FILE + '.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': STORE_VERSION, 'dtype': 'uint8', 'frames': self.frames}, f)
+            os.replace(tmp_path, os.path.join(self.store_dir, STORE_INDEX_FILE))
+        self._data = None
+    
+    def get_array(self, name):
+        """
+        Zero-copy, read-only view of a frame as an RGB uint8 array of shape (height, width, 3).
+        """
+        if self._data is None:
+            self._data = np.memmap(os.path.join(self.store_dir, STORE_DATA_FILE), dtype=np.uint8, mode='r')
+        entry = self.entry(name)
+        shape = tuple(entry['shape'])
+        return self._data[entry['offset']:entry['offset'] + int(np.prod(shape))].reshape(shape)
+    
+    def get_image(self, name):
+        """A frame as a PIL RGB image (PIL keeps its own copy of the pixels)."""
+        return Frame(self.get_array(name), 'RGB').image()
+
+def is_frame_store(path):
+    """Whether path is a folder holding a FrameStore."""
+    return os.path.isfile(os.path.join(path, STORE_INDEX_FILE))
+
+def remove_frame_store(store_dir):
+    """Delete the store files from a folder, so stale frames cannot shadow new image files."""
+    for filename in (STORE_INDEX_FILE, STORE_DATA_FILE):
+        path = os.path.join(store_dir, filename)
+        if os.path.exists(path):
+            os.remove(path)
+
+def open_frame_store(input_dir):
+    """Open the FrameStore in input_dir for reading, or return None if it is a plain image folder."""
+    return FrameStore(input_dir) if is_frame_store(input_dir) else None
+
+def list_frames(input_dir, supported_formats=IMAGE_FORMATS, store=None):
+    """
+    Sorted names of the frames in a folder: the store names if it holds a FrameStore,
+    otherwise the image files with one of the supported formats, from the folder's
+    shared frame_index.FrameIndex (so consecutive stages do not list it again).
+    """
+    if store is not None:
+        return sorted(store.names)
+    return get_frame_index(input_dir).names(supported_formats)
+
+def open_frame(store, input_path, frame_timer):
+    """
+    Open a frame for a stage, from the store if there is one, else from the image file.
+    
+    Store frames are returned fully loaded (their read is timed as io); files are opened
+    lazily with frame_instrumentation.open_image, so draft mode still works on them.
+    """
+    if store is None:
+        return open_image(input_path, frame_timer)
+    with frame_timer.timer('io'):
+        img = store.get_image(os.path.basename(input_path))
+    frame_timer.count('bytes_read', img.width * img.height * 3)
+    return img
+
+def images_to_store(input_dir, store_dir):
+    """
+    Convert a folder of images (e.g. an existing original_frame_dir) into a FrameStore.
+    
+    Args:
+        input_dir: Input directory containing images
+        store_dir: Folder to create the store in (may be input_dir itself)
+    """
+    image_files = list_frames(input_dir)
+    if not image_files:
+        logger.warning(f"No image files found in {input_dir}")
+        return
+    
+    with FrameStore(store_dir, 'w') as store:
+        for filename in image_files:
+            with Image.open(os.path.join(input_dir, filename)) as img:
+                store.append(filename, image_array(img))
+    
+    logger.info(f"Stored {len(image_files)} frames in {store_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Show or create a memory-mapped frame store')
+    parser.add_argument('store_dir', help='Frame store folder')
+    parser.add_argument('--from-images', default=None,
+                       help='Create the store from all images in this folder')
+    add_logging_arguments(parser)
+    
+    args = parser.parse_args()
+    
+    setup_logging(args.log_level)
+    if args.from_images:
+        images_to_store(args.from_images, args.store_dir)
+    
+    with FrameStore(args.store_dir) as store:
+        size = os.path.getsize(os.path.join(args.store_dir, STORE_DATA_FILE))
+        logger.info(f"{len(store)} frames, {size / (1024 * 1024):.1f} MB in {args.store_dir}")
+        for entry in store.frames:
+            logger.debug(f"  {entry['name']}  frame {entry['frame_index']}  t={entry['timestamp']}  {entry['shape']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+from PIL import Image
+import os
+import math
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from frame_dealing import unpack_splits_config, get_split_box
+from frame_scaling import add_resampling_arguments, get_crop_box, resize_image, RESAMPLING_METHODS
+from frame_encoding import add_encoder_arguments, encoder_from_args, get_encoder
+from frame_manifest import Manifest
+from frame_instrumentation import add_logging_arguments, get_instrumentation, save_image, setup_logging
+from frame_store import list_frames, open_frame, open_frame_store
+
+logger = logging.getLogger(__name__)
+
+IDENTITY = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+
+def _compose(outer, inner):
+    """
+    Compose two affine maps given as PIL (a, b, c, d, e, f) coefficients.
+    
+    Both map output coordinates to input coordinates, so the result applies
+    inner first and then outer: outer(inner(x, y)).
+    """
+    a1, b1, c1, d1, e1, f1 = outer
+    a2, b2, c2, d2, e2, f2 = inner
+    return (a1 * a2 + b1 * d2, a1 * b2 + b1 * e2, a1 * c2 + b1 * f2 + c1,
+            d1 * a2 + e1 * d2, d1 * b2 + e1 * e2, d1 * c2 + e1 * f2 + f1)
+
+def _rotation_matrix(size, angle):
+    """Output-to-input map used by PIL's Image.rotate(angle) without expand."""
+    w, h = size
+    angle = -math.radians(angle)
+    cos_a = round(math.cos(angle), 15)
+    sin_a = round(math.sin(angle), 15)
+    cx, cy = w / 2, h / 2
+    return (cos_a, sin_a, cx - cos_a * cx - sin_a * cy,
+            -sin_a, cos_a, cy + sin_a * cx - cos_a * cy)
+
+class TransformPlan:
+    """
+    Collects the geometric steps of the pipeline (grid split, rotation, crop-and-resize,
+    final resize) and executes them with a single resample per frame.
+    
+    Leading splits are folded into one lossless crop box. All following steps are
+    folded into one affine map, which is executed as a single LANCZOS resize when it
+    is axis-aligned, or a single bicubic affine transform otherwise. A rotation that
+    follows a crop-and-resize starts a new resample pass, because the area it fills
+    with black cannot be expressed in the same affine map.
+    
+    Args:
+        resampling: Kernel of the axis-aligned resizes, see frame_scaling.resize_image;
+                    rotations by other angles than multiples of 90 use bicubic unless it is
+                    'nearest' or 'bilinear' (default: 'lanczos')
+        reducing_gap: see frame_scaling.resize_image (default: None)
+    """
+    def __init__(self, resampling='lanczos', reducing_gap=None):
+        if resampling not in RESAMPLING_METHODS:
+            raise ValueError(f"Unknown resampling '{resampling}'. Valid options are: {', '.join(RESAMPLING_METHODS)}")
+        self.steps = []
+        self.resampling = resampling
+        self.reducing_gap = reducing_gap
+        self._resolved = {}
+    
+    def settings(self):
+        """The non-default resampling settings, e.g. for a cache key or manifest."""
+        settings = {}
+        if self.resampling != 'lanczos':
+            settings['resampling'] = self.resampling
+        if self.reducing_gap is not None:
+            settings['reducing_gap'] = self.reducing_gap
+        return settings
+    
+    def add_split(self, splits_config):
+        """Keep one cell of the grid, same configuration as process_images."""
+        splits = unpack_splits_config(splits_config)
+        if splits is None:
+            raise ValueError(f"Invalid splits config: {splits_config}")
+        self.steps.append(('split', splits))
+        self._resolved.clear()
+        return self
+    
+    def add_rotation(self, rotation_angle):
+        """Rotate counter-clockwise around the center without expanding, like Image.rotate."""
+        if rotation_angle % 360 != 0:
+            self.steps.append(('rotate', rotation_angle % 360))
+            self._resolved.clear()
+        return self
+    
+    def add_crop_resize(self, scale_factor, position):
+        """Crop to a position and resize back to the current size, like crop_and_resize_image."""
+        self.steps.append(('crop_resize', (scale_factor, position)))
+        self._resolved.clear()
+        return self
+    
+    def add_resize(self, size):
+        """Resize to a fixed (width, height), e.g. the slot size of the collage tile."""
+        self.steps.append(('resize', tuple(size)))
+        self._resolved.clear()
+        return self
+    
+    def _split_passes(self):
+        """Group the steps into passes that can each be executed with one resample."""
+        passes = []
+        current = []
+        resampling = False
+        for step in self.steps:
+            if step[0] == 'rotate' and resampling:
+                passes.append(current)
+                current = []
+                resampling = False
+            if step[0] != 'split' or resampling:
+                resampling = True
+            current.append(step)
+        if current:
+            passes.append(current)
+        return passes
+    
+    def resolve(self, size):
+        """
+        Fold the steps into executable passes for a source image of the given size.
+        
+        Returns:
+            List of (crop_box, matrix, output_size) tuples, one per pass. crop_box is a
+            lossless integer crop, matrix maps output coordinates into the cropped image.
+        """
+        key = size
+        if key in self._resolved:
+            return self._resolved[key]
+        
+        resolved = []
+        for steps in self._split_passes():
+            # Leading splits are plain nested crops
+            left, top = 0, 0
+            width, height = size
+            index = 0
+            while index < len(steps) and steps[index][0] == 'split':
+                box = get_split_box((width, height), steps[index][1])
+                left, top = left + box[0], top + box[1]
+                width, height = box[2] - box[0], box[3] - box[1]
+                index += 1
+            crop_box = (left, top, left + width, top + height)
+            
+            # Everything else becomes one affine map
+            matrix = IDENTITY
+            for kind, params in steps[index:]:
+                if kind == 'split':
+                    box = get_split_box((width, height), params)
+                    step_matrix = (1.0, 0.0, box[0], 0.0, 1.0, box[1])
+                    width, height = box[2] - box[0], box[3] - box[1]
+                elif kind == 'rotate':
+                    step_matrix = _rotation_matrix((width, height), params)
+                elif kind == 'resize':
+                    step_matrix = (width / params[0], 0.0, 0.0, 0.0, height / params[1], 0.0)
+                    width, height = params
+                else:
+                    box = get_crop_box((width, height), *params)
+                    step_matrix = (
+                        (box[2] - box[0]) / width, 0.0, box[0],
+                        0.0, (box[3] - box[1]) / height, box[1])
+                matrix = _compose(matrix, step_matrix)
+            
+            resolved.append((crop_box, matrix, (width, height)))
+            size = (width, height)
+        
+        self._resolved[key] = resolved
+        return resolved
+    
+    def required_decode_size(self, size):
+        """
+        Smallest source resolution that still provides one source pixel per output pixel.
+        
+        Only smaller than size when the plan ends in a fixed add_resize that shrinks
+        the image; crop-and-resize steps alone always keep the source resolution.
+        """
+        factor = 1.0
+        for crop_box, matrix, output_size in self.resolve(size):
+            a, b, c, d, e, f = matrix
+            # Source pixels covered by one output pixel along each output axis
+            factor *= min(math.hypot(a, d), math.hypot(b, e))
+        if factor <= 1.0:
+            return size
+        return (math.ceil(size[0] / factor), math.ceil(size[1] / factor))
+    
+    def draft(self, img):
+        """
+        Put a freshly opened JPEG in draft mode so the decoder downscales by 1/2, 1/4
+        or 1/8 via DCT scaling when the output needs fewer pixels than the source.
+        No-op for other formats and for images that are already loaded.
+        """
+        required_size = self.required_decode_size(img.size)
+        if required_size != img.size:
+            img.draft('RGB', required_size)
+        return img
+    
+    def apply(self, img):
+        """
+        Apply the plan to a single image.
+        
+        Call draft() first on images opened from disk to decode them at reduced resolution.
+        
+        Args:
+            img: PIL image
+        
+        Returns:
+            The transformed PIL image (RGB)
+        """
+        for crop_box, matrix, output_size in self.resolve(img.size):
+            if crop_box != (0, 0) + img.size:
+                img = img.crop(crop_box)
+            # Convert only the kept region to RGB if necessary
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            img = _execute_affine(img, matrix, output_size, self.resampling, self.reducing_gap)
+        return img
+
+# Filter of the general affine transforms; PIL has no area or Lanczos kernel for those
+_AFFINE_FILTERS = {'nearest': Image.NEAREST, 'bilinear': Image.BILINEAR}
+
+def _execute_affine(img, matrix, output_size, resampling='lanczos', reducing_gap=None):
+    """Run one affine pass with a single resample, using the cheapest exact method."""
+    if matrix == IDENTITY and output_size == img.size:
+        return img
+    
+    a, b, c, d, e, f = matrix
+    if b == 0 and d == 0:
+        # Axis-aligned: mirror losslessly if needed, then one resize of a sub-box
+        width, height = img.size
+        if a < 0:
+            img = img.transpose(Image.FLIP_LEFT_RIGHT)
+            a, c = -a, width - c
+        if e < 0:
+            img = img.transpose(Image.FLIP_TOP_BOTTOM)
+            e, f = -e, height - f
+        box = (c, f, c + a * output_size[0], f + e * output_size[1])
+        if box[0] >= 0 and box[1] >= 0 and box[2] <= width and box[3] <= height:
+            if box == (0, 0, width, height) and output_size == img.size:
+                return img
+            return resize_image(img, output_size, resampling, box, reducing_gap)
+        matrix = (a, 0.0, c, 0.0, e, f)
+    
+    return img.transform(output_size, Image.AFFINE, matrix, _AFFINE_FILTERS.get(resampling, Image.BICUBIC))
+
+def region_plan(splits_config, rotation_angle=180, scaling_steps=(), resampling='lanczos', reducing_gap=None):
+    """
+    TransformPlan for one view of a tiled recording: keep a grid cell, rotate it and
+    apply a chain of crop-and-resize steps, like process_images followed by
+    crop_and_resize_images.
+    
+    Args:
+        splits_config: Grid cell, same configuration as process_images
+        rotation_angle: Rotation angle in degrees (default: 180)
+        scaling_steps: List of (scale_factor, position) crop-and-resize steps (default: none)
+        resampling, reducing_gap: see TransformPlan
+    """
+    plan = TransformPlan(resampling, reducing_gap).add_split(splits_config).add_rotation(rotation_angle)
+    for scale_factor, position in scaling_steps:
+        plan.add_crop_resize(scale_factor, position)
+    return plan
+
+def draft_for_plans(img, plans):
+    """
+    Put a freshly opened JPEG in draft mode at the smallest resolution that still serves
+    every plan, like TransformPlan.draft does for a single plan.
+    """
+    sizes = [plan.required_decode_size(img.size) for plan in plans]
+    required_size = (max(size[0] for size in sizes), max(size[1] for size in sizes))
+    if required_size != img.size:
+        img.draft('RGB', required_size)
+    return img
+
+def apply_transform_plan(input_dir, output_dir, plan, workers=1, draft=True, instrumentation=None, encoder=None,
+                         incremental=True):
+    """
+    Apply a TransformPlan to all images in a folder.
+    
+    Args:
+        input_dir: Input directory containing images
+        output_dir: Output directory for transformed images
+        plan: TransformPlan built with add_* or by passing plan= to
+              process_images / crop_and_resize_images
+        workers: Number of images processed concurrently in a thread pool (default: 1)
+        draft: Decode JPEGs at reduced resolution when the plan shrinks them (default: True)
+        instrumentation: frame_instrumentation.Instrumentation collecting decode, transform,
+                         encode and io timings plus bytes read and written (default: None)
+        encoder: frame_encoding.EncoderConfig, preset name or dict for the output images
+                 (default: None, format from the file name with library defaults)
+        incremental: see apply_transform_plans (default: True)
+    """
+    apply_transform_plans(input_dir, [output_dir], [plan], workers, draft, instrumentation, 'apply_transform_plan', encoder,
+                          incremental)
+
+def apply_transform_plans(input_dir, output_dirs, plans, workers=1, draft=True, instrumentation=None,
+                          stage='apply_transform_plans', encoder=None, incremental=True):
+    """
+    Apply several TransformPlans to all images in a folder, decoding every image once.
+    
+    This is the multi-region mode for tiled multi-camera recordings: build one plan per
+    view with region_plan and every view gets its own output folder, so N views cost one
+    decode per frame instead of N runs of the pipeline.
+    
+    Args:
+        input_dir: Input directory containing images
+        output_dirs: One output directory per plan
+        plans: List of TransformPlans
+        workers: Number of images processed concurrently in a thread pool (default: 1)
+        draft: Decode JPEGs at the reduced resolution that still serves every plan (default: True)
+        instrumentation: frame_instrumentation.Instrumentation collecting decode, transform,
+                         encode and io timings plus bytes read and written (default: None)
+        stage: Stage name the per-frame timings are recorded under
+        encoder: frame_encoding.EncoderConfig, preset name or dict for the output images
+                 (default: None, format from the file name with library defaults)
+        incremental: Skip images whose outputs are all up to date according to the
+                     frame_manifest.Manifest of every output directory; False reprocesses
+                     everything (default: True)
+    """
+    instrumentation = get_instrumentation(instrumentation)
+    encoder = get_encoder(encoder)
+    
+    if len(output_dirs) != len(plans):
+        logger.error(f"Error: Got {len(plans)} transform plans but {len(output_dirs)} output directories")
+        return
+    
+    # Create output directories if they don't exist
+    for output_dir in output_dirs:
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+    
+    # Get all image files (or stored frames) from input directory and sort them
+    store = open_frame_store(input_dir)
+    image_files = list_frames(input_dir, store=store)
+    if store is not None and any(os.path.abspath(output_dir) == os.path.abspath(input_dir) for output_dir in output_dirs):
+        logger.error(f"Error: Cannot write images into the frame store folder {input_dir} they are read from")
+        return
+    
+    if not image_files:
+        logger.warning(f"No image files found in {input_dir}")
+        return
+    
+    logger.info(f"Found {len(image_files)} image files")
+    for plan, output_dir in zip(plans, output_dirs):
+        logger.info(f"Applying {len(plan.steps)} transform steps in one pass into {output_dir}")
+    
+    manifests = [Manifest(output_dir) for output_dir in output_dirs]
+    # The steps of a plan are its parameters; the source fingerprint covers the frame size
+    plan_params = [Manifest.normalize(dict({'stage': 'apply_transform_plan', 'steps': plan.steps, 'draft': draft,
+                                            'encoder': encoder.to_dict()}, **plan.settings())) for plan in plans]
+    skipped = []
+    
+    def process_one(filename):
+        try:
+            input_path = os.path.join(input_dir, filename)
+            output_paths = [encoder.output_path(os.path.join(output_dir, filename)) for output_dir in output_dirs]
+            source_key = manifests[0].source_key(store, input_path)
+            if incremental and all(manifest.is_current(input_path, output_path, source_key, params)
+                                   for manifest, output_path, params in zip(manifests, output_paths, plan_params)):
+                skipped.append(filename)
+                return True, f"Up to date: {filename}"
+            
+            with instrumentation.frame(stage, filename) as frame_timer, \
+                    open_frame(store, input_path, frame_timer) as img:
+                if draft:
+                    draft_for_plans(img, plans)
+                with frame_timer.timer('decode'):
+                    img.load()
+                for plan, output_path, manifest, params in zip(plans, output_paths, manifests, plan_params):
+                    with frame_timer.timer('transform'):
+                        transformed_img = plan.apply(img)
+                    
+                    # Save transformed image
+                    save_image(transformed_img, output_path, frame_timer, encoder)
+                    manifest.record(input_path, output_path, source_key, params)
+                
+                return True, f"Processed: {filename}"
+        
+        except Exception as e:
+            return False, f"Error processing {filename}: {str(e)}"
+    
+    processed_count = 0
+    
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for ok, message in executor.map(process_one, image_files):
+            if ok:
+                processed_count += 1
+                logger.debug(message)
+            else:
+                logger.error(message)
+    for manifest in manifests:
+        manifest.close()
+    
+    logger.info(f"\nProcessing completed!")
+    logger.info(f"Successfully processed {processed_count} out of {len(image_files)} images")
+    if skipped:
+        logger.info(f"  {len(skipped)} of them were up to date and skipped")
+    logger.info(f"Output directories: {', '.join(output_dirs)}")
+
+def parse_step(step_str):
+    """Parse a step in the form 'split:h,hi,v,vi', 'rotate:angle', 'crop:scale,position' or 'resize:width,height'"""
+    try:
+        kind, _, value = step_str.partition(':')
+        parts = value.split(',')
+        if kind == 'split' and len(parts) == 4:
+            h, hi, v, vi = (int(x) for x in parts)
+            return ('split', ((h, hi), (v, vi)))
+        if kind == 'rotate' and len(parts) == 1:
+            return ('rotate', float(parts[0]))
+        if kind == 'crop' and len(parts) == 2:
+            return ('crop', (float(parts[0]), parts[1]))
+        if kind == 'resize' and len(parts) == 2:
+            return ('resize', (int(parts[0]), int(parts[1])))
+        raise ValueError(f"Unknown step '{step_str}'")
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"Invalid step: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Split, rotate and crop/resize images with a single resample per image')
+    parser.add_argument('input_dir', help='Input directory containing images')
+    parser.add_argument('-o', '--output', default='processed_images',
+                       help='Output directory (default: processed_images)')
+    parser.add_argument('steps', nargs='+', type=parse_step,
+                       help='Steps in order: "split:h,hi,v,vi" (1-based indices), "rotate:angle", "crop:scale,position", "resize:width,height"')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                       help='Number of images processed concurrently (default: 1)')
+    parser.add_argument('--no-draft', action='store_true',
+                       help='Always decode JPEGs at full resolution')
+    parser.add_argument('-f', '--force', action='store_true',
+                       help='Reprocess all images, also those that are up to date')
+    add_resampling_arguments(parser)
+    
+    add_encoder_arguments(parser)
+    add_logging_arguments(parser)
+    
+    args = parser.parse_args()
+    
+    setup_logging(args.log_level)
+    plan = TransformPlan(args.resampling, args.reducing_gap)
+    for kind, params in args.steps:
+        if kind == 'split':
+            plan.add_split(params)
+        elif kind == 'rotate':
+            plan.add_rotation(params)
+        elif kind == 'resize':
+            plan.add_resize(params)
+        else:
+            plan.add_crop_resize(*params)
+    
+    apply_transform_plan(args.input_dir, args.output, plan, args.workers, not args.no_draft, encoder=encoder_from_args(args),
+                         incremental=not args.force)
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,547 @@
+import os
+import time
+import logging
+import threading
 from frame_concat import *
 from frame_cutting import *
 from frame_dealing import *
 from frame_scaling import *
 from frame_selecting import *
+from frame_transform import *
+from frame_batch import batch_transform_images, transform_images
+from frame_buffer import Frame
+from frame_cache import StageCache, file_fingerprint, run_stages
+from frame_dedup import dedup_frames
+from frame_encoding import get_encoder
+from frame_index import get_frame_index
+from frame_pipeline import PipelineStage, run_pipeline
+from frame_store import list_frames, open_frame_store
+from frame_instrumentation import FrameTimer, Instrumentation, get_instrumentation, save_image, setup_logging
 
-def video2Image(video_path,original_frame_dir,selected_frame_dir,scaled_frame_dir,output_path,fps, total_frame_num,crop_info,rotation_angle,scaling_direction,scaling_factor):
-    video_to_frames(video_path=video_path, output_dir=original_frame_dir, fps=fps)
-    select_uniform_frames(original_frame_dir, selected_frame_dir, num_frames=total_frame_num)
-    process_images(selected_frame_dir, selected_frame_dir, splits_config=crop_info, rotation_angle=rotation_angle)
-    crop_and_resize_images(selected_frame_dir, scaled_frame_dir, scale_factor=scaling_factor, position=scaling_direction)
-    #if you want to repeat the crop and resize, change the scaling direction and scaling factor and reuse the line below.
-    # crop_and_resize_images(scaled_frame_dir, scaled_frame_dir, scale_factor=scaling_factor, position=scaling_direction)
-    crop_and_resize_images(scaled_frame_dir, scaled_frame_dir, scale_factor=0.93, position='center-center')
+logger = logging.getLogger(__name__)
 
+# crop_info keeping the whole frame, for frames already cut to their cell while decoding
+WHOLE_FRAME = ((1, 1), (1, 1))
 
-    create_collage(scaled_frame_dir, output_path, direction='horizontal') 
+def dump_frames(frames, output_dir, instrumentation=None, encoder=None, stage='dump_frames'):
+    """
+    Save (filename, image) pairs to output_dir for debugging the in-memory pipeline.
+    
+    Args:
+        frames: List of (filename, PIL image) pairs
+        output_dir: Folder to write them to
+        instrumentation: frame_instrumentation.Instrumentation collecting the encode and io
+                         timings of every frame (default: None)
+        encoder: frame_encoding.EncoderConfig, preset name or dict for the files
+                 (default: None, format from the file name with library defaults)
+        stage: Stage name the timings are recorded under
+    """
+    instrumentation = get_instrumentation(instrumentation)
+    encoder = get_encoder(encoder)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    for filename, img in frames:
+        with instrumentation.frame(stage, filename) as frame_timer:
+            save_image(img, encoder.output_path(os.path.join(output_dir, filename)), frame_timer, encoder)
+
+def get_collage_options(collage_options=None):
+    """Merge user collage options over the default horizontal strip."""
+    options = {'direction': 'horizontal'}
+    options.update(collage_options or {})
+    return options
+
+def get_roi(video_path, crop_info):
+    """
+    Pixel box of the crop_info cell in the frames of a video, so frames can be cut to it
+    while they are decoded (see frame_cutting.video_to_frames); None if the video cannot
+    be read or crop_info is invalid.
+    """
+    splits = unpack_splits_config(crop_info)
+    size = get_video_size(video_path)
+    if splits is None or size is None:
+        return None
+    return get_split_box(size, splits)
+
+def add_collage_resize(plan, source_size, count, collage_options=None):
+    """
+    Fold the collage downscale into a TransformPlan, so frames are resampled once straight
+    to their tile size and JPEG inputs can be decoded in draft mode.
+    
+    Args:
+        plan: TransformPlan with the split/rotation/scaling steps
+        source_size: (width, height) of the source frames
+        count: Number of frames in the collage
+        collage_options: Collage options as given to video2Image
+    """
+    passes = plan.resolve(source_size)
+    natural_size = passes[-1][2] if passes else source_size
+    layout_options = {k: v for k, v in get_collage_options(collage_options).items() if k != 'background'}
+    _, slots = compute_layout([natural_size] * count, **layout_options)
+    tile_size = tuple(slots[0][2:])
+    if tile_size != natural_size:
+        plan.add_resize(tile_size)
+    return plan
+
+def video2Image_in_memory(video_path,output_path,fps, total_frame_num,crop_info,rotation_angle,scaling_steps,
+                          selected_frame_dir=None,scaled_frame_dir=None,seek_threshold=None,fused=False,collage_options=None,
+                          cache_dir=None,cache_max_bytes=2 * 1024 ** 3,instrumentation=None,selection='uniform',
+                          regions=None,output_encoder=None,engine='pil',resampling='lanczos',
+                          start_time=None,end_time=None,roi=None,encoder=None):
+    """
+    Same pipeline as video2Image, but frames stay in memory as PIL images from decode to collage.
+    Only the final collage is written; the frame directories are optional debug dumps.
+    
+    Args:
+        scaling_steps: List of (scale_factor, position) crop-and-resize steps, applied in order
+        selected_frame_dir: If given, dump the split/rotated frames here
+        scaled_frame_dir: If given, dump the final scaled frames here
+        seek_threshold: see frame_cutting.read_frames_at
+        fused: Fold split, rotation and all scaling steps into one TransformPlan so each frame
+               is resampled once (selected_frame_dir is not dumped in this mode)
+        collage_options: Extra keyword arguments for build_collage (grid, padding, target size)
+        cache_dir: If given, cache the result of every stage here (see frame_cache), so a rerun
+                   only recomputes the stages from the first changed parameter onwards
+                   (selected_frame_dir is only dumped when the split stage actually runs)
+        cache_max_bytes: Size limit of the cache directory (default: 2 GB)
+        instrumentation: frame_instrumentation.Instrumentation timing every stage and frame
+        selection: 'uniform', or a motion-aware method of frame_selecting.motion_indices
+        regions: List of (crop_info, rotation_angle, scaling_steps) views; every view is cut
+                 from the same decoded frames and saved as its own collage (see
+                 get_region_paths), scaled_frame_dir is dumped per view
+        output_encoder: frame_encoding.EncoderConfig, preset name or dict for the collage
+        engine: 'pil' transforms frame by frame, 'numpy' runs the split and scaling stages on
+                whole frame stacks (see frame_batch); the fused and multi-region plans always use PIL
+        resampling: Kernel of every crop-and-resize, 'nearest', 'bilinear', 'area' or 'lanczos'
+                    (see frame_scaling.resize_image)
+        start_time, end_time: Only decode the frames between these times in seconds
+        roi: (left, top, right, bottom) box frames are cut to while decoding (see get_roi);
+             crop_info then applies to the cut frames
+        encoder: frame_encoding.EncoderConfig, preset name or dict for the debug dumps
+    """
+    instrumentation = get_instrumentation(instrumentation)
+    # Multi-region mode takes its grid cells from regions instead of crop_info
+    splits = unpack_splits_config(crop_info) if not regions else None
+    if splits is None and not regions:
+        return
+    
+    cache = StageCache(cache_dir, cache_max_bytes) if cache_dir else None
+    output_encoder = get_encoder(output_encoder)
+    
+    def transform_frames(stage, frames, func):
+        # Apply func to every (name, image) pair, timing each frame as a transform
+        results = []
+        with instrumentation.stage(stage):
+            for name, img in frames:
+                with instrumentation.frame(stage, name) as frame_timer, frame_timer.timer('transform'):
+                    results.append((name, func(img)))
+        return results
+    
+    def extract(_):
+        with instrumentation.stage('video_to_frame_list'):
+            samples = video_to_frame_list(video_path, fps=fps, num_frames=total_frame_num, seek_threshold=seek_threshold,
+                                          instrumentation=instrumentation, selection=selection, start_time=start_time,
+                                          end_time=end_time, roi=roi)
+        # Name frames the same way select_uniform_frames does, so dumps match the on-disk pipeline
+        return [(f"frame_{i+1:03d}_frame_{sample_index:06d}.jpg", img) for i, (sample_index, img) in enumerate(samples)]
+    
+    def transform(frames):
+        plan = TransformPlan(resampling).add_split(crop_info).add_rotation(rotation_angle)
+        for scale_factor, position in scaling_steps:
+            plan.add_crop_resize(scale_factor, position)
+        add_collage_resize(plan, frames[0][1].size, len(frames), collage_options)
+        return transform_frames('TransformPlan.apply', frames, plan.apply)
+    
+    def transform_stack(stage, frames, plan):
+        # Transform all frames at once with the batch engine, timed as one transform
+        with instrumentation.stage(stage), instrumentation.timer(stage, 'transform'):
+            images = transform_images([img for _, img in frames], plan)
+        return [(name, img) for (name, _), img in zip(frames, images)]
+    
+    def split(frames):
+        if engine == 'numpy':
+            frames = transform_stack('split_stack', frames, TransformPlan().add_split(crop_info).add_rotation(rotation_angle))
+        else:
+            frames = transform_frames('split_and_rotate_image', frames,
+                                      lambda img: split_and_rotate_image(img, splits, rotation_angle))
+        if selected_frame_dir:
+            dump_frames(frames, selected_frame_dir, instrumentation, encoder)
+        return frames
+    
+    def scale(frames):
+        if engine == 'numpy':
+            plan = TransformPlan(resampling)
+            for scale_factor, position in scaling_steps:
+                plan.add_crop_resize(scale_factor, position)
+            return transform_stack('crop_resize_stack', frames, plan) if plan.steps else frames
+        for scale_factor, position in scaling_steps:
+            frames = transform_frames('crop_and_resize_image', frames,
+                                      lambda img: crop_and_resize_image(img, scale_factor, position, resampling))
+        return frames
+    
+    # Each stage is keyed on its own parameters plus everything upstream of it
+    extract_params = {'fps': fps, 'total_frame_num': total_frame_num}
+    if selection != 'uniform':
+        # Only add the key when needed, so existing cache entries stay valid
+        extract_params['selection'] = selection
+    for key, value in (('start_time', start_time), ('end_time', end_time), ('roi', roi)):
+        if value is not None:
+            extract_params[key] = value
+    stages = [('extract', extract_params, extract)]
+    if fused:
+        transform_params = {'crop_info': crop_info, 'rotation_angle': rotation_angle,
+                            'scaling_steps': scaling_steps, 'collage_options': collage_options}
+        if resampling != 'lanczos':
+            transform_params['resampling'] = resampling
+        stages.append(('transform', transform_params, transform))
+    else:
+        split_params = {'crop_info': crop_info, 'rotation_angle': rotation_angle}
+        scale_params = {'scaling_steps': scaling_steps}
+        if engine != 'pil':
+            # The engines resample differently; only add the key when needed, as for selection
+            split_params['engine'] = scale_params['engine'] = engine
+        if resampling != 'lanczos':
+            scale_params['resampling'] = resampling
+        stages.append(('split', split_params, split))
+        stages.append(('scale', scale_params, scale))
+    
+    video_key = file_fingerprint(video_path) if cache is not None else None
+    if regions:
+        # Only the decode is shared (and cached); each view runs its own single-resample plan
+        frames = run_stages(stages[:1], video_key, cache)
+        if not frames:
+            logger.warning("No frames extracted, nothing to do")
+            return
+        for region, (frame_dir, region_output_path) in zip(regions, get_region_paths(scaled_frame_dir, output_path, len(regions))):
+            plan = add_collage_resize(region_plan(*region, resampling=resampling), frames[0][1].size, len(frames), collage_options)
+            region_frames = transform_frames('TransformPlan.apply', frames, plan.apply)
+            if frame_dir:
+                dump_frames(region_frames, frame_dir, instrumentation, encoder)
+            with instrumentation.stage('build_collage'):
+                with instrumentation.timer('build_collage', 'transform'):
+                    collage = build_collage([img for _, img in region_frames], **get_collage_options(collage_options))
+                region_output_path = output_encoder.output_path(region_output_path)
+                save_image(collage, region_output_path, FrameTimer(instrumentation, 'build_collage', region_output_path), output_encoder)
+            logger.info(f"Collage saved to: {region_output_path}")
+        return
+    frames = run_stages(stages, video_key, cache)
+    if not frames:
+        logger.warning("No frames extracted, nothing to do")
+        return
+    if scaled_frame_dir:
+        dump_frames(frames, scaled_frame_dir, instrumentation, encoder)
+    
+    with instrumentation.stage('build_collage'):
+        with instrumentation.timer('build_collage', 'transform'):
+            collage = build_collage([img for _, img in frames], **get_collage_options(collage_options))
+        output_path = output_encoder.output_path(output_path)
+        save_image(collage, output_path, FrameTimer(instrumentation, 'build_collage', output_path), output_encoder)
+    logger.info(f"Collage saved to: {output_path}")
+
+def video2Image_pipelined(video_path,output_path,fps, total_frame_num,crop_info,rotation_angle,scaling_steps,
+                          selected_frame_dir=None,scaled_frame_dir=None,seek_threshold=None,collage_options=None,
+                          instrumentation=None,selection='uniform',workers=1,stage_workers=None,queue_size=None,
+                          output_encoder=None,resampling='lanczos',start_time=None,end_time=None,roi=None,
+                          encoder=None):
+    """
+    Same result as video2Image_in_memory, but the stages run at the same time on a
+    frame_pipeline pipeline instead of one after another: while one frame is decoded, the
+    previous ones are split and rotated, cropped and resized and fitted to their collage
+    tile, each stage on its own threads with bounded queues in between. Frame selection
+    happens before decoding (only the kept frames are decoded), as in sparse mode.
+    
+    Args:
+        scaling_steps: List of (scale_factor, position) crop-and-resize steps, applied in order
+        selected_frame_dir: If given, the split/rotated frames are also written here
+        scaled_frame_dir: If given, the final scaled frames are also written here
+        seek_threshold: see frame_cutting.read_frames_at
+        collage_options: Extra keyword arguments for build_collage (grid, padding, target size)
+        instrumentation: frame_instrumentation.Instrumentation timing every stage and frame,
+                         plus queue_wait and blocked times per stage (see run_pipeline)
+        selection: 'uniform', or a motion-aware method of frame_selecting.motion_indices
+        workers: Number of threads of every transform stage (default: 1)
+        stage_workers: Dict overriding workers per stage: 'split_and_rotate_image',
+                       'crop_and_resize_image' or 'collage_tile' (default: None)
+        queue_size: Maximum number of frames queued in front of every stage (default: 2 * its workers)
+        output_encoder: frame_encoding.EncoderConfig, preset name or dict for the collage
+        resampling: Kernel of every crop-and-resize, see frame_scaling.resize_image
+        start_time, end_time, roi: Time window and decode crop box, see video2Image_in_memory
+        encoder: frame_encoding.EncoderConfig, preset name or dict for the frames written to
+                 selected_frame_dir and scaled_frame_dir
+    """
+    instrumentation = get_instrumentation(instrumentation)
+    splits = unpack_splits_config(crop_info)
+    if splits is None:
+        return
+    output_encoder = get_encoder(output_encoder)
+    encoder = get_encoder(encoder)
+    stage_workers = dict(stage_workers or {})
+    collage = get_collage_options(collage_options)
+    layout_options = {k: v for k, v in collage.items() if k != 'background'}
+    tile_size = []
+    tile_lock = threading.Lock()
+    
+    def decode():
+        decode_start = time.perf_counter()
+        for i, (sample_index, frame) in enumerate(iter_video_frames(video_path, fps, total_frame_num, seek_threshold,
+                                                                    selection, instrumentation, 'decode',
+                                                                    start_time, end_time, roi)):
+            # Name frames the same way select_uniform_frames does, so dumps match the on-disk pipeline
+            name = f"frame_{i+1:03d}_frame_{sample_index:06d}.jpg"
+            with instrumentation.frame('decode', name) as frame_timer:
+                frame_timer.add('decode', time.perf_counter() - decode_start)
+            yield name, frame
+            decode_start = time.perf_counter()
+    
+    def split(item):
+        name, frame = item
+        with instrumentation.frame('split_and_rotate_image', name) as frame_timer:
+            with frame_timer.timer('transform'):
+                img = split_and_rotate_image(Frame(frame, 'BGR').image(), splits, rotation_angle)
+            if selected_frame_dir:
+                save_image(img, encoder.output_path(os.path.join(selected_frame_dir, name)), frame_timer, encoder)
+        return name, img
+    
+    def scale(item):
+        name, img = item
+        with instrumentation.frame('crop_and_resize_image', name) as frame_timer:
+            with frame_timer.timer('transform'):
+                for scale_factor, position in scaling_steps:
+                    img = crop_and_resize_image(img, scale_factor, position, resampling)
+            if scaled_frame_dir:
+                save_image(img, encoder.output_path(os.path.join(scaled_frame_dir, name)), frame_timer, encoder)
+        return name, img
+    
+    def tile(item):
+        name, img = item
+        with tile_lock:
+            if not tile_size:
+                # Slot size for total_frame_num frames of this size; build_collage refits if fewer arrive
+                _, slots = compute_layout([img.size] * max(1, total_frame_num), **layout_options)
+                tile_size.append(tuple(slots[0][2:]))
+        with instrumentation.frame('collage_tile', name) as frame_timer, frame_timer.timer('transform'):
+            return fit_tile(img, tile_size[0])
+    
+    for frame_dir in (selected_frame_dir, scaled_frame_dir, os.path.dirname(output_path)):
+        if frame_dir and not os.path.exists(frame_dir):
+            os.makedirs(frame_dir)
+    stages = [PipelineStage('split_and_rotate_image', split, stage_workers.get('split_and_rotate_image', workers), queue_size)]
+    if scaling_steps:
+        stages.append(PipelineStage('crop_and_resize_image', scale, stage_workers.get('crop_and_resize_image', workers),
+                                    queue_size))
+    stages.append(PipelineStage('collage_tile', tile, stage_workers.get('collage_tile', workers), queue_size))
+    
+    with instrumentation.stage('pipeline'):
+        tiles = run_pipeline(decode(), stages, instrumentation, 'decode')
+    if not tiles:
+        logger.warning("No frames extracted, nothing to do")
+        return
+    
+    with instrumentation.stage('build_collage'):
+        with instrumentation.timer('build_collage', 'transform'):
+            collage_img = build_collage(tiles, **collage)
+        output_path = output_encoder.output_path(output_path)
+        save_image(collage_img, output_path, FrameTimer(instrumentation, 'build_collage', output_path), output_encoder)
+    logger.info(f"Collage saved to: {output_path}")
+
+def video2Image(video_path,original_frame_dir,selected_frame_dir,scaled_frame_dir,output_path,fps, total_frame_num,crop_info,rotation_angle,scaling_direction,scaling_factor,
+                in_memory=False,debug_dump=False,sparse=False,seek_threshold=None,scaling_steps=None,workers=1,fused=False,collage_options=None,
+                cache_dir=None,report_path=None,instrumentation=None,selection='uniform',dedup_threshold=None,
+                store=False,regions=None,encoder=None,output_encoder=None,engine='pil',resampling='lanczos',
+                pipelined=False,stage_workers=None,start_time=None,end_time=None,roi=False):
+    # collage_options are passed on to create_collage, e.g. {'rows': 2, 'cols': 4, 'max_dimension': 4000}
+    # report_path writes a JSON (.json) or CSV run report with per-stage and per-frame timings;
+    # pass an Instrumentation to add hooks or to read the report yourself.
+    # selection='segments' or 'coverage' picks the frames by motion instead of evenly in time.
+    # dedup_threshold drops near-duplicate extracted frames (dHash bits) before selection; it
+    # only applies to the full on-disk extraction, the other modes never decode the pauses.
+    # store=True keeps the extracted and selected frames in memory-mapped frame stores instead
+    # of JPEG files, so they are never re-encoded before the split step.
+    # regions is a list of (crop_info, rotation_angle, scaling_steps) views of a tiled recording;
+    # every frame is decoded once and each view gets its own collage (see get_region_paths),
+    # instead of crop_info/rotation_angle/scaling_steps.
+    # encoder sets the format and quality of the intermediate frames (e.g. 'lossless' for fast PNGs
+    # without generation loss) and output_encoder that of the collage, see frame_encoding; a
+    # configured format replaces the file extensions. workers also encodes extracted frames in
+    # the background while the video is decoded.
+    # engine='numpy' runs the split, rotation and scaling chain on stacks of frames with NumPy
+    # views and batched resizes instead of per-image PIL calls (see frame_batch); it replaces
+    # the separate process_images/crop_and_resize_images passes, not the fused or region plans.
+    # resampling picks the kernel of the crop-and-resize steps, including the 0.93 border trim:
+    # 'nearest', 'bilinear' and 'area' are faster than the default 'lanczos' at some loss of
+    # sharpness (frame_benchmark --resampling compares them).
+    # pipelined=True runs decode, split/rotate, crop/resize and the collage tiles at the same
+    # time with bounded queues in between (see video2Image_pipelined); stage_workers sets the
+    # threads per stage, workers the default. Regions and the stage cache keep their own paths.
+    # start_time/end_time (seconds) only extract that window of the video, seeking straight to it.
+    # roi=True cuts the crop_info cell out of every frame while decoding, so the extracted frames
+    # are a fraction of the size to encode and read back; it does not apply to regions.
+    if instrumentation is None and report_path:
+        instrumentation = Instrumentation()
+    instrumentation = get_instrumentation(instrumentation)
+    # By default crop to the requested position, then trim the border with a 0.93 center crop.
+    # Pass scaling_steps as a list of (scale_factor, position) to use a different chain.
+    if scaling_steps is None:
+        scaling_steps = [(scaling_factor, scaling_direction), (0.93, 'center-center')]
+    roi_box = None
+    if roi and not regions:
+        # The split step then keeps the whole (already cut) frame and only rotates it
+        roi_box = get_roi(video_path, crop_info)
+        if roi_box is not None:
+            crop_info = WHOLE_FRAME
+    if pipelined and not regions and not cache_dir:
+        video2Image_pipelined(video_path, output_path, fps, total_frame_num, crop_info, rotation_angle, scaling_steps,
+                              selected_frame_dir=selected_frame_dir if debug_dump else None,
+                              scaled_frame_dir=scaled_frame_dir if debug_dump else None,
+                              seek_threshold=seek_threshold, collage_options=collage_options,
+                              instrumentation=instrumentation, selection=selection, workers=workers,
+                              stage_workers=stage_workers, output_encoder=output_encoder, resampling=resampling,
+                              start_time=start_time, end_time=end_time, roi=roi_box, encoder=encoder)
+        write_run_report(instrumentation, report_path)
+        return
+    # cache_dir enables the stage cache, which works on the in-memory pipeline
+    if in_memory or cache_dir:
+        # Skip the intermediate JPEG round-trips; the frame directories are only written when debugging
+        video2Image_in_memory(video_path, output_path, fps, total_frame_num, crop_info, rotation_angle,
+                              scaling_steps,
+                              selected_frame_dir=selected_frame_dir if debug_dump else None,
+                              scaled_frame_dir=scaled_frame_dir if debug_dump else None,
+                              seek_threshold=seek_threshold, fused=fused, collage_options=collage_options,
+                              cache_dir=cache_dir, instrumentation=instrumentation, selection=selection,
+                              regions=regions, output_encoder=output_encoder, engine=engine, resampling=resampling,
+                              start_time=start_time, end_time=end_time, roi=roi_box, encoder=encoder)
+        write_run_report(instrumentation, report_path)
+        return
+    with instrumentation.stage('video_to_frames'):
+        if sparse:
+            # Only decode the total_frame_num frames that select_uniform_frames would keep
+            video_to_frames(video_path=video_path, output_dir=original_frame_dir, fps=fps,
+                            num_frames=total_frame_num, seek_threshold=seek_threshold, instrumentation=instrumentation,
+                            selection=selection, store=store, encoder=encoder, encode_workers=workers if workers > 1 else 0,
+                            start_time=start_time, end_time=end_time, roi=roi_box)
+        else:
+            video_to_frames(video_path=video_path, output_dir=original_frame_dir, fps=fps, instrumentation=instrumentation,
+                            selection=selection, store=store, encoder=encoder, encode_workers=workers if workers > 1 else 0,
+                            start_time=start_time, end_time=end_time, roi=roi_box)
+    if dedup_threshold is not None and not sparse:
+        with instrumentation.stage('dedup_frames'):
+            dedup_frames(original_frame_dir, threshold=dedup_threshold, instrumentation=instrumentation)
+    with instrumentation.stage('select_frames'):
+        # Sparse extraction already applied the selection method
+        select_frames(original_frame_dir, selected_frame_dir, num_frames=total_frame_num,
+                      method='uniform' if sparse else selection, instrumentation=instrumentation)
+    if regions:
+        # One plan per view, all applied to each frame after a single decode
+        region_paths = get_region_paths(scaled_frame_dir, output_path, len(regions))
+        frame_count, frame_size = get_frame_info(selected_frame_dir)
+        plans = [region_plan(*region, resampling=resampling) for region in regions]
+        if frame_size is not None:
+            for plan in plans:
+                add_collage_resize(plan, frame_size, frame_count, collage_options)
+        with instrumentation.stage('apply_transform_plans'):
+            apply_transform_plans(selected_frame_dir, [frame_dir for frame_dir, _ in region_paths], plans, workers=workers,
+                                  instrumentation=instrumentation, encoder=encoder)
+        with instrumentation.stage('create_collage'):
+            for frame_dir, region_output_path in region_paths:
+                create_collage(frame_dir, region_output_path, **get_collage_options(collage_options), instrumentation=instrumentation,
+                               encoder=output_encoder)
+        write_run_report(instrumentation, report_path)
+        return
+    if fused:
+        # Collect split, rotation and the scaling chain into one plan and resample each frame once
+        plan = TransformPlan(resampling)
+        if process_images(selected_frame_dir, selected_frame_dir, splits_config=crop_info, rotation_angle=rotation_angle, plan=plan) is None:
+            return
+        for scale_factor, position in scaling_steps:
+            crop_and_resize_images(selected_frame_dir, scaled_frame_dir, scale_factor=scale_factor, position=position, plan=plan)
+        frame_count, frame_size = get_frame_info(selected_frame_dir)
+        if frame_size is not None:
+            add_collage_resize(plan, frame_size, frame_count, collage_options)
+        with instrumentation.stage('apply_transform_plan'):
+            apply_transform_plan(selected_frame_dir, scaled_frame_dir, plan, workers=workers, instrumentation=instrumentation,
+                                 encoder=encoder)
+    elif engine == 'numpy':
+        # Split, rotate and scale whole batches of frames straight into the scaled folder
+        plan = region_plan(crop_info, rotation_angle, scaling_steps, resampling)
+        with instrumentation.stage('batch_transform_images'):
+            batch_transform_images(selected_frame_dir, scaled_frame_dir, plan, workers=workers, instrumentation=instrumentation,
+                                   encoder=encoder)
+    else:
+        # A frame store cannot be reworked in place, so the split frames go to the scaled folder
+        split_frame_dir = scaled_frame_dir if store else selected_frame_dir
+        # The stage writing the scaled frames only counts as up to date if the steps reworking
+        # them in place afterwards are unchanged too
+        step_params = [crop_and_resize_params(scale_factor, position, encoder, resampling)
+                       for scale_factor, position in scaling_steps]
+        with instrumentation.stage('process_images'):
+            process_images(selected_frame_dir, split_frame_dir, splits_config=crop_info, rotation_angle=rotation_angle, workers=workers,
+                           instrumentation=instrumentation, encoder=encoder, later_params=step_params if store else None)
+        for step, (scale_factor, position) in enumerate(scaling_steps):
+            # The first step reads the split frames, later steps rework the scaled frames in place;
+            # the chain position keeps a repeated identical step from counting as already applied
+            input_dir = split_frame_dir if step == 0 else scaled_frame_dir
+            with instrumentation.stage('crop_and_resize_images'):
+                crop_and_resize_images(input_dir, scaled_frame_dir, scale_factor=scale_factor, position=position, workers=workers,
+                                       instrumentation=instrumentation, encoder=encoder, resampling=resampling,
+                                       chain_position=step + 1, later_params=step_params[step + 1:])
+    
+    
+    with instrumentation.stage('create_collage'):
+        create_collage(scaled_frame_dir, output_path, **get_collage_options(collage_options), instrumentation=instrumentation,
+                       encoder=output_encoder)
+    write_run_report(instrumentation, report_path)
+
+def write_run_report(instrumentation, report_path):
+    """Write the run report of video2Image if a report path was given."""
+    if not report_path:
+        return
+    instrumentation.write_report(report_path)
+    logger.info(f"Run report saved to: {report_path}")
+
+def get_output_paths(video_path):
+    """
+    Derive the working directories and collage path for a video, next to the video itself.
+    
+    Returns:
+        (original_frame_dir, selected_frame_dir, scaled_frame_dir, output_path)
+    """
+    base = os.path.splitext(video_path)[0]
+    return (base+"/original_frame_dir/",
+            base+"/selected_frame_dir/",
+            base+"/scaled_frame_dir/",
+            base+".jpg")
+
+def get_region_paths(scaled_frame_dir, output_path, count):
+    """
+    Frame folder and collage path of every view in multi-region mode, next to the
+    single-view ones: scaled_frame_dir_region1/, ..., output_region1.jpg, ...
+    
+    Returns:
+        List of (frame_dir, collage_path) tuples; frame_dir is None if scaled_frame_dir is
+    """
+    base, ext = os.path.splitext(output_path)
+    return [(os.path.normpath(scaled_frame_dir) + f"_region{i+1}/" if scaled_frame_dir else None,
+             f"{base}_region{i+1}{ext}")
+            for i in range(count)]
+
+def get_frame_info(frame_dir):
+    """
+    Number of frames in a folder or frame store and the (width, height) of the first one,
+    which add_collage_resize needs; the size is None if the folder is empty.
+    """
+    store = open_frame_store(frame_dir)
+    frame_files = list_frames(frame_dir, store=store)
+    if not frame_files:
+        return 0, None
+    if store is not None:
+        height, width = store.entry(frame_files[0])['shape'][:2]
+        return len(frame_files), (width, height)
+    return len(frame_files), get_frame_index(frame_dir).size(frame_files[0])
 
 if __name__ == "__main__":
+    setup_logging()
     fps=1
     video_path="C:/Users/pengqh/Downloads/task2.mov"
-    last_str='.mov'
-    original_frame_dir=video_path.replace(last_str,'')+"/original_frame_dir/"
-    selected_frame_dir=video_path.replace(last_str,'')+"/selected_frame_dir/"
-    scaled_frame_dir=video_path.replace(last_str,'')+"/scaled_frame_dir/"
-    output_path=video_path.replace(last_str,".jpg")
+    original_frame_dir,selected_frame_dir,scaled_frame_dir,output_path=get_output_paths(video_path)
     crop_info=((3,3),(2,1))
     rotation_angle=0
     scaling_factor=0.95
@@ -32,7 +550,7 @@ if __name__ == "__main__":
     # scaling_direction="top-right"
     # scaling_direction='center-center'
     scaling_direction='top-left'
-
+    
     total_frame_num=8
     video2Image(video_path,original_frame_dir,selected_frame_dir,scaled_frame_dir,output_path,fps, total_frame_num,crop_info,rotation_angle,scaling_direction,scaling_factor)
 
@@ -0,0 +1,35 @@
+import sys
+import glob
+import os
+from PIL import Image
+from frame_benchmark import make_synthetic_video
+import frame_dealing
+
+def run_cli(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['frame_dealing.py', *args])
+    frame_dealing.main()
+
+def test_video_input_with_splits(tmp_path, monkeypatch):
+    video_path = make_synthetic_video(str(tmp_path / 'clip.mp4'), 240, 120, 10, 1)
+    output_dir = str(tmp_path / 'out')
+    # 3 columns and 2 rows, keep the middle-top part
+    run_cli(monkeypatch, video_path, '-o', output_dir, '-s', '3,2,1,0', '-r', '0', '--fps', '5')
+    
+    frames = sorted(glob.glob(os.path.join(output_dir, '**', '*.jpg'), recursive=True))
+    assert len(frames) == 5
+    with Image.open(frames[0]) as img:
+        assert img.size == (80, 60)
+
+def test_image_folder_with_default_splits(tmp_path, monkeypatch):
+    video_path = make_synthetic_video(str(tmp_path / 'clip.mp4'), 240, 120, 10, 1)
+    frames_dir = str(tmp_path / 'frames')
+    run_cli(monkeypatch, video_path, '-o', frames_dir, '-s', '1,1,0,0', '-r', '0', '--fps', '2')
+    input_dir = os.path.dirname(glob.glob(os.path.join(frames_dir, '**', '*.jpg'), recursive=True)[0])
+    output_dir = str(tmp_path / 'out')
+    # Default: 2x2 grid, keep the bottom-right part
+    run_cli(monkeypatch, input_dir, '-o', output_dir)
+    
+    frames = sorted(glob.glob(os.path.join(output_dir, '*.jpg')))
+    assert len(frames) == 2
+    with Image.open(frames[0]) as img:
+        assert img.size == (120, 60)
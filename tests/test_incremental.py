@@ -0,0 +1,48 @@
+import os
+import logging
+from frame_benchmark import make_synthetic_video
+from main import video2Image
+
+def frame_mtimes(frame_dir):
+    return {name: os.stat(os.path.join(frame_dir, name)).st_mtime_ns
+            for name in os.listdir(frame_dir) if name.endswith('.jpg')}
+
+def test_second_run_skips_unchanged_frames(tmp_path, caplog):
+    video_path = make_synthetic_video(str(tmp_path / 'clip.mp4'), 320, 180, 30, 4)
+    dirs = [str(tmp_path / name) + '/' for name in ('original', 'selected', 'scaled')]
+    output_path = str(tmp_path / 'collage.jpg')
+    
+    def run():
+        caplog.clear()
+        with caplog.at_level(logging.INFO):
+            video2Image(video_path, *dirs, output_path, 2, 6, ((3, 3), (2, 1)), 0, 'top-left', 0.95)
+        with open(output_path, 'rb') as f:
+            return f.read()
+    
+    first_collage = run()
+    selected, scaled = frame_mtimes(dirs[1]), frame_mtimes(dirs[2])
+    assert len(selected) == 6 and len(scaled) == 6
+    
+    second_collage = run()
+    # The selected copies are kept and process_images plus both crop-and-resize steps skip every frame
+    assert "  6 of them were up to date and kept" in caplog.messages
+    assert caplog.messages.count("  6 of them were up to date and skipped") == 3
+    assert frame_mtimes(dirs[1]) == selected
+    assert frame_mtimes(dirs[2]) == scaled
+    assert second_collage == first_collage
+
+def test_changed_later_step_rebuilds_chain(tmp_path):
+    video_path = make_synthetic_video(str(tmp_path / 'clip.mp4'), 320, 180, 30, 4)
+    
+    def run(folder, scaling_steps):
+        dirs = [str(tmp_path / folder / name) + '/' for name in ('original', 'selected', 'scaled')]
+        output_path = str(tmp_path / folder / 'collage.jpg')
+        video2Image(video_path, *dirs, output_path, 2, 6, ((3, 3), (2, 1)), 0, 'top-left', 0.95,
+                    scaling_steps=scaling_steps)
+        with open(output_path, 'rb') as f:
+            return f.read()
+    
+    run('rerun', [(0.95, 'top-left'), (0.93, 'center-center')])
+    # Skipping the first step here would apply the new second step on top of the old one
+    changed = [(0.95, 'top-left'), (0.9, 'center-center')]
+    assert run('rerun', changed) == run('fresh', changed)